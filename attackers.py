@@ -0,0 +1,89 @@
+# 攻击者列表的绘制规划：预先算出画得下的行数，其余攻击者汇总显示
+
+ATTACKER_ROW_HEIGHT = 90     # 单个攻击者行高 (头像80 + 间距10)
+ATTACKER_LABEL_HEIGHT = 30   # "最后一击"/"最高伤害" 标题行高
+SEPARATOR_HEIGHT = 15        # 分隔线及间距
+SUMMARY_HEADER_HEIGHT = 30   # 汇总区标题行高
+SUMMARY_ROW_HEIGHT = 20      # 汇总区每组行高
+SUMMARY_MAX_ROWS = 12        # 汇总区最多显示的分组数
+
+
+class AttackerGroup:
+    """未单独绘制的攻击者，按 (联盟或公司或势力, 舰船) 合并计数"""
+    __slots__ = ('entity_id', 'ship_type_id', 'count', 'damage')
+
+    def __init__(self, entity_id, ship_type_id):
+        self.entity_id = entity_id
+        self.ship_type_id = ship_type_id
+        self.count = 0
+        self.damage = 0
+
+
+class AttackerPlan:
+    """
+    一次击杀的攻击者绘制计划：
+      final_blow / max_damage: 顶部单独展示的两个攻击者
+      rows: 按伤害排序、画得下的攻击者
+      groups: 其余攻击者的汇总分组 (最多 SUMMARY_MAX_ROWS 组)，hidden_groups 为未显示的组数
+    """
+    __slots__ = ('final_blow', 'max_damage', 'rows', 'rest', 'groups', 'hidden_groups')
+
+    def __init__(self, final_blow, max_damage, rows, rest, groups, hidden_groups):
+        self.final_blow = final_blow
+        self.max_damage = max_damage
+        self.rows = rows
+        self.rest = rest
+        self.groups = groups
+        self.hidden_groups = hidden_groups
+
+    def detailed(self):
+        """需要获取头像、名称等完整信息的攻击者"""
+        return [a for a in (self.final_blow, self.max_damage) if a is not None] + self.rows
+
+    def summary_ids(self):
+        """汇总区需要解析名称的ID"""
+        ids = set()
+        for group in self.groups:
+            ids.update(i for i in (group.entity_id, group.ship_type_id) if i)
+        return ids
+
+
+def group_attackers(attackers):
+    groups = {}
+    for attacker in attackers:
+        entity_id = attacker.alliance_id or attacker.corporation_id or attacker.faction_id
+        key = (entity_id, attacker.ship_type_id)
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = AttackerGroup(*key)
+        group.count += 1
+        group.damage += attacker.damage_done
+    return sorted(groups.values(), key=lambda g: (g.count, g.damage), reverse=True)
+
+
+def summary_height(group_rows):
+    return SUMMARY_HEADER_HEIGHT + group_rows * SUMMARY_ROW_HEIGHT
+
+
+def plan_attackers(attackers, top, bottom, max_summary_rows=SUMMARY_MAX_ROWS):
+    """根据可用高度 (top 到 bottom) 规划攻击者的绘制，单次击杀的绘制成本与攻击者总数无关"""
+    final_blow = next((a for a in attackers if a.final_blow is True), None)
+    max_damage = max(attackers, key=lambda a: a.damage_done) if attackers else None
+
+    y = top
+    if final_blow is not None:
+        y += ATTACKER_LABEL_HEIGHT + ATTACKER_ROW_HEIGHT
+    if max_damage is not None:
+        y += ATTACKER_LABEL_HEIGHT + ATTACKER_ROW_HEIGHT + SEPARATOR_HEIGHT
+
+    ordered = sorted(attackers, key=lambda a: a.damage_done, reverse=True)
+    available = bottom - y
+    if len(ordered) * ATTACKER_ROW_HEIGHT <= available:
+        return AttackerPlan(final_blow, max_damage, ordered, [], [], 0)
+
+    # 画不下时预留汇总区 (含 "另有N组" 一行)，剩余高度用于逐个绘制
+    reserved = summary_height(max_summary_rows + 1)
+    fit = max(0, (available - reserved) // ATTACKER_ROW_HEIGHT)
+    rows, rest = ordered[:fit], ordered[fit:]
+    groups = group_attackers(rest)
+    return AttackerPlan(final_blow, max_damage, rows, rest, groups[:max_summary_rows], max(0, len(groups) - max_summary_rows))
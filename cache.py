@@ -0,0 +1,56 @@
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """带过期时间的LRU缓存: 超过 maxsize 时淘汰最久未使用的条目，条目超过 ttl 秒后失效"""
+
+    def __init__(self, maxsize=256, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # 键 -> (过期时间, 值)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None or entry[0] < time.time():
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, value, ttl=None):
+        self._data[key] = (time.time() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __contains__(self, key):
+        entry = self._data.get(key)
+        return entry is not None and entry[0] >= time.time()
+
+    def expires(self, key):
+        """条目的过期时间，不存在时为 0"""
+        entry = self._data.get(key)
+        return entry[0] if entry else 0.0
+
+    def __len__(self):
+        return len(self._data)
+
+    def items(self):
+        """未过期的 (键, 过期时间, 值)，按最近使用顺序从旧到新"""
+        now = time.time()
+        return [(key, expires, value) for key, (expires, value) in self._data.items() if expires >= now]
+
+    def restore(self, entries):
+        """恢复 items() 导出的条目，已过期的跳过"""
+        now = time.time()
+        for key, expires, value in entries:
+            if expires >= now:
+                self._data[key] = (expires, value)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
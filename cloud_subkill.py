@@ -1,6 +1,6 @@
+# 最先导入，用于统计其余模块的导入耗时
+from startup import startup_profile
 import asyncio
-import threading
-import yaml
 import sqlite3
 import requests
 import aiohttp
@@ -10,14 +10,39 @@ from datetime import datetime
 import time
 import os
 import json
-from PIL import Image, ImageDraw, ImageFont
-from collections import defaultdict
-import csv
+from PIL import Image
+from functools import cached_property
 from io import BytesIO
 import re
+import bisect
 
 # 从include导入的常量
 from include import *
+from icon_atlas import IconAtlas
+from models import Killmail, Zkb, loads
+from fitting import SLOT_ORDER, SLOT_HEADER_HEIGHT, ITEM_ROW_HEIGHT, slot_index, aggregate_items
+from prices import PriceIndex, format_isk
+from report import KillReport
+from stats import StatsEngine
+from universe import default_index
+from query_server import QueryServer
+from nav import RouteCache, warm_routes_forever
+from proximity import ProximityWatch, load_gate_jumps
+from calc_dist import WATCHED_SYSTEMS
+from profiling import Profiler
+from entities import EntityStore
+from journal import KillJournal, ENRICHED, RENDERED, DELIVERED, SKIPPED, FAILED
+from textcache import TextCache
+from cache import TTLCache
+from degrade import LoadGovernor, TIER_FULL, TIER_NO_PORTRAITS, TIER_TEXT, TIER_LOG_ONLY, TIER_NAMES
+from attackers import plan_attackers, SUMMARY_HEADER_HEIGHT, SUMMARY_ROW_HEIGHT
+from ingest import KillIngestor, build_kill_sources
+from scheduler import RequestScheduler, RequestShed, PRIORITY_KILLMAIL, PRIORITY_NAMES, PRIORITY_IMAGES, PRIORITY_PORTRAITS
+from dbpool import ReadOnlyPool
+from sde_update import TYPES_YAML, UNIVERSE_TABLES, TYPE_GROUPS_FILE, update_types, load_csv, load_type_groups
+from workers import Coordinator, notify_observers, run_worker, start_worker_processes, stop_worker_processes
+
+startup_profile.record("imports", time.perf_counter() - startup_profile.started)
 
 ACHAR_SIZE = 80
 WP_SIZE = 40
@@ -43,71 +68,266 @@ async def get_session():
         )
     return global_session
 
+# 主输出的类型，日志和标准输出按类型区分，下游只把图片当作图片处理
+OUTPUT_KINDS = {".png": "图片", ".jpg": "图片", ".txt": "文本", ".json": "JSON"}
+
+def output_kind(output):
+    return OUTPUT_KINDS.get(os.path.splitext(output)[1].lower(), "文件")
+
+async def process_kill(killmail_processor, killmail, zkb, received_at=None, backlog=0):
+    """
+    丰富并渲染单个击杀，单进程模式和工作进程共用；backlog 为尚未处理的击杀数，用于选择渲染档位。
+    返回主输出路径 (图片，积压时可能是文本摘要)，没有输出时返回 None。
+    """
+    if DEGRADE_ENABLED:
+        lag = time.monotonic() - received_at if received_at else 0.0
+        killmail_processor.tier = governor.observe(backlog, lag)
+    try:
+        async with profiler.kill(killmail.killmail_id):
+            output, officer, system, vip, vip_kill = await killmail_processor.fetch_killmails(
+                killmail, zkb, ISK_THRESHOLD, vips
+            )
+    except Exception:
+        # 已捕获的失败不再重试；进程中途退出的击杀保持未完成状态，重启后继续
+        killmail_processor.mark(killmail.killmail_id, FAILED)
+        raise
+    if output and os.path.exists(output):
+        kind = output_kind(output)
+        elapsed = f", 耗时: {time.monotonic() - received_at:.2f}秒" if received_at else ""
+        degraded = f", 档位: {TIER_NAMES[killmail_processor.tier]}" if killmail_processor.tier else ""
+        logger.info(f"成功生成击杀{kind}: {output}, 系统: {system}{elapsed}{degraded}")
+        print(f"新击杀{kind}: {output}")
+        killmail_processor.mark(killmail.killmail_id, DELIVERED)
+        return output
+    # 过滤掉或仅记录的击杀已标记为跳过，此处只会把出错或没有输出的标记为失败
+    killmail_processor.mark(killmail.killmail_id, FAILED)
+    return None
+
+async def complete_and_process(killmail_processor, observers, killmail, zkb, received_at=None, backlog=0):
+    """单进程模式: 获取完整击杀并通知观察者，再丰富和渲染；新击杀和上次未完成的击杀共用"""
+    if governor.tier < TIER_LOG_ONLY:
+        # 观察者 (统计、附近击杀、实体资料) 需要星系、受害者和攻击者
+        full = await killmail_processor.complete_killmail(killmail, zkb)
+        if full is None:
+            killmail_processor.mark(killmail.killmail_id, FAILED)
+            return None
+        killmail = full
+    notify_observers(observers, killmail, zkb)
+    return await process_kill(killmail_processor, killmail, zkb, received_at, backlog)
+
 async def main():
     """主函数"""
+    ingestor = None
+    price_task = None
+    stats_task = None
+    stats_engine = None
+    query_server = None
+    route_task = None
+    journal = None
+    journal_task = None
+    entities = None
+    entity_task = None
+    processes = []
     try:
-        # 初始化数据库和图像管理器
-        db_manager = DBManager()
-        image_manager = ImageManager()
-        killmail_processor = KillmailProcessor(db_manager, image_manager)
+        # 初始化数据库和图像管理器 (字体、SDE表、数据库连接均在首次使用时加载)
+        with startup_profile.measure("DBManager"):
+            db_manager = DBManager()
+        with startup_profile.measure("ImageManager"):
+            image_manager = ImageManager()
+        with startup_profile.measure("KillmailProcessor"):
+            killmail_processor = KillmailProcessor(db_manager, image_manager)
+        if JOURNAL_ENABLED:
+            journal = KillJournal(JOURNAL_PATH, JOURNAL_RETENTION_DAYS, max_attempts=JOURNAL_MAX_ATTEMPTS)
+            killmail_processor.journal = journal
+            journal_task = asyncio.create_task(journal.prune_forever())
+        if ENTITY_STORE_ENABLED:
+            with startup_profile.measure("EntityStore"):
+                entities = EntityStore(ENTITY_DB_PATH, ENTITY_MAX_AGE, ENTITY_RETENTION_DAYS)
+            killmail_processor.entities = entities
+        startup_profile.log_report()
+        first_kill = True
+        profiler.start()
+        profiler.install_signals()
         
-
-        # 参数设置 (从 include.py 导入)
-        isk_threshold = ISK_THRESHOLD
-        vip_characters = vips  # VIP角色ID列表  
         specific_kill = None  # 特定击杀ID，设为None则监控新击杀
         
         logger.info("EVE击杀监控系统启动...")
         
         if specific_kill:
             logger.info(f"获取特定击杀: {specific_kill}")
-            killmail, zkb = await killmail_processor.listen_for_new_kills(specific_kill)
-            if killmail and zkb:
-                image, officer, system, vip, vip_kill = await killmail_processor.fetch_killmails(
-                    killmail, zkb, isk_threshold, vip_characters
-                )
-                if image:
-                    logger.info(f"成功生成击杀图片: {image}")
-                    print(f"图片保存在: {image}")
-                else:
-                    logger.warning(f"未能生成击杀图片")
+            killmail, zkb = None, None
+            if journal and journal.state(specific_kill) == DELIVERED:
+                logger.info(f"击杀 {specific_kill} 已发送过，不再重复输出")
             else:
+                killmail, zkb = await killmail_processor.listen_for_new_kills(specific_kill)
+            if killmail and zkb:
+                if journal:
+                    journal.record(killmail, zkb)
+                if not await process_kill(killmail_processor, killmail, zkb):
+                    logger.warning(f"未能生成击杀输出")
+            elif not journal or journal.state(specific_kill) != DELIVERED:
                 logger.error(f"未找到击杀ID: {specific_kill}")
         else:
-            # 持续监控模式
-            while True:
+            # 持续监控模式: 多个长轮询/推送来源持续接收，不做空闲等待
+            ingestor = KillIngestor(build_kill_sources(
+                get_session, request_scheduler, headers, QUEUE_IDS,
+                ttw=REDISQ_TTW, consumers=REDISQ_CONSUMERS, websocket=ZKB_WEBSOCKET
+            ), reorder_window=INGEST_REORDER_WINDOW)
+            ingestor.start()
+            # 后台定期整批刷新市场价格快照 (多进程时工作进程只监视快照文件)
+            price_task = asyncio.create_task(killmail_processor.price_index.refresh_forever(get_session, request_scheduler))
+            # 所有接收到的击杀都计入统计，与是否生成图片无关
+            stats_engine = StatsEngine(STATS_DIR, killmail_processor.region_of, STATS_RETENTION_DAYS)
+            stats_task = asyncio.create_task(stats_engine.flush_forever())
+            observers = [stats_engine.record]
+            if PROXIMITY_ALERTS_ENABLED:
+                # 关注区域在启动时一次算好，每个击杀只做一次查表
+                observers.append(ProximityWatch(
+                    PROXIMITY_SYSTEMS or WATCHED_SYSTEMS, PROXIMITY_LY, PROXIMITY_GATE_JUMPS,
+                    default_index(), load_gate_jumps() if PROXIMITY_GATE_JUMPS else None
+                ))
+            if entities:
+                # 记录每个击杀中出现的实体，没有积压时在后台补全名称、简称和图像
+                observers.append(entities)
+                entity_task = asyncio.create_task(entities.refresh_forever(
+                    get_session, request_scheduler, image_manager.prefetch,
+                    idle=lambda: ingestor.qsize() == 0 and governor.tier == TIER_FULL,
+                    interval=ENTITY_REFRESH_INTERVAL, limit=ENTITY_REFRESH_BATCH
+                ))
+            if QUERY_SERVER_ENABLED:
+                route_cache = RouteCache(ROUTE_CACHE_FILE, ROUTE_CACHE_SIZE, ROUTE_CACHE_TTL).load()
+                query_server = QueryServer(
+                    default_index(), get_session, killmail_processor.lookup_kill, QUERY_HOST, QUERY_PORT,
+                    concurrency=QUERY_CONCURRENCY, cache_ttl=QUERY_CACHE_TTL, route_cache=route_cache,
+                    profiler=profiler
+                )
+                await query_server.start()
+                # 常用枢纽之间的路线在后台预热，查询时直接命中缓存
+                route_task = asyncio.create_task(warm_routes_forever(
+                    ROUTE_HUBS, ROUTE_WARM_SHIPS, route_cache, default_index(), get_session,
+                    interval=ROUTE_WARM_INTERVAL, refresh_before=ROUTE_WARM_INTERVAL * 2
+                ))
+            
+            # 上次退出时未完成的击杀，先于新击杀处理
+            resumed = journal.pending() if journal else []
+            if resumed:
+                logger.info(f"继续处理上次未完成的 {len(resumed)} 个击杀")
+
+            if WORKER_COUNT > 0:
+                # 协调器模式: 本进程只接收并按击杀ID分片，丰富和渲染交给工作进程
+                queues, processes = start_worker_processes(worker_process, WORKER_COUNT, WORKER_QUEUE_SIZE)
+                # 协调器先获取完整击杀再交给观察者和工作进程，工作进程不再重复请求ESI
+                coordinator = Coordinator(ingestor, queues, observers, journal,
+                                          killmail_processor.complete_killmail, COMPLETE_CONCURRENCY)
+                logger.info(f"已启动 {WORKER_COUNT} 个工作进程，等待新击杀...")
                 try:
-                    logger.info("等待新击杀...")
-                    killmail, zkb = await killmail_processor.listen_for_new_kills()
-                    
-                    if killmail and zkb:
-                        logger.info(f"发现新击杀! ID: {killmail.get('killmail_id')}")
-                        image, officer, system, vip, vip_kill = await killmail_processor.fetch_killmails(
-                            killmail, zkb, isk_threshold, vip_characters
+                    for killmail, zkb, _ in resumed:
+                        await coordinator.submit(killmail, zkb)
+                    await coordinator.run()
+                finally:
+                    coordinator.close()
+            else:
+                for killmail, zkb, _ in resumed:
+                    try:
+                        await complete_and_process(killmail_processor, observers, killmail, zkb)
+                    except Exception as e:
+                        logger.error(f"继续处理击杀 {killmail.killmail_id} 时出错: {e}")
+                logger.info("等待新击杀...")
+                while True:
+                    try:
+                        killmail, zkb, received_at = await ingestor.get()
+                        if journal and not journal.record(killmail, zkb):
+                            logger.info(f"击杀 {killmail.killmail_id} 已处理过，跳过")
+                            continue
+                        logger.info(f"发现新击杀! ID: {killmail.killmail_id}, 积压: {ingestor.qsize()}")
+                        image = await complete_and_process(
+                            killmail_processor, observers, killmail, zkb, received_at, ingestor.qsize()
                         )
+                        if image and first_kill:
+                            # 首个击杀完成后，延迟加载的组件都已计入报告
+                            first_kill = False
+                            startup_profile.log_report()
                         
-                        if image:
-                            logger.info(f"成功生成击杀图片: {image}, 系统: {system}")
-                            print(f"新击杀图片: {image}")
-                            
-                        # 限速
-                        await asyncio.sleep(2)
-                    else:
-                        # 没有新击杀，等待再查询
-                        await asyncio.sleep(5)
-                        
-                except Exception as e:
-                    logger.error(f"处理击杀时出错: {e}")
-                    logger.error(traceback.format_exc())
-                    await asyncio.sleep(10)
+                    except Exception as e:
+                        # 单个击杀出错不影响后续击杀，接收端的重试由调度器处理
+                        logger.error(f"处理击杀时出错: {e}")
+                        logger.error(traceback.format_exc())
     finally:
         # 资源释放
+        profiler.stop()
+        if any(governor.counts[TIER_NO_PORTRAITS:]):
+            logger.info(f"渲染档位统计: {governor.summary()}")
+        if ingestor:
+            await ingestor.stop()
+        if price_task:
+            price_task.cancel()
+        if stats_task:
+            stats_task.cancel()
+        if stats_engine:
+            stats_engine.flush()
+        if route_task:
+            route_task.cancel()
+        if query_server:
+            await query_server.stop()
+        if processes:
+            await asyncio.to_thread(stop_worker_processes, processes)
+        if journal_task:
+            journal_task.cancel()
+        if journal:
+            journal.close()
+        if entity_task:
+            entity_task.cancel()
+        if entities:
+            entities.close()
         if global_session and not global_session.closed:
             await global_session.close()
         if 'db_manager' in locals():
             db_manager.close()
         logger.info("EVE击杀监控系统关闭")
 
+def worker_process(shard, shard_count, work_queue):
+    """工作进程入口 (spawn 启动，重新导入本模块)"""
+    global request_scheduler
+    # 各工作进程平分主机限速，合计不超过单进程时的速率
+    request_scheduler = RequestScheduler({
+        host: (rate / shard_count, max(1, capacity // shard_count))
+        for host, (rate, capacity) in HOST_RATE_LIMITS.items()
+    })
+    try:
+        asyncio.run(worker_main(shard, work_queue))
+    except KeyboardInterrupt:
+        pass
+
+async def worker_main(shard, work_queue):
+    """工作进程：只读共享数据库和图集，独立的会话和调度器"""
+    db_manager = DBManager(read_only=True)
+    killmail_processor = KillmailProcessor(db_manager, ImageManager())
+    if JOURNAL_ENABLED:
+        # 协调器负责记录和去重，工作进程只推进状态
+        killmail_processor.journal = KillJournal(JOURNAL_PATH, JOURNAL_RETENTION_DAYS, load=False)
+    if ENTITY_STORE_ENABLED:
+        # 协调器负责记录出现和后台刷新，工作进程只读取名称并写回新解析的名称
+        killmail_processor.entities = EntityStore(ENTITY_DB_PATH, ENTITY_MAX_AGE, ENTITY_RETENTION_DAYS)
+    price_task = asyncio.create_task(killmail_processor.price_index.watch())
+    profiler.start()
+    profiler.install_signals()
+    
+    async def handle(killmail, zkb, received_at):
+        await process_kill(killmail_processor, killmail, zkb, received_at, work_queue.qsize())
+    
+    try:
+        await run_worker(work_queue, handle, f"工作进程 {shard}")
+    finally:
+        profiler.stop()
+        price_task.cancel()
+        if killmail_processor.journal:
+            killmail_processor.journal.close()
+        if killmail_processor.entities:
+            killmail_processor.entities.close()
+        if global_session and not global_session.closed:
+            await global_session.close()
+        db_manager.close()
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -124,49 +344,78 @@ ID_URL = "https://esi.evetech.net/latest/universe/ids/?datasource=tranquility&la
 path = "/tmp/subkillmail_final.png"
 output_path = os.path.dirname(__file__) + path
 
-# 定义多个API终点以提高可靠性
-ZKILLBOARD_API_ENDPOINTS = [
-    f"https://zkillredisq.stream/listen.php?queueID={QUEUE_ID}&ttw=1",
-]
-
 ZKILLBOARD_5B_URL = "https://zkillboard.com/api/kills/iskValue/5000000000/"
 headers = {
-    'User-Agent': USER_AGENT, //Write your email here
+    'User-Agent': USER_AGENT,  # 在 include.py 中填写联系方式
     'Accept-Encoding': 'json'
 }
-params = {
-    'limit': 1,  # 只取最近一条
-    'use_page': '1',
-    'no-Cache': 1
-}
 
 # 全局变量
 global_session = None
 db_lock = asyncio.Lock()
+request_scheduler = RequestScheduler(HOST_RATE_LIMITS)  # 所有出站请求共用的限速与错误预算
+profiler = Profiler(PROFILE_DIR, PROFILE_BLOCKING_MS)  # 线上性能诊断 (逐击杀 cProfile / 循环阻塞 / 内存快照)
+governor = LoadGovernor(DEGRADE_THRESHOLDS, DEGRADE_HOLD)  # 积压时的渲染降级 (每个进程各自判断)
+text_cache = TextCache(FONT_FALLBACKS, TEXT_CACHE_BYTES, TEXT_CACHE_ENTRIES)  # 文字位图缓存 (舰船名/星系名/数值等反复出现的文字只光栅化一次)
+
+class SingleFlight:
+    """合并并发的相同请求：同一个key同时只有一个进行中的任务，其余调用者等待同一个future"""
+    
+    def __init__(self):
+        self._inflight = {}
+    
+    def _release(self, keys, future):
+        for key in keys:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+    
+    def _start(self, keys, coro):
+        future = asyncio.ensure_future(coro)
+        for key in keys:
+            self._inflight[key] = future
+        future.add_done_callback(lambda f: self._release(keys, f))
+        return future
+    
+    async def do(self, key, func, *args):
+        """执行 func(*args)，已有相同key的任务在进行时直接等待其结果"""
+        future = self._inflight.get(key)
+        if future is None:
+            future = self._start([key], func(*args))
+        # shield: 单个调用者被取消时不影响其他等待者
+        return await asyncio.shield(future)
+    
+    async def do_many(self, keys, func):
+        """批量版本：func(缺失的keys) 返回 {key: value}，进行中的key复用已有任务"""
+        keys = set(keys)
+        futures = {self._inflight[k] for k in keys if k in self._inflight}
+        missing = [k for k in keys if k not in self._inflight]
+        if missing:
+            futures.add(self._start(missing, func(missing)))
+        
+        results = {}
+        for future in futures:
+            try:
+                results.update(await asyncio.shield(future))
+            except Exception as e:
+                logger.error(f"合并请求执行失败: {e}")
+        return {k: results[k] for k in keys if k in results}
 
 class DBManager:
     """数据库管理类，处理与SQLite的所有交互"""
     
-    def __init__(self, db_path='items.db'):
+    def __init__(self, db_path='items.db', read_only=False, mmap_size=DB_MMAP_SIZE, pool_size=DB_POOL_SIZE):
         self.db_path = db_path
+        self.read_only = read_only  # 工作进程等只读部署，不允许导入
         self.connection = None
         self.cursor = None
-        self._local = threading.local()  # 为每个线程创建独立存储
-        self.initialize_db()
-    
-    def get_connection(self):
-        """获取当前线程的数据库连接"""
-        if not hasattr(self._local, 'connection') or self._local.connection is None:
-            self._local.connection = sqlite3.connect(self.db_path)
-            self._local.cursor = self._local.connection.cursor()
-        return self._local.connection, self._local.cursor
+        # 所有查询共用固定大小的只读连接池，不随 to_thread 线程数增长；
+        # read_only 时以 immutable 打开，运行期间库文件不得被修改
+        self.pool = ReadOnlyPool(db_path, pool_size, mmap_size, immutable=read_only)
+        # 主连接只用于导入数据，在 import_yaml_data 中按需打开
         
     def close(self):
         """关闭所有数据库连接"""
-        if hasattr(self._local, 'connection') and self._local.connection:
-            self._local.connection.close()
-            self._local.connection = None
-            self._local.cursor = None
+        self.pool.close()
         
         # 主连接也关闭
         if self.connection:
@@ -176,54 +425,89 @@ class DBManager:
     
     def initialize_db(self):
         """初始化数据库连接和表结构"""
+        if self.read_only:
+            raise RuntimeError("只读模式下不能导入数据")
         self.connection = sqlite3.connect(self.db_path)
+        self.connection.execute("PRAGMA journal_mode=WAL")  # 导入期间只读连接不被阻塞
         self.cursor = self.connection.cursor()
     
-    def import_yaml_data(self):
-        """从YAML文件导入物品数据到数据库"""
+    def import_yaml_data(self, types_path=TYPES_YAML):
+        """从YAML文件增量导入物品数据，只写入内容变化的物品 (完整更新含派生文件见 sde_update.py)"""
+        if self.connection is None:
+            self.initialize_db()
         try:
-            with open('sde/fsd/types.yaml', 'r', encoding='utf-8') as file:
-                items_data = yaml.safe_load(file)
-                
-                for item_id, item in items_data.items():
-                    # 获取中文名称
-                    name_zh = item['name'].get('zh', '')
-                    # 获取英文名称
-                    name_en = item['name'].get('en', '')
-                    # 将中文和英文名称存储在一个字典中
-                    name = json.dumps({'zh': name_zh, 'en': name_en}, ensure_ascii=False)
-                    groupid = item.get('groupID', 0)
-                    market_id = item.get('marketGroupID', 0)
-                    
-                    self.cursor.execute('''
-                    INSERT OR REPLACE INTO items (id, name, market_id, groupid)
-                    VALUES (?, ?, ?, ?)
-                    ''', (item_id, name, market_id, groupid))
-                
-                self.connection.commit()
-                logger.info("已成功从YAML导入物品数据")
+            report = update_types(self.connection, types_path)
+            # 合并WAL，保证以 immutable 打开的只读连接能看到全部数据
+            self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            logger.info(f"已成功从YAML导入物品数据: {report}")
         except Exception as e:
             logger.error(f"导入YAML数据失败: {e}")
             self.connection.rollback()
     
     def get_groupid(self, type_id):
         """获取物品的组ID"""
-        _, cursor = self.get_connection()
-        cursor.execute('SELECT groupid FROM items WHERE id = ?', (type_id,))
-        result = cursor.fetchone()
+        result = self.pool.fetch_one('SELECT groupid FROM items WHERE id = ?', (type_id,))
         if result:
             return result[0]
         return None
     
+    @cached_property
+    def type_groups(self):
+        """sde_update 生成的 typeID -> groupID 数组；不存在或比物品库旧时为 None，改为查询数据库"""
+        try:
+            if os.path.getmtime(TYPE_GROUPS_FILE) < os.path.getmtime(self.db_path):
+                logger.info(f"{TYPE_GROUPS_FILE} 比物品库旧，组ID改为查询数据库")
+                return None
+            return load_type_groups(TYPE_GROUPS_FILE)
+        except OSError:
+            return None
+        except Exception as e:
+            logger.warning(f"读取 {TYPE_GROUPS_FILE} 失败: {e}")
+            return None
+    
+    def get_groupids(self, type_ids):
+        """批量获取物品的组ID，返回 {typeID: 组ID}；优先二分查找预生成的数组，找不到的再查数据库"""
+        type_ids = {t for t in type_ids if t}
+        groups = self.type_groups
+        if groups is None:
+            return self.pool.fetch_map('SELECT id, groupid FROM items WHERE id IN ({placeholders})', type_ids)
+        sorted_ids, group_ids = groups
+        result, missing = {}, []
+        for type_id in type_ids:
+            i = bisect.bisect_left(sorted_ids, type_id)
+            if i < len(sorted_ids) and sorted_ids[i] == type_id:
+                result[type_id] = group_ids[i]
+            else:
+                missing.append(type_id)
+        if missing:
+            result.update(self.pool.fetch_map('SELECT id, groupid FROM items WHERE id IN ({placeholders})', missing))
+        return result
+    
     def get_item_name(self, type_id):
         """获取物品名称"""
-        _, cursor = self.get_connection()
-        cursor.execute('SELECT name FROM items WHERE id = ?', (type_id,))
-        result = cursor.fetchone()
+        result = self.pool.fetch_one('SELECT name FROM items WHERE id = ?', (type_id,))
         if result:
             return result[0]
         return None
     
+    def get_item_names_zh(self, type_ids):
+        """批量获取物品中文名称，一次查询返回 {typeID: 名称}"""
+        type_ids = [t for t in set(type_ids) if t]
+        names = {}
+        rows = self.pool.fetch_map('SELECT id, name FROM items WHERE id IN ({placeholders})', type_ids)
+        for type_id, name_json in rows.items():
+            try:
+                names[type_id] = json.loads(name_json).get('zh', '')
+            except json.JSONDecodeError:
+                logger.error(f"解析物品名称JSON失败: {name_json}")
+                names[type_id] = ""
+        
+        # 数据库中没有的物品逐个回退到API
+        for type_id in type_ids:
+            if type_id not in names:
+                names[type_id] = self.get_item_name_zh(type_id)
+        return names
+    
     def get_item_name_zh(self, type_id):
         """获取物品的中文名称"""
         name_json = self.get_item_name(type_id)
@@ -238,7 +522,9 @@ class DBManager:
         # 如果数据库中没有，尝试从API获取
         url = f"https://sde.jita.space/latest/universe/types/{type_id}"
         try:
+            request_scheduler.acquire_sync(url, PRIORITY_NAMES)
             response = requests.get(url, timeout=5)
+            request_scheduler.record_response(url, response.status_code, response.headers)
             response.raise_for_status()
             data = response.json()
             name = data.get("name", "Unknown")
@@ -248,11 +534,33 @@ class DBManager:
             logger.error(f"从API获取物品名称失败 (ID: {type_id}): {e}")
             return "Unknown Item"
 
+def decode_image(data, size=None):
+    """
+    解码图像字节为RGBA。指定 size 时按目标尺寸解码: JPEG 用 draft 直接以 1/2~1/8 比例解码，
+    其他格式先整数倍 reduce 再 LANCZOS 缩放到 size x size，避免先解码全尺寸再缩小。
+    """
+    image = Image.open(BytesIO(data))
+    if size:
+        image.draft("RGB", (size, size))  # 只对JPEG生效，其他格式忽略
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA")  # 调色板/灰度图先转换，缩放时才能插值
+        if image.size != (size, size):
+            image = image.resize((size, size), Image.LANCZOS, reducing_gap=2.0)
+    if image.mode != "RGBA":
+        image = image.convert("RGBA")
+    return image
+
+
 class ImageManager:
     """图像管理类，处理所有图像下载和缓存"""
     
-    def __init__(self, cache_dir="sde/Types"):  #SDE_ICONS_DIR
+    def __init__(self, cache_dir="sde/Types", atlas_dir=ATLAS_DIR, memory_size=IMAGE_MEMORY_CACHE):
         self.cache_dir = cache_dir
+        self.atlas = IconAtlas(atlas_dir)
+        self._flights = SingleFlight()  # 按URL合并并发下载
+        # 已按绘制尺寸解码的图像，(URL, 尺寸) -> Image；头像会更新，所以设置过期时间
+        self.decoded = TTLCache(memory_size, IMAGE_MEMORY_TTL)
+        self.missing = TTLCache(4096, IMAGE_MEMORY_TTL)  # 返回404的URL，有效期内不再请求
         
         # 创建缓存目录
         for directory in [
@@ -265,15 +573,15 @@ class ImageManager:
             
         logger.info(f"图像缓存目录初始化完成: {cache_dir}")
     
-    def load_local_icon(self, item_type_id, icon_size=32):
-        """从本地加载图标，如果不存在则返回None"""
+    def load_local_icon(self, item_type_id, icon_size=32, size=None):
+        """从本地加载图标 (按 size 解码)，如果不存在则返回None"""
         icon_filename = f"{item_type_id}_{icon_size}.png"
         icon_path = os.path.join(self.cache_dir, icon_filename)
         
         if os.path.exists(icon_path):
             try:
-                icon_img = Image.open(icon_path)
-                return icon_img
+                with open(icon_path, "rb") as f:
+                    return decode_image(f.read(), size)
             except Exception as e:
                 logger.error(f"加载图像 {icon_path} 失败: {e}")
                 # 删除损坏的图像
@@ -281,75 +589,137 @@ class ImageManager:
                 return None
         return None
     
-    async def download_image(self, url, max_retries=3, retry_delay=1):
-        """下载图像并支持本地缓存、重试机制和错误处理"""
-        # 尝试从URL提取类型ID和尺寸用于缓存
-        match = re.search(r'types/(\d+)/icon\?size=(\d+)', url)
-        cache_path = None
+    async def get_type_icon(self, type_id, size):
+        """按绘制尺寸获取物品图标，优先从图集读取，未命中时回退到单文件/网络并缩放"""
+        icon = self.atlas.get(type_id, size)
+        if icon is not None:
+            return icon
         
-        # 如果是EVE物品图标，创建缓存路径
+        src_size = 64 if size > 32 else 32
+        icon_url = f"https://images.evetech.net/types/{type_id}/icon?size={src_size}"
+        icon = self.decoded.get((icon_url, size))
+        if icon is not None:
+            return icon
+        icon = self.load_local_icon(type_id, src_size, size)
+        if icon is None:
+            return await self.download_image(icon_url, size)
+        self.decoded.put((icon_url, size), icon)
+        return icon
+    
+    def cache_path(self, url):
+        """URL对应的本地缓存文件，不缓存的URL返回None"""
+        # EVE物品图标
+        match = re.search(r'types/(\d+)/icon\?size=(\d+)', url)
         if match:
             type_id, size = match.groups()
-            os.makedirs(self.cache_dir, exist_ok=True)
-            cache_path = f"{self.cache_dir}/{type_id}_{size}.png"
-            
-            # 检查缓存
-            if os.path.exists(cache_path):
-                try:
-                    return Image.open(cache_path).convert("RGBA")
-                except Exception as e:
-                    logger.warning(f"缓存图像损坏，将重新下载 {cache_path}: {e}")
-                    # 缓存文件损坏，继续下载
+            return f"{self.cache_dir}/{type_id}_{size}.png"
         
-        # 角色头像等其他图像类型
-        elif "characters" in url or "corporations" in url or "alliances" in url:
-            entity_type = "characters" if "characters" in url else "corporations" if "corporations" in url else "alliances"
+        # 角色头像、公司和联盟徽标
+        for entity_type in ("characters", "corporations", "alliances"):
             match = re.search(rf'{entity_type}/(\d+)', url)
             if match:
-                entity_id = match.groups()[0]
                 size_match = re.search(r'size=(\d+)', url)
                 size = size_match.groups()[0] if size_match else "64"
-                
-                cache_subdir = f"{self.cache_dir}/{entity_type}"
-                os.makedirs(cache_subdir, exist_ok=True)
-                cache_path = f"{cache_subdir}/{entity_id}_{size}.png"
-                
-                if os.path.exists(cache_path):
-                    try:
-                        return Image.open(cache_path).convert("RGBA")
-                    except Exception:
-                        # 缓存文件损坏，继续下载
-                        pass
+                return f"{self.cache_dir}/{entity_type}/{match.groups()[0]}_{size}.png"
+        return None
+    
+    async def download_image(self, url, size=None, max_retries=3):
+        """
+        获取图像并按 size 解码 (None 为原始尺寸)。
+        同一URL的并发请求只会下载一次；解码结果按 (URL, 尺寸) 缓存在内存中。
+        """
+        key = (url, size)
+        image = self.decoded.get(key)
+        if image is not None or url in self.missing:
+            return image
+        cache_path = self.cache_path(url)
+        for attempt in range(2):
+            data = await self._flights.do(url, self._download_image, url, max_retries)
+            if data is None:
+                return None
+            try:
+                image = decode_image(data, size)
+                break
+            except Exception as e:
+                if cache_path and os.path.exists(cache_path):
+                    os.remove(cache_path)
+                if attempt:
+                    logger.error(f"处理图像时出错 {url}: {e}")
+                    return None
+                # 缓存文件损坏，删除后重新下载一次
+                logger.warning(f"缓存图像损坏，将重新下载 {url}: {e}")
+        self.decoded.put(key, image)
+        return image
+    
+    async def prefetch(self, url):
+        """预先下载到本地缓存 (不解码): True 已缓存, False 不存在 (404), None 暂时无法下载"""
+        if url in self.missing:
+            return False
+        data = await self._flights.do(url, self._download_image, url, 1)
+        if data is not None:
+            return True
+        return False if url in self.missing else None
+    
+    async def _download_image(self, url, max_retries=3):
+        """返回图像的原始字节: 优先读取本地缓存，否则下载 (带重试) 并原样写入缓存，不重新编码"""
+        cache_path = self.cache_path(url)
+        if cache_path and os.path.exists(cache_path):
+            try:
+                with open(cache_path, "rb") as f:
+                    return f.read()
+            except OSError as e:
+                logger.warning(f"读取缓存图像失败，将重新下载 {cache_path}: {e}")
         
-        # 下载图像（带重试）
+        # 下载图像（带重试，限速和退避由调度器统一处理）
+        priority = PRIORITY_PORTRAITS if "/portrait" in url else PRIORITY_IMAGES
         for attempt in range(max_retries):
             try:
+                await request_scheduler.acquire(url, priority)
                 session = await get_session()
                 async with session.get(url, timeout=10) as r:
+                    request_scheduler.record_response(url, r.status, r.headers)
                     r.raise_for_status()
                     image_data = await r.read()
-                    image = Image.open(BytesIO(image_data)).convert("RGBA")
+                # 只读取文件头确认是图像，像素留到使用时按需解码
+                Image.open(BytesIO(image_data))
                 
-                # 如果有缓存路径，保存图像
+                # 如果有缓存路径，先写临时文件再替换，避免其他进程读到不完整的文件
                 if cache_path:
                     try:
-                        image.save(cache_path)
+                        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+                        with open(cache_path + ".tmp", "wb") as f:
+                            f.write(image_data)
+                        os.replace(cache_path + ".tmp", cache_path)
                     except Exception as e:
                         logger.error(f"保存缓存图像失败 {cache_path}: {e}")
                 
-                return image
+                return image_data
+                
+            except RequestShed as e:
+                # 负载过高时放弃低优先级图像，由调用方使用替代图
+                logger.info(f"跳过图像 {url}: {e}")
+                break
+            
+            except aiohttp.ClientResponseError as e:
+                if e.status == 404:
+                    self.missing.put(url, True)
+                if e.status < 500 or attempt >= max_retries - 1:
+                    # 404等客户端错误重试无意义
+                    logger.error(f"下载图像失败 {url}: {e.status}")
+                    break
+                request_scheduler.record_failure(url)
+                logger.warning(f"下载图像失败 {url}，尝试 {attempt+1}/{max_retries}: {e.status}")
                 
             except aiohttp.ClientError as e:
-                # 网络错误，可以重试
+                # 网络错误，由调度器对主机退避后重试
                 if attempt < max_retries - 1:
-                    wait_time = retry_delay * (2 ** attempt)  # 指数退避
-                    logger.warning(f"下载图像失败 {url}，尝试 {attempt+1}/{max_retries}，等待 {wait_time}秒: {e}")
-                    await asyncio.sleep(wait_time)
+                    request_scheduler.record_failure(url)
+                    logger.warning(f"下载图像失败 {url}，尝试 {attempt+1}/{max_retries}: {e}")
                 else:
                     logger.error(f"下载图像失败，已达最大重试次数 {url}: {e}")
                     
             except Exception as e:
-                # 其他错误（如图像处理错误）
+                # 其他错误（如不是图像）
                 logger.error(f"处理图像时出错 {url}: {e}")
                 break
         
@@ -359,92 +729,92 @@ class ImageManager:
 class KillmailProcessor:
     """击杀邮件处理类，负责获取和处理击杀数据"""
     
-    def __init__(self, db_manager, image_manager):
+    def __init__(self, db_manager, image_manager, price_index=None, layouts=None):
         self.db_manager = db_manager
         self.image_manager = image_manager
+        self.price_index = price_index or PriceIndex()  # 本地价格索引，首次取价时加载快照
+        self.layouts = layouts if layouts is not None else OUTPUT_LAYOUTS
+        # 输出格式 -> 渲染函数 render(report, **配置) -> 输出文件路径
+        self.renderers = {
+            "full": self.render_full_image,
+            "thumbnail": self.render_thumbnail,
+            "fit_card": self.render_fit_card,
+            "text": self.write_text_summary,
+            "json": self.write_json_summary,
+        }
+        self.tier = TIER_FULL                     # 当前渲染档位，由 process_kill 按负载设置
+        self.journal = None                       # 击杀处理日志 (KillJournal)，未启用时为 None
+        self.entities = None                      # 实体资料库 (EntityStore)，未启用时为 None
+        self._name_flights = SingleFlight()       # 按ID合并 resolve_names 请求
+        self._item_name_flights = SingleFlight()  # 按typeID合并物品名称查询
         
-        # 加载CSV数据
-        try:
-            logger.info("加载EVE星系数据...")
-            self.solar_systems = self.load_csv('sde/mapSolarSystems.csv', 'solarSystemID')
-            self.constellations = self.load_csv('sde/mapConstellations.csv', 'constellationID')
-            self.regions = self.load_csv('sde/mapRegions.csv', 'regionID')
-            self.inv_types = self.load_csv('sde/invTypes.csv', 'typeID')
-            logger.info(f"数据加载完成: {len(self.solar_systems)}个星系, {len(self.regions)}个区域")
-        except Exception as e:
-            print(f"load system fail: {e}")
+    # SDE星系数据在首次查询时加载 (优先读取二进制快照)
+    @cached_property
+    def solar_systems(self):
+        return self.load_csv(*UNIVERSE_TABLES[0])
+    
+    @cached_property
+    def constellations(self):
+        return self.load_csv(*UNIVERSE_TABLES[1])
+    
+    @cached_property
+    def regions(self):
+        return self.load_csv(*UNIVERSE_TABLES[2])
     
+    def region_of(self, system_id):
+        """星系所在的星域ID"""
+        system = self.solar_systems.get(system_id)
+        if not system:
+            return None
+        if system.get('regionID'):
+            return int(system['regionID'])
+        constellation = self.constellations.get(int(system.get('constellationID') or 0))
+        return int(constellation['regionID']) if constellation and constellation.get('regionID') else None
+    
+    def mark(self, killmail_id, state):
+        """推进处理日志中的击杀状态"""
+        if self.journal is not None:
+            try:
+                self.journal.advance(killmail_id, state)
+            except Exception as e:
+                logger.error(f"更新处理日志失败 ({killmail_id}): {e}")
+
     def load_csv(self, filename, key_field):
-        """加载CSV数据到字典"""
-        data = {}
-        try:
-            with open(filename, mode='r', encoding='utf-8') as file:
-                reader = csv.DictReader(file)
-                for row in reader:
-                    key = int(row[key_field])
-                    data[key] = row
-        except Exception as e:
-            logger.error(f"加载CSV {filename} 失败: {e}")
+        """加载CSV数据到字典，源文件未变化时直接读取快照"""
+        data = load_csv(filename, key_field)
+        logger.info(f"已加载 {filename}: {len(data)}条")
         return data
     
-    async def listen_for_new_kills(self, kill_id=None):
-        """监听新的击杀，如果提供kill_id则获取特定击杀"""
+    async def listen_for_new_kills(self, kill_id):
+        """从zKillboard获取特定击杀 (持续监控由 ingest.KillIngestor 接收)"""
         dns_retry_count = 0
         max_dns_retries = 5
-        dns_retry_delay = 10  # 秒
+        killmail_url = f"https://zkillboard.com/api/killID/{kill_id}/"
         
         while dns_retry_count < max_dns_retries:
             try:
                 session = await get_session()
-                
-                if kill_id:
-                    # 获取特定击杀
-                    killmail_url = f"https://zkillboard.com/api/killID/{kill_id}/"
-                    async with session.get(killmail_url, headers=headers) as response:
-                        if response.status == 200:
-                            data = await response.json()
-                            # 假设返回的数据是一个列表，取第一个 killmail
-                            killmail = data[0]
-                            zkb = killmail.get("zkb")
-                            return killmail, zkb
-                        else:
-                            logger.warning(f"获取特定击杀返回非200状态码: {response.status}")
-                            text = await response.text()
-                            logger.debug(f"响应文本: {text}")
-                            return None, None
-                else:
-                    # 轮询新击杀
-                    for endpoint in ZKILLBOARD_API_ENDPOINTS:
-                        try:
-                            logger.info(f"从 {endpoint} 获取新击杀")
-                            async with session.get(endpoint, params=params, headers=headers) as response:
-                                if response.status == 200:
-                                    data = await response.json()
-                                    package = data.get("package")
-                                    if package:
-                                        logger.info("检测到新击杀!")
-                                        killmail = package.get("killmail")
-                                        zkb = package.get("zkb")
-                                        return killmail, zkb
-                                    else:
-                                        # 无新数据
-                                        logger.debug("没有新击杀")
-                                else:
-                                    logger.warning(f"获取击杀返回非200状态码: {response.status}")
-                        except Exception as e:
-                            logger.error(f"尝试端点 {endpoint} 失败: {e}")
-                            continue
-                    
-                    # 所有端点都失败
-                    return None, None
+                await request_scheduler.acquire(killmail_url, PRIORITY_KILLMAIL)
+                async with session.get(killmail_url, headers=headers) as response:
+                    request_scheduler.record_response(killmail_url, response.status, response.headers)
+                    if response.status == 200:
+                        data = loads(await response.read())
+                        # 假设返回的数据是一个列表，取第一个 killmail
+                        killmail = data[0]
+                        return Killmail.from_esi(killmail), Zkb.from_dict(killmail.get("zkb"))
+                    else:
+                        logger.warning(f"获取特定击杀返回非200状态码: {response.status}")
+                        text = await response.text()
+                        logger.debug(f"响应文本: {text}")
+                        return None, None
                     
             except aiohttp.ClientConnectorDNSError as dns_err:
                 dns_retry_count += 1
                 logger.error(f"DNS解析失败 (尝试 {dns_retry_count}/{max_dns_retries}): {dns_err}")
                 if dns_retry_count < max_dns_retries:
-                    logger.info(f"等待 {dns_retry_delay} 秒后重试...")
-                    await asyncio.sleep(dns_retry_delay)
-                    dns_retry_delay *= 1.5  # 指数退避
+                    # 退避由调度器记录，下次获取许可时等待
+                    delay = request_scheduler.record_failure(killmail_url)
+                    logger.info(f"等待 {delay} 秒后重试...")
                 else:
                     logger.error("达到最大DNS重试次数，放弃")
                     return None, None
@@ -458,14 +828,43 @@ class KillmailProcessor:
                 await asyncio.sleep(5)
                 return None, None
     
-    async def enrich_esi_killmail_data_async(self, killmail_data):
+    async def lookup_kill(self, kill_id):
+        """按击杀ID查询并丰富，返回 KillReport (查询服务使用，不生成图片)"""
+        killmail, zkb = await self.listen_for_new_kills(kill_id)
+        if not killmail or not zkb:
+            return None
+        esi_killmail = await self.complete_killmail(killmail, zkb)
+        if not esi_killmail:
+            return None
+        return await self.build_report(esi_killmail)
+    
+    async def complete_killmail(self, killmail, zkb):
+        """
+        返回包含完整内容的击杀: 接收端已带击杀内容 (websocket/旧版RedisQ) 时直接使用，
+        只有killID时从ESI获取。获取失败返回 None
+        """
+        if killmail.has_body:
+            killmail.zkb = zkb
+            return killmail
+        if not killmail.killmail_id or not zkb or not zkb.hash:
+            logger.error(f"击杀 {killmail.killmail_id} 缺少hash，无法从ESI获取")
+            return None
+        esi_killmail = await asyncio.to_thread(self.fetch_esi_killmail, killmail.killmail_id, zkb.hash)
+        if esi_killmail is None:
+            return None
+        esi_killmail.zkb = zkb
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"击杀模型内存: {esi_killmail.memory_size() / 1024:.1f}KB ({len(esi_killmail.attackers)}名攻击者)")
+        return esi_killmail
+    
+    async def enrich_esi_killmail_data_async(self, killmail):
         """异步版本的enrich_esi_killmail_data，避免线程安全问题"""
-        if not killmail_data:
-            return {}
+        if not killmail:
+            return None
         
         # 获取受害者和攻击者信息
-        victim = killmail_data.get('victim', {})
-        attackers = killmail_data.get('attackers', [])
+        victim = killmail.victim
+        attackers = killmail.attackers
 
         # 收集所有需要解析的ID
         ids_to_resolve = set()
@@ -473,33 +872,64 @@ class KillmailProcessor:
         # 收集ID的代码与原来相同...
     
         # 解析ID
-        id_name_map = await asyncio.to_thread(self.resolve_names, list(ids_to_resolve))
+        id_name_map = await self.resolve_names_async(list(ids_to_resolve))
     
         # 用异步方法获取物品名称
-        victim['ship_type_name'] = await self.get_item_name_zh_async(victim.get('ship_type_id'))
+        victim.ship_type_name = await self.get_item_name_zh_async(victim.ship_type_id)
     
         # 处理攻击者
         for attacker in attackers:
-            attacker['character_name'] = id_name_map.get(attacker.get('character_id'))
-            attacker['corporation_name'] = id_name_map.get(attacker.get('corporation_id'))
-            attacker['alliance_name'] = id_name_map.get(attacker.get('alliance_id'))
-            attacker['ship_type_name'] = id_name_map.get(attacker.get('ship_type_id'))
-            attacker['weapon_type_name'] = id_name_map.get(attacker.get('weapon_type_id'))
+            attacker.character_name = id_name_map.get(attacker.character_id)
+            attacker.corporation_name = id_name_map.get(attacker.corporation_id)
+            attacker.alliance_name = id_name_map.get(attacker.alliance_id)
+            attacker.ship_type_name = id_name_map.get(attacker.ship_type_id)
+            attacker.weapon_type_name = id_name_map.get(attacker.weapon_type_id)
 
-        # 处理物品
-        for itm in victim.get('items', []):
-            itm_id = itm.get('item_type_id')
-            itm['item_name'] = await self.get_item_name_zh_async(itm_id)
+        # 物品名称在分组合并后由 format_final_output 一次性批量查询
     
         # 返回结果
-        return killmail_data
+        return killmail
 
     async def get_item_name_zh_async(self, type_id):
         """异步获取物品中文名称"""
         if not type_id:
             return "Unknown Item"
     
-        return await asyncio.to_thread(self.db_manager.get_item_name_zh, type_id)
+        return await self._item_name_flights.do(type_id, asyncio.to_thread, self.db_manager.get_item_name_zh, type_id)
+    
+    async def get_item_names_zh_async(self, type_ids):
+        """异步批量获取物品中文名称"""
+        if not type_ids:
+            return {}
+        return await asyncio.to_thread(self.db_manager.get_item_names_zh, type_ids)
+    
+    async def resolve_names_async(self, ids_list):
+        """
+        异步解析名称: 先查实体资料库 (不访问网络)，其余ID中正在解析的直接等待已有请求，
+        剩下的合并成一次新请求，结果写回资料库
+        """
+        ids = [i for i in ids_list if i]
+        if not ids:
+            return {}
+        names = self.entities.names(ids) if self.entities is not None else {}
+        missing = [i for i in ids if i not in names]
+        if missing:
+            names.update(await self._name_flights.do_many(missing, self._resolve_and_learn))
+        return names
+    
+    async def _resolve_and_learn(self, ids):
+        categories = {}
+        names = await asyncio.to_thread(self.resolve_names, ids, categories)
+        if self.entities is not None and names:
+            try:
+                self.entities.learn(names, categories)
+            except Exception as e:
+                logger.error(f"保存实体名称失败: {e}")
+        return names
+    
+    def image_missing(self, entity_id):
+        """实体资料库已确认没有头像/徽标，渲染时不再请求"""
+        return self.entities is not None and self.entities.has_image(entity_id) is False
     
     async def fetch_killmails(self, killmail, zkb, iskValue=None, vips=None):
         logger.info(f"Generating image")
@@ -513,31 +943,33 @@ class KillmailProcessor:
         valuable = False
         fetch_kill = False
 
-        killmail_id = killmail.get('killmail_id')
-        hash_value = zkb.get('hash')
-        totalValue = zkb.get('totalValue')
+        killmail_id = killmail.killmail_id
+        totalValue = zkb.total_value
         logger.info(f"ZKB: {zkb}")
         logger.info(f"KB Value: {totalValue}")
 
+        if not killmail.has_body and self.tier < TIER_LOG_ONLY:
+            # 只有killID时先从ESI获取完整击杀，官员/VIP判断需要受害者和攻击者
+            killmail = await self.complete_killmail(killmail, zkb)
+            if killmail is None:
+                return None, None, None, None, None
+
         if iskValue:
-            character_id = killmail.get('victim', {}).get('character_id')
+            character_id = killmail.victim.character_id
 
             if vips and character_id in vips:
                 vip = True
 
-            for attacker in killmail.get('attackers', []):
-                ship_type_id = attacker.get('ship_type_id')
-                if ship_type_id:
-                    try:
-                        groupId = self.db_manager.get_groupid(ship_type_id)
-                        if groupId is not None:
-                            groupId = int(self.db_manager.get_groupid(ship_type_id))
-                            if groupId in officer_group_ids:
-                                officer = True
-                    except Exception as e:
-                        logger.error(f"获取groupID时异常: {e}")
-                
-                if vips and attacker.get('character_id') in vips and attacker.get('final_blow') == True:
+            # 一次查询全部攻击者舰船的groupID
+            try:
+                group_ids = self.db_manager.get_groupids(a.ship_type_id for a in killmail.attackers if a.ship_type_id)
+                if any(int(g) in officer_group_ids for g in group_ids.values() if g is not None):
+                    officer = True
+            except Exception as e:
+                logger.error(f"获取groupID时异常: {e}")
+
+            for attacker in killmail.attackers:
+                if vips and attacker.character_id in vips and attacker.final_blow == True:
                     vip_kill = True
         
             if totalValue > iskValue:
@@ -548,128 +980,102 @@ class KillmailProcessor:
             fetch_kill = True
 
         if officer or valuable or vip or vip_kill or fetch_kill:
-            if killmail_id and hash_value:
-                # 使用ESI获取完整击杀信息
-                esi_data = await asyncio.to_thread(self.fetch_esi_killmail, killmail_id, hash_value)
-                if not esi_data:
-                    return None, None, None, None, None
-                    
-                # 解析为名称
-                enriched_data = await self.enrich_esi_killmail_data_async(esi_data)
-                # enriched_data = await asyncio.to_thread(self.enrich_esi_killmail_data, esi_data)
-                merged_data = enriched_data.copy()
-                merged_data['zkb'] = zkb
-                
-                # 生成图像
-                image, system = await self.format_final_output(merged_data)
-                return image, officer, system, vip, vip_kill
-            else:
-                logger.error(f"在击杀邮件中找不到killmail_id或hash。")
+            if self.tier >= TIER_LOG_ONLY:
+                # 严重积压: 不请求ESI，只记录通过过滤的击杀
+                logger.warning(f"负载过高，仅记录击杀: {killmail_id} 价值 {totalValue:,.0f} ISK, 星系 {killmail.solar_system_id}"
+                               f"{', 官员' if officer else ''}{', VIP' if vip or vip_kill else ''}")
+                self.mark(killmail_id, SKIPPED)
+                return None, officer, None, vip, vip_kill
+            # 接收端未带击杀内容时 (如 fetch_kill) 从ESI获取完整击杀信息
+            esi_killmail = await self.complete_killmail(killmail, zkb)
+            if not esi_killmail:
                 return None, None, None, None, None
+                
+            # 解析为名称
+            enriched = await self.enrich_esi_killmail_data_async(esi_killmail)
+            self.mark(killmail_id, ENRICHED)
+            
+            # 生成图像
+            image, system = await self.format_final_output(enriched)
+            if image:
+                self.mark(killmail_id, RENDERED)
+            return image, officer, system, vip, vip_kill
         else:
+            self.mark(killmail_id, SKIPPED)
             return None, None, None, None, None
     
     def fetch_esi_killmail(self, killmail_id, killmail_hash):
         """从ESI获取完整击杀邮件数据"""
         esi_url = f"https://esi.evetech.net/latest/killmails/{killmail_id}/{killmail_hash}/"
         try:
+            request_scheduler.acquire_sync(esi_url, PRIORITY_KILLMAIL)
             r = requests.get(esi_url, timeout=20)
+            request_scheduler.record_response(esi_url, r.status_code, r.headers)
             r.raise_for_status()
             logger.info("ESI击杀邮件获取完成")
-            return r.json()
+            return Killmail.from_esi(r.content)
         except Exception as e:
             logger.error(f"ESI击杀邮件获取失败: {e}")
             return None
     
     def get_slot_name(self, flag):
-        """根据flag获取槽位名称"""
-        if 27 <= flag <= 34:
-            return "  高槽"
-        elif 19 <= flag <= 26:
-            return "  中槽"
-        elif 11 <= flag <= 18:
-            return "  低槽"
-        elif 92 <= flag <= 99:
-            return "  改装件"
-        elif 125 <= flag <= 132:
-            return "  子系统槽"
-        elif flag in [87, 88]:
-            return "  无人机舱"
-        elif flag == 5:
-            return "  货舱"
-        elif flag == 90:
-            return "  舰船维护舱"
-        elif flag == 133:
-            return "  燃料舱"
-        elif flag == 155:
-            return "  舰队机库"
-        else:
-            return f"  其他槽位"
+        """根据flag获取槽位名称 (查表)"""
+        return SLOT_ORDER[slot_index(flag)]
     
-    def enrich_esi_killmail_data(self, killmail_data):
+    def enrich_esi_killmail_data(self, killmail):
         """丰富ESI击杀邮件数据，添加名称等信息"""
-        if not killmail_data:
-            return {}
+        if not killmail:
+            return None
             
         # 获取受害者和攻击者信息
-        victim = killmail_data.get('victim', {})
-        attackers = killmail_data.get('attackers', [])
+        victim = killmail.victim
+        attackers = killmail.attackers
 
         # 收集所有需要解析的ID
         ids_to_resolve = set()
 
         # Victim相关ID
-        for key in ['character_id', 'corporation_id', 'alliance_id', 'ship_type_id']:
-            if key in victim:
-                ids_to_resolve.add(victim[key])
+        for entity_id in (victim.character_id, victim.corporation_id, victim.alliance_id, victim.ship_type_id):
+            if entity_id:
+                ids_to_resolve.add(entity_id)
 
         # Attackers相关ID
         for attacker in attackers:
-            for key in ['character_id', 'corporation_id', 'alliance_id', 'ship_type_id', 'weapon_type_id']:
-                if key in attacker:
-                    ids_to_resolve.add(attacker[key])
-
-        # 解析受害者物品 (items)
-        items = victim.get('items', [])
-        item_ids = []
-        for itm in items:
-            # 可能是destroyed或dropped物品
-            item_type_id = itm.get('item_type_id')
-            if item_type_id:
-                item_ids.append(item_type_id)
-
-        # 将物品ID加入解析列表
-        ids_to_resolve.update(item_ids)
+            for entity_id in (attacker.character_id, attacker.corporation_id, attacker.alliance_id,
+                              attacker.ship_type_id, attacker.weapon_type_id):
+                if entity_id:
+                    ids_to_resolve.add(entity_id)
+
+        # 解析受害者物品 (items)，可能是destroyed或dropped物品
+        ids_to_resolve.update(itm.type_id for itm in victim.items if itm.type_id)
 
         # 将ID列表转换成名称
         id_name_map = self.resolve_names(list(ids_to_resolve))
 
         # 给victim添加名称字段
-        victim['character_name'] = id_name_map.get(victim.get('character_id'))
-        victim['corporation_name'] = id_name_map.get(victim.get('corporation_id'))
-        victim['alliance_name'] = id_name_map.get(victim.get('alliance_id'))
-        victim['ship_type_name'] = self.db_manager.get_item_name_zh(victim.get('ship_type_id'))
+        victim.character_name = id_name_map.get(victim.character_id)
+        victim.corporation_name = id_name_map.get(victim.corporation_id)
+        victim.alliance_name = id_name_map.get(victim.alliance_id)
+        victim.ship_type_name = self.db_manager.get_item_name_zh(victim.ship_type_id)
 
         # 给attackers添加名称字段
         for attacker in attackers:
-            attacker['character_name'] = id_name_map.get(attacker.get('character_id'))
-            attacker['corporation_name'] = id_name_map.get(attacker.get('corporation_id'))
-            attacker['alliance_name'] = id_name_map.get(attacker.get('alliance_id'))
-            attacker['ship_type_name'] = id_name_map.get(attacker.get('ship_type_id'))
-            attacker['weapon_type_name'] = id_name_map.get(attacker.get('weapon_type_id'))
-
-        # 为items添加名称字段
-        for itm in items:
-            itm_id = itm.get('item_type_id')
-            itm['item_name'] = self.db_manager.get_item_name_zh(itm_id)
+            attacker.character_name = id_name_map.get(attacker.character_id)
+            attacker.corporation_name = id_name_map.get(attacker.corporation_id)
+            attacker.alliance_name = id_name_map.get(attacker.alliance_id)
+            attacker.ship_type_name = id_name_map.get(attacker.ship_type_id)
+            attacker.weapon_type_name = id_name_map.get(attacker.weapon_type_id)
+
+        # 为items添加名称字段 (含容器内物品，一次批量查询)
+        all_items = [itm for top in victim.items for itm in (top, *top.items)]
+        item_names = self.db_manager.get_item_names_zh(itm.type_id for itm in all_items)
+        for itm in all_items:
+            itm.name = item_names.get(itm.type_id)
             
-        victim['items'] = items
-        killmail_data['victim'] = victim
-        killmail_data['attackers'] = attackers
-        return killmail_data
+        return killmail
     
-    def resolve_names(self, ids_list):
-        """使用ESI API将ID解析为名称"""
+    def resolve_names(self, ids_list, categories=None):
+        """使用ESI API将ID解析为名称；传入 categories 字典时同时填入各ID的类别 (character/corporation/...)"""
         if not ids_list:
             return {}
         
@@ -679,9 +1085,8 @@ class KillmailProcessor:
         url = "https://esi.evetech.net/latest/universe/names/"
         headers = {'Content-Type': 'application/json'}
     
-        # 添加重试逻辑
+        # 添加重试逻辑 (限速和退避由调度器统一处理)
         max_retries = 3
-        retry_delay = 2  # 初始延迟秒数
         all_results = {}  # 将结果初始化移到这里
     
         for attempt in range(max_retries):
@@ -693,7 +1098,9 @@ class KillmailProcessor:
                     # 添加日志以便调试
                     logger.debug(f"发送ID批次: {batch}")
                 
+                    request_scheduler.acquire_sync(url, PRIORITY_NAMES)
                     r = requests.post(url, json=batch, headers=headers, timeout=15)
+                    request_scheduler.record_response(url, r.status_code, r.headers)
                     # 记录响应状态
                     logger.debug(f"ESI API响应状态码: {r.status_code}")
                 
@@ -711,6 +1118,8 @@ class KillmailProcessor:
                                 obj_name = obj.get('name')
                                 if obj_id and obj_name:
                                     all_results[obj_id] = obj_name
+                                    if categories is not None:
+                                        categories[obj_id] = obj.get('category')
                         except Exception as e:
                             logger.error(f"解析名称时出错: {e}")
                 
@@ -724,29 +1133,28 @@ class KillmailProcessor:
             
                 # 如果所有批次都处理完毕，不管成功与否，跳出重试循环
                 break
+            
+            except RequestShed as e:
+                logger.warning(f"错误预算不足，停止解析名称: {e}")
+                break
                     
             except Exception as e:
                 logger.error(f"解析ID名称时发生异常: {e}")
                 logger.error(traceback.format_exc())
             
                 if attempt < max_retries - 1:
-                    time.sleep(retry_delay)
-                    retry_delay *= 2  # 指数退避
+                    request_scheduler.record_failure(url)
     
         # 无论如何都返回结果字典，即使它是空的
         return all_results
     
-    async def draw_item_with_icon(self, draw, base_img, x, y, item_name, item_type_id, qty_destroyed=0, qty_dropped=0, sub_flag=False):
+    async def draw_item_with_icon(self, draw, base_img, x, y, item_name, item_type_id, qty_destroyed=0, qty_dropped=0, sub_flag=False, value=0.0, right=680):
         """绘制物品图标和名称"""
-        # 下载图标
+        # 图标 (图集 -> 本地文件 -> 网络)
+        icon_size = 24
         icon_img = None
         if item_type_id:
-            # 尝试从本地加载
-            icon_img = self.image_manager.load_local_icon(item_type_id)
-            if icon_img is None:
-                # 从网络下载
-                icon_url = f"https://images.evetech.net/types/{item_type_id}/icon?size=32"
-                icon_img = await self.image_manager.download_image(icon_url)
+            icon_img = await self.image_manager.get_type_icon(item_type_id, icon_size)
 
         # 状态标识
         if qty_dropped > 0:
@@ -758,23 +1166,21 @@ class KillmailProcessor:
 
         # 准备文本
         line_text = f"{item_name}"
-        qty_x = 700 - 40 - draw.textlength(f"{qty}", font=SMALL_FONT)
+        qty_x = right - 20 - draw.textlength(f"{qty}", font=SMALL_FONT)
 
         # 背景颜色（掉落的物品用绿色背景）
         if qty == qty_dropped:
-            draw.rectangle([x - 2, y - 2, 680, y + 23], fill=DGREEN)
+            draw.rectangle([x - 2, y - 2, right, y + 23], fill=DGREEN)
             
         # 子物品缩进
         if sub_flag:
             x += 20
             
         # 绘制图标
-        icon_size = 24
         try:
             if icon_img:
-                icon_img = icon_img.resize((icon_size, icon_size), Image.LANCZOS)
                 if icon_img.mode == "RGBA":
-                    base_img.paste(icon_img, (x, y), icon_img.split()[3])
+                    base_img.paste(icon_img, (x, y), icon_img)
                 else:
                     base_img.paste(icon_img, (x, y))
         except Exception as e:
@@ -784,6 +1190,10 @@ class KillmailProcessor:
         text_x = x + icon_size + 5
         draw.text((text_x, y), line_text, font=ICONY_FONT, fill=WHITE)
         draw.text((qty_x, y), f"{qty}", font=ICON_FONT, fill=WHITE)
+        if value > 0:
+            value_text = format_isk(value)
+            value_x = qty_x - 15 - draw.textlength(value_text, font=ICON_FONT)
+            draw.text((value_x, y), value_text, font=ICON_FONT, fill=GRAY)
     
     # def resolve_names(self, ids_list):
     #     # 利用 ESI 的 /universe/names/ 接口来解析id为名称
@@ -808,27 +1218,24 @@ class KillmailProcessor:
     
     async def get_attacker_info(self, attacker, total_damage):
         """获取攻击者信息，包括图片和数据"""
+        # 获取攻击者信息
+        character_id = attacker.character_id
+        corporation_id = attacker.corporation_id
+        alliance_id = attacker.alliance_id
+        ship_type_id = attacker.ship_type_id
+        weapon_type_id = attacker.weapon_type_id
+        
         # 收集需要解析的ID
-        ids_to_resolve = []
-        for key in ['character_id', 'corporation_id', 'alliance_id', 'ship_type_id', 'weapon_type_id']:
-            if attacker.get(key):
-                ids_to_resolve.append(attacker.get(key))
+        ids_to_resolve = [i for i in (character_id, corporation_id, alliance_id, ship_type_id, weapon_type_id) if i]
     
         # 解析名称
         id_name_map = {}
         if ids_to_resolve:
             try:
-                id_name_map = await asyncio.to_thread(self.resolve_names, ids_to_resolve)
+                id_name_map = await self.resolve_names_async(ids_to_resolve)
             except Exception as e:
                 logger.error(f"解析ID名称失败: {e}")
     
-        # 获取攻击者信息
-        character_id = attacker.get('character_id')
-        corporation_id = attacker.get('corporation_id')
-        alliance_id = attacker.get('alliance_id')
-        ship_type_id = attacker.get('ship_type_id')
-        weapon_type_id = attacker.get('weapon_type_id')
-    
         # 从映射中获取名称，如果找不到则使用默认值
         char_name = id_name_map.get(character_id, "Unknown")
         corp_name = id_name_map.get(corporation_id, "")
@@ -836,14 +1243,14 @@ class KillmailProcessor:
         ship_name = id_name_map.get(ship_type_id, "")
         weapon_name = id_name_map.get(weapon_type_id, "Unknown Weapon")
     
-        damage_done = attacker.get('damage_done', 0)
-        final_blow = attacker.get('final_blow', False)
+        damage_done = attacker.damage_done
+        final_blow = attacker.final_blow
         dmg_percent = (damage_done / total_damage * 100) if total_damage else 0
 
         # 如果没有从ID映射获取到舰船名称，尝试从数据库获取
         if not ship_name and ship_type_id:
             try:
-                ship_name = await asyncio.to_thread(self.db_manager.get_item_name_zh, ship_type_id) or "Unknown Ship"
+                ship_name = await self.get_item_name_zh_async(ship_type_id) or "Unknown Ship"
             except Exception as e:
                 logger.error(f"获取舰船名称失败 (ID: {ship_type_id}): {e}")
                 ship_name = "Unknown Ship"
@@ -856,50 +1263,26 @@ class KillmailProcessor:
         ship_img = None
         ship_img_64 = None
         if ship_type_id:
-            # 尝试从本地加载
-            ship_img = self.image_manager.load_local_icon(ship_type_id)
-            ship_img_64 = self.image_manager.load_local_icon(ship_type_id, icon_size=64)
-            
-            # 如果本地没有，则下载
-            if ship_img is None:
-                # 下载64px版本
-                ship_url = f"https://images.evetech.net/types/{ship_type_id}/icon?size=64"
-                ship_img_64 = await self.image_manager.download_image(ship_url)
-                
-                # 下载32px版本
-                ship_url = f"https://images.evetech.net/types/{ship_type_id}/icon?size=32"
-                ship_img = await self.image_manager.download_image(ship_url)
-                
-                if ship_img:
-                    ship_img = ship_img.resize((WP_SIZE, WP_SIZE), Image.LANCZOS)
-                    ship_img_64 = ship_img  # 如果没有64px版本，使用32px版本代替
-            else:
-                ship_img = ship_img.resize((WP_SIZE, WP_SIZE), Image.LANCZOS)
-                if ship_img_64:
-                    ship_img_64 = ship_img_64.resize((ACHAR_SIZE, ACHAR_SIZE), Image.LANCZOS)
-                else:
-                    ship_img_64 = ship_img.resize((ACHAR_SIZE, ACHAR_SIZE), Image.LANCZOS)
+            # 按绘制尺寸直接取图 (图集 -> 本地文件 -> 网络)
+            ship_img = await self.image_manager.get_type_icon(ship_type_id, WP_SIZE)
+            ship_img_64 = await self.image_manager.get_type_icon(ship_type_id, ACHAR_SIZE)
+            if ship_img_64 is None and ship_img:
+                ship_img_64 = ship_img.resize((ACHAR_SIZE, ACHAR_SIZE), Image.LANCZOS)
 
         # 下载武器图片
         wp_img = None
-        if attacker.get('weapon_type_id'):
-            wp_img = self.image_manager.load_local_icon(attacker['weapon_type_id'])
-            if wp_img is None:
-                wp_url = f"https://images.evetech.net/types/{attacker['weapon_type_id']}/icon?size=32"
-                wp_img = await self.image_manager.download_image(wp_url)
-            
-            if wp_img:
-                wp_img = wp_img.resize((WP_SIZE, WP_SIZE), Image.LANCZOS)
+        if weapon_type_id:
+            wp_img = await self.image_manager.get_type_icon(weapon_type_id, WP_SIZE)
 
-        # 下载角色头像
+        # 下载角色头像 (降级时直接用舰船图标)
         char_img = None
-        if attacker.get('character_id'):
-            char_url = f"https://images.evetech.net/characters/{attacker['character_id']}/portrait?size=64"
-            char_img = await self.image_manager.download_image(char_url)
+        if character_id and (self.tier >= TIER_NO_PORTRAITS or self.image_missing(character_id)):
+            char_img = ship_img_64
+        elif character_id:
+            char_url = f"https://images.evetech.net/characters/{character_id}/portrait?size=64"
+            char_img = await self.image_manager.download_image(char_url, ACHAR_SIZE)
             
-            if char_img:
-                char_img = char_img.resize((ACHAR_SIZE, ACHAR_SIZE), Image.LANCZOS)
-            elif ship_img_64:
+            if char_img is None and ship_img_64:
                 char_img = ship_img_64  # 使用舰船图片作为替代
 
         # 确保舰船名称有值
@@ -951,7 +1334,7 @@ class KillmailProcessor:
         try:
             if wp_img:
                 if wp_img.mode == "RGBA":
-                    background.paste(wp_img, (x + ACHAR_SIZE, y+WP_SIZE), wp_img.split()[3])
+                    background.paste(wp_img, (x + ACHAR_SIZE, y+WP_SIZE), wp_img)
                 else:
                     background.paste(wp_img, (x + ACHAR_SIZE, y+WP_SIZE))
         except Exception as e:
@@ -977,47 +1360,29 @@ class KillmailProcessor:
         line4_y = line3_y + 20
         draw.text((x + ACHAR_SIZE + WP_SIZE + 5, line4_y), line4, font=SMALL_FONT, fill=GRAY)
     
-    def merge_items(self, data):
-        """合并相同的物品"""
-        merged_data = {}
-        
-        for category, items in data.items():
-            temp_dict = defaultdict(lambda: {'quantity_destroyed': 0, 'quantity_dropped': 0, 'item_name': '', 'sub_flag': False})
-            for item in items:
-                item_id = item['item_type_id']
-                temp_item = temp_dict[item_id]
-                
-                # 更新物品名称
-                temp_item['item_name'] = item.get('item_name', temp_item['item_name'])
-                # 更新子物品标记
-                temp_item['sub_flag'] = item.get('sub_item', temp_item['sub_flag'])
-                
-                # 累加摧毁数量
-                if 'quantity_destroyed' in item:
-                    temp_item['quantity_destroyed'] += item['quantity_destroyed']
-                
-                # 累加掉落数量
-                if 'quantity_dropped' in item:
-                    temp_item['quantity_dropped'] += item['quantity_dropped']
-            
-            # 转换回列表格式
-            merged_items = []
-            for item_id, attri in temp_dict.items():
-                merged_item = {
-                    'item_type_id': item_id,
-                    'item_name': attri['item_name']
-                }
-                if attri['quantity_destroyed'] > 0:
-                    merged_item['quantity_destroyed'] = attri['quantity_destroyed']
-                if attri['quantity_dropped'] > 0:
-                    merged_item['quantity_dropped'] = attri['quantity_dropped']
-                if attri['sub_flag'] == True:
-                    merged_item['sub_flag'] = attri['sub_flag']
-                merged_items.append(merged_item)
-            
-            merged_data[category] = merged_items
-        
-        return merged_data
+    def paint_attacker_summary(self, draw, x, y, plan, names, right):
+        """绘制未单独列出的攻击者汇总: 每行为 数量× 舰船 联盟/公司"""
+        draw.text((x, y), f"其余 {len(plan.rest)} 名攻击者:", font=SUBTITLE_FONT, fill=GRAY)
+        y += SUMMARY_HEADER_HEIGHT
+        for group in plan.groups:
+            ship_name = names.get(group.ship_type_id) or "Unknown Ship"
+            head = f"{group.count}× {ship_name} "
+            draw.text((x, y), head, font=SMALL_FONT, fill=WHITE)
+            head_length = draw.textlength(head, font=SMALL_FONT)
+            entity_name = names.get(group.entity_id, "")
+            if entity_name:
+                draw.text((x + head_length, y), self.fit_text(draw, entity_name, SMALL_FONT, right - x - head_length), font=SMALL_FONT, fill=GRAY)
+            y += SUMMARY_ROW_HEIGHT
+        if plan.hidden_groups:
+            draw.text((x, y), f"另有 {plan.hidden_groups} 组", font=SMALL_FONT, fill=GRAY)
+
+    def fit_text(self, draw, text, font, max_width):
+        """超出宽度的文本截断并加省略号"""
+        if draw.textlength(text, font=font) <= max_width:
+            return text
+        while text and draw.textlength(text + "…", font=font) > max_width:
+            text = text[:-1]
+        return text + "…" if text else ""
     
     def get_security_color(self, status):
         """根据安全等级获取显示颜色"""
@@ -1027,13 +1392,13 @@ class KillmailProcessor:
         index = int(status * 10)
         return SEC_COLOR[index]
     
-    def generate_unique_output_path(self, killmail_id, base_dir="tmp"):
+    def generate_unique_output_path(self, killmail_id, base_dir="tmp", suffix=".png", when=None):
         """生成唯一的输出文件路径"""
         if not os.path.exists(base_dir):
             os.makedirs(base_dir)  # 如果目录不存在，则创建
 
         # 使用 killmail_id 和当前时间作为文件名，确保唯一性
-        filename = f"{killmail_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png"
+        filename = f"{killmail_id}_{(when or datetime.now()).strftime('%Y%m%d_%H%M%S')}{suffix}"
         output_path = os.path.join(base_dir, filename)
         absolute_output_path = os.path.abspath(output_path)
         
@@ -1047,7 +1412,9 @@ class KillmailProcessor:
         # 首先尝试API获取
         url = f"https://esi.evetech.net/latest/universe/systems/{system_id}/?datasource=tranquility&language=zh"
         try:
+            request_scheduler.acquire_sync(url, PRIORITY_NAMES)
             response = requests.get(url, headers=headers, timeout=10)
+            request_scheduler.record_response(url, response.status_code, response.headers)
             if response.status_code == 200:
                 data = response.json()
                 system_name = data.get("name", None)
@@ -1076,7 +1443,10 @@ class KillmailProcessor:
 
         # 获取星座信息
         try:
-            response = requests.get(f"https://esi.evetech.net/latest/universe/constellations/{constellation_id}/?datasource=tranquility&language=zh", headers=headers, timeout=10)
+            url = f"https://esi.evetech.net/latest/universe/constellations/{constellation_id}/?datasource=tranquility&language=zh"
+            request_scheduler.acquire_sync(url, PRIORITY_NAMES)
+            response = requests.get(url, headers=headers, timeout=10)
+            request_scheduler.record_response(url, response.status_code, response.headers)
             if response.status_code == 200:
                 cons_data = response.json()
                 constellation = cons_data.get("name", None)
@@ -1102,7 +1472,10 @@ class KillmailProcessor:
 
         # 获取区域信息
         try:
-            response = requests.get(f"https://esi.evetech.net/latest/universe/regions/{region_id}/?datasource=tranquility&language=zh", headers=headers, timeout=10)
+            url = f"https://esi.evetech.net/latest/universe/regions/{region_id}/?datasource=tranquility&language=zh"
+            request_scheduler.acquire_sync(url, PRIORITY_NAMES)
+            response = requests.get(url, headers=headers, timeout=10)
+            request_scheduler.record_response(url, response.status_code, response.headers)
             if response.status_code == 200:
                 region_data = response.json()
                 region = region_data.get("name", None)
@@ -1125,136 +1498,157 @@ class KillmailProcessor:
                 
         return (system_name, security_status, constellation, region)
     
-    async def format_final_output(self, killmail_data):
-        """格式化最终输出，生成图像"""
-        if not killmail_data:
+    async def format_final_output(self, killmail):
+        """一次丰富后按配置并行生成各种输出，返回主输出路径 (优先完整击杀图) 和星系名"""
+        if not killmail:
             return None, None
-            
-        #####################DRAW#################################################
-        victim = killmail_data.get('victim', {})
-        attackers = killmail_data.get('attackers', [])
-        zkb_data = killmail_data.get('zkb', {})
-        killmail_id = killmail_data.get('killmail_id', 'N/A')
-        killmail_time = killmail_data.get('killmail_time', 'N/A')
+        
+        report = await self.build_report(killmail)
+        if self.tier >= TIER_TEXT:
+            # 积压时只写文本摘要，省掉全部图片下载和绘制
+            layouts = [("text", {})]
+        else:
+            layouts = [(name, options) for name, options in self.layouts.items() if options.get("enabled")]
+        results = await asyncio.gather(*(
+            self.renderers[name](report, **{k: v for k, v in options.items() if k != "enabled"})
+            for name, options in layouts
+        ), return_exceptions=True)
+        
+        outputs = {}
+        for (name, _), result in zip(layouts, results):
+            if isinstance(result, Exception):
+                logger.error(f"生成输出 {name} 失败: {result}", exc_info=result)
+            elif result:
+                outputs[name] = result
+        if outputs:
+            logger.info(f"已生成输出: {outputs}")
+        primary = outputs.get("full") or next(iter(outputs.values()), None)
+        return primary, report.system_name
+
+    async def build_report(self, killmail):
+        """丰富击杀: 星系、受害者和最后一击名称、物品分组与价格，结果供所有输出格式共用"""
+        victim = killmail.victim
+        attackers = killmail.attackers
+        killmail_time = killmail.killmail_time or 'N/A'
         
         # 转换为 datetime 对象
         dt = datetime.strptime(killmail_time, "%Y-%m-%dT%H:%M:%SZ")
         killmail_time = dt.strftime("%Y-%m-%d %H:%M:%S")
 
-        system_id = killmail_data.get('solar_system_id')
+        system_id = killmail.solar_system_id
         system_info = await asyncio.to_thread(self.get_system_info, system_id)
         system_name, security_status, constellation, region = system_info
         
         if system_name is None:
             system_name = f"SystemID: {system_id}"
             
-        # 死人信息
-        victim_ids = []
-        for key in ['character_id', 'corporation_id', 'alliance_id']:
-            if victim.get(key):
-                victim_ids.append(victim.get(key))
+        # 死人及最后一击信息，一次解析
+        final_blow = next((a for a in attackers if a.final_blow is True), None)
+        victim_ids = [i for i in (victim.character_id, victim.corporation_id, victim.alliance_id) if i]
+        if final_blow and final_blow.character_id:
+            victim_ids.append(final_blow.character_id)
 
         # 解析名称
         victim_id_names = {}
         if victim_ids:
             try:
-                victim_id_names = await asyncio.to_thread(self.resolve_names, victim_ids)
+                victim_id_names = await self.resolve_names_async(victim_ids)
             except Exception as e:
                 logger.error(f"解析死者ID名称失败: {e}")
 
-        # 获取死者信息
-        victim_char_id = victim.get('character_id')
-        victim_corp_id = victim.get('corporation_id')
-        victim_alliance_id = victim.get('alliance_id')
-        victim_ship_id = victim.get('ship_type_id')
-
         # 从映射中获取名称，如果找不到则使用默认值
-        victim_name = victim_id_names.get(victim_char_id, "Unknown")
-        victim_corp = victim_id_names.get(victim_corp_id, "Unknown Corp")
-        victim_alliance = victim_id_names.get(victim_alliance_id, "")
+        victim_name = victim_id_names.get(victim.character_id, "Unknown")
+        victim_corp = victim_id_names.get(victim.corporation_id, "Unknown Corp")
+        victim_alliance = victim_id_names.get(victim.alliance_id, "")
+        final_blow_name = victim_id_names.get(final_blow.character_id) if final_blow else None
+        victim_ship_id = victim.ship_type_id
 
         # 获取舰船名称
-        if victim.get('ship_type_name'):
-            victim_ship = victim.get('ship_type_name')
+        if victim.ship_type_name:
+            victim_ship = victim.ship_type_name
         elif victim_ship_id:
             try:
-                victim_ship = await asyncio.to_thread(self.db_manager.get_item_name_zh, victim_ship_id) or "Unknown Ship"
+                victim_ship = await self.get_item_name_zh_async(victim_ship_id) or "Unknown Ship"
             except Exception as e:
                 logger.error(f"获取死者舰船名称失败 (ID: {victim_ship_id}): {e}")
                 victim_ship = "Unknown Ship"
         else:
             victim_ship = "Unknown Ship"
-
-        damage_taken = victim.get('damage_taken', 0)
-        
-        # 处理受害者的物品清单
-        items = victim.get('items', [])
-
-        # 槽位顺序定义
-        SLOT_ORDER = ["  高槽", "  中槽", "  低槽", "  改装件", "  子系统槽", "  无人机舱", "  货舱", "  燃料舱", "  舰船维护舱", "  舰队机库", "  其他槽位"]
         
-        # 按槽位分组
-        slot_groups = {}
-        for itm in items:
-            flag = itm.get('flag', -1)
-            slot_name = self.get_slot_name(flag)
-            if slot_name not in slot_groups:
-                slot_groups[slot_name] = []
-            slot_groups[slot_name].append(itm)
-            sub_items = itm.get('items')
-            if sub_items:
-                for sub_item in sub_items:
-                    sub_item_id = sub_item.get('item_type_id')
-                    sub_item_name = self.db_manager.get_item_name_zh(sub_item_id)
-                    sub_item.update({"item_name": sub_item_name})
-                    sub_item.update({"sub_item": True})
-                    slot_groups[slot_name].append(sub_item)
+        # 受害者物品单次遍历按 (槽位, 物品, 子物品, 掉落/摧毁) 合并，再一次性批量查询名称
+        groups = aggregate_items(victim.items)
+        try:
+            groups.apply_names(await self.get_item_names_zh_async(groups.type_ids()))
+        except Exception as e:
+            logger.error(f"批量获取物品名称失败: {e}")
+            groups.apply_names({})
+        # 本地价格索引计算每行及每个槽位的价值
+        groups.apply_prices(self.price_index)
         
-        # 合并后的数据
-        merged = self.merge_items(slot_groups)
-        item_num = 0
-        for slot_name in merged:
-            item_num += len(merged[slot_name])
-
-        # 根据物品数量动态调整画布高度
-        if item_num < 30:
-            bg_height = 1000
-        else:
-            bg_height = item_num * 25 + 600
+        return KillReport(killmail, killmail_time, system_name, security_status, constellation, region,
+                          victim_name, victim_corp, victim_alliance, victim_ship, final_blow_name,
+                          groups, groups.top_drops(5), datetime.now())
+
+    async def render_full_image(self, report):
+        """完整击杀图 (700px)"""
+        #####################DRAW#################################################
+        killmail = report.killmail
+        victim = killmail.victim
+        attackers = killmail.attackers
+        zkb_data = killmail.zkb or Zkb()
+        killmail_id = killmail.killmail_id or 'N/A'
+        killmail_time = report.killmail_time
+        system_name, security_status = report.system_name, report.security_status
+        constellation, region = report.constellation, report.region
+        victim_char_id = victim.character_id
+        victim_corp_id = victim.corporation_id
+        victim_alliance_id = victim.alliance_id
+        victim_ship_id = victim.ship_type_id
+        victim_name, victim_corp, victim_alliance = report.victim_name, report.victim_corp, report.victim_alliance
+        victim_ship = report.victim_ship
+        damage_taken = victim.damage_taken
+        groups, top_drops = report.groups, report.top_drops
+        top_drops_height = SLOT_HEADER_HEIGHT + len(top_drops) * ITEM_ROW_HEIGHT if top_drops else 0
+
+        # 根据物品行数动态调整画布高度: 装备列表起点 + 全部行高 + 最贵掉落 + 底部价值信息
+        bg_height = max(1000, 240 + groups.height + top_drops_height + 200)
             
         # 生成画布
         img_width, img_height = 700, bg_height
         background = Image.new("RGB", (img_width, img_height), (30,30,30))
-        draw = ImageDraw.Draw(background)
+        draw = text_cache.draw(background)
 
         # 批量准备图像下载任务
         image_download_tasks = []
+        victim_size = 128
         
+        # 降级时不下载头像和徽标，只用本地图标
+        portraits = self.tier < TIER_NO_PORTRAITS
+
         # 受害者角色头像
         victim_image_task = None
-        if victim.get('character_id'):
-            char_url = f"https://images.evetech.net/characters/{victim['character_id']}/portrait"
-            victim_image_task = self.image_manager.download_image(char_url)
+        if victim_char_id and portraits and not self.image_missing(victim_char_id):
+            char_url = f"https://images.evetech.net/characters/{victim_char_id}/portrait"
+            victim_image_task = self.image_manager.download_image(char_url, victim_size)
             image_download_tasks.append(('victim_image', victim_image_task))
         
         # 受害者舰船图片
         victimship_img_task = None
-        if victim.get('ship_type_id'):
-            ship_url = f"https://images.evetech.net/types/{victim['ship_type_id']}/icon?size=64"
-            victimship_img_task = self.image_manager.download_image(ship_url)
+        if victim_ship_id:
+            victimship_img_task = self.image_manager.get_type_icon(victim_ship_id, victim_size)
             image_download_tasks.append(('victimship_img', victimship_img_task))
         
         # 公司图标
         corp_image_task = None
-        if victim.get('corporation_id'):
-            corp_url = f"https://images.evetech.net/corporations/{victim['corporation_id']}/logo?size=32"
+        if victim_corp_id and portraits and not self.image_missing(victim_corp_id):
+            corp_url = f"https://images.evetech.net/corporations/{victim_corp_id}/logo?size=32"
             corp_image_task = self.image_manager.download_image(corp_url)
             image_download_tasks.append(('corp_image', corp_image_task))
         
         # 联盟图标
         allia_image_task = None
-        if victim.get('alliance_id'):
-            allia_url = f"https://images.evetech.net/alliances/{victim['alliance_id']}/logo?size=32"
+        if victim_alliance_id and portraits and not self.image_missing(victim_alliance_id):
+            allia_url = f"https://images.evetech.net/alliances/{victim_alliance_id}/logo?size=32"
             allia_image_task = self.image_manager.download_image(allia_url)
             image_download_tasks.append(('allia_image', allia_image_task))
         
@@ -1269,7 +1663,6 @@ class KillmailProcessor:
 
         # 左上角头像及舰船图像区域
         avatar_x, avatar_y = 10, 10
-        victim_size = 128
         
         ############## Left Half
         draw.rectangle([0, 0, avatar_x + victim_size*2 + 20, img_height], fill=BLACK)
@@ -1278,7 +1671,6 @@ class KillmailProcessor:
         victim_image = images.get('victim_image')
         try:
             if victim_image:
-                victim_image = victim_image.resize((victim_size, victim_size), Image.LANCZOS)
                 background.paste(victim_image, (avatar_x, avatar_y), victim_image)
         except Exception as e:
             logger.error(f"绘制受害者头像失败: {e}")
@@ -1287,7 +1679,6 @@ class KillmailProcessor:
         victimship_img = images.get('victimship_img')
         try:
             if victimship_img:
-                victimship_img = victimship_img.resize((victim_size, victim_size), Image.LANCZOS)
                 background.paste(victimship_img, (avatar_x+130, avatar_y))
         except Exception as e:
             logger.error(f"绘制受害者舰船图片失败: {e}")
@@ -1301,26 +1692,28 @@ class KillmailProcessor:
         atk_y = avatar_y + 180
         
         # 计算总伤害
-        total_damage = sum(a.get('damage_done', 0) for a in attackers)
+        total_damage = sum(a.damage_done for a in attackers)
+        
+        # 预先规划: 只获取并绘制画得下的攻击者，其余按联盟/公司和舰船汇总
+        plan = plan_attackers(attackers, atk_y, bg_height - 110)
+        unique = {id(a): a for a in plan.detailed()}
+        infos = await asyncio.gather(*(self.get_attacker_info(a, total_damage) for a in unique.values()))
+        attacker_infos = dict(zip(unique, infos))
         
         # 最后一击攻击者信息
-        final_blow_attackers = [a for a in attackers if a.get('final_blow', False) is True]
-        if final_blow_attackers:
+        if plan.final_blow:
             final_blow_line = f"最后一击:"
             draw.text((atk_x, atk_y), final_blow_line, font=SUBTITLE_FONT, fill=GRAY)
             atk_y += 30
-            final_blow_info = await self.get_attacker_info(final_blow_attackers[0], total_damage)
-            await self.paint_attackers(background, draw, atk_x, atk_y, final_blow_info)
+            await self.paint_attackers(background, draw, atk_x, atk_y, attacker_infos[id(plan.final_blow)])
             atk_y += ACHAR_SIZE + 10
 
         # 最高伤害攻击者信息
-        if attackers:
-            max_damage_attacker = max(attackers, key=lambda a: a.get('damage_done', 0))
+        if plan.max_damage:
             max_damage_line = f"最高伤害:"
             draw.text((atk_x, atk_y), max_damage_line, font=SUBTITLE_FONT, fill=GRAY)
             atk_y += 30
-            max_damage_info = await self.get_attacker_info(max_damage_attacker, total_damage)
-            await self.paint_attackers(background, draw, atk_x, atk_y, max_damage_info)
+            await self.paint_attackers(background, draw, atk_x, atk_y, attacker_infos[id(plan.max_damage)])
             atk_y += ACHAR_SIZE + 10
             
             # 分隔线
@@ -1328,13 +1721,18 @@ class KillmailProcessor:
             atk_y += 15
 
             # 其他攻击者列表
-            for a in sorted(attackers, key=lambda x: x.get('damage_done', 0), reverse=True):
-                attacker_info = await self.get_attacker_info(a, total_damage)
-                await self.paint_attackers(background, draw, atk_x, atk_y, attacker_info)
-                if atk_y > bg_height - 200:
-                    break
-                else:
-                    atk_y += ACHAR_SIZE + 10
+            for a in plan.rows:
+                await self.paint_attackers(background, draw, atk_x, atk_y, attacker_infos[id(a)])
+                atk_y += ACHAR_SIZE + 10
+
+            # 其余攻击者汇总
+            if plan.rest:
+                summary_names = {}
+                try:
+                    summary_names = await self.resolve_names_async(list(plan.summary_ids()))
+                except Exception as e:
+                    logger.error(f"解析攻击者汇总名称失败: {e}")
+                self.paint_attacker_summary(draw, atk_x, atk_y, plan, summary_names, avatar_x + victim_size*2)
 
         ############## Right Half
         info_x, info_y = avatar_x + victim_size*2 + 10, avatar_y
@@ -1385,82 +1783,137 @@ class KillmailProcessor:
         fit_y += 30
 
         # 绘制装备信息
-        slot_lines = []
-        for slot_name in SLOT_ORDER:
-            if slot_name in merged:
-                slot_lines.append(slot_name + ":")
-                draw.rectangle([fit_x - 2, fit_y, 680, fit_y + 24], fill=(37,39,41))
-                draw.text((fit_x, fit_y), slot_name, font=SUBTITLEY_FONT, fill=WHITE)
-                fit_y += 30
-
-                slot_items = merged[slot_name]
-                for itm in slot_items:
-                    itm_name = itm.get('item_name', 'Unknown Item')
-                    itm_id = itm.get('item_type_id', None)
-                    sub_flag = itm.get('sub_flag', False)
-                    qty_destroyed = itm.get('quantity_destroyed', 0)
-                    qty_dropped = itm.get('quantity_dropped', 0)
-                    qty = qty_destroyed if qty_destroyed > 0 else qty_dropped
-                    if qty == 0:
-                        qty = 1  # 默认数量为1
-
-                    if sub_flag:
-                        if qty_destroyed > 0:
-                            await self.draw_item_with_icon(draw, background, fit_x, fit_y, itm_name, itm_id, qty_destroyed, 0, sub_flag)
-                            if fit_y > bg_height - 200:
-                                break
-                            else:
-                                fit_y += 25
-                            slot_lines.append(f" - {itm_name} x{qty_destroyed} 摧毁")
-
-                        if qty_dropped > 0:
-                            await self.draw_item_with_icon(draw, background, fit_x, fit_y, itm_name, itm_id, 0, qty_dropped, sub_flag)
-                            if fit_y > bg_height - 200:
-                                break
-                            else:
-                                fit_y += 25
-                            slot_lines.append(f" - {itm_name} x{qty_dropped} 掉落")
-                    else:
-                        if qty_destroyed > 0:
-                            await self.draw_item_with_icon(draw, background, fit_x, fit_y, itm_name, itm_id, qty_destroyed, 0)
-                            if fit_y > bg_height - 200:
-                                break
-                            else:
-                                fit_y += 25
-                            slot_lines.append(f" - {itm_name} x{qty_destroyed} 摧毁")
-
-                        if qty_dropped > 0:
-                            await self.draw_item_with_icon(draw, background, fit_x, fit_y, itm_name, itm_id, 0, qty_dropped)
-                            if fit_y > bg_height - 200:
-                                break
-                            else:
-                                fit_y += 25
-                            slot_lines.append(f" - {itm_name} x{qty_dropped} 掉落")
-
+        for slot, lines in groups.slots:
+            slot_name = SLOT_ORDER[slot]
+            slot_value = sum(line.value for line in lines)
+            draw.rectangle([fit_x - 2, fit_y, 680, fit_y + 24], fill=(37,39,41))
+            draw.text((fit_x, fit_y), slot_name, font=SUBTITLEY_FONT, fill=WHITE)
+            if slot_value:
+                slot_value_text = format_isk(slot_value)
+                draw.text((680 - 20 - draw.textlength(slot_value_text, font=ICON_FONT), fit_y + 2), slot_value_text, font=ICON_FONT, fill=GRAY)
+            fit_y += 30
+
+            for line in lines:
+                qty_destroyed = 0 if line.dropped else line.quantity
+                qty_dropped = line.quantity if line.dropped else 0
+                await self.draw_item_with_icon(draw, background, fit_x, fit_y, line.name, line.type_id, qty_destroyed, qty_dropped, line.sub_item, line.value)
                 if fit_y > bg_height - 200:
                     break
+                else:
+                    fit_y += 25
+
+            if fit_y > bg_height - 200:
+                break
+
+        # 最贵掉落
+        if top_drops and fit_y <= bg_height - 200:
+            draw.rectangle([fit_x - 2, fit_y, 680, fit_y + 24], fill=(37,39,41))
+            draw.text((fit_x, fit_y), "  最贵掉落", font=SUBTITLEY_FONT, fill=WHITE)
+            fit_y += 30
+            for line in top_drops:
+                await self.draw_item_with_icon(draw, background, fit_x, fit_y, line.name, line.type_id, 0, line.quantity, False, line.value)
+                fit_y += 25
 
         # 价值信息
-        total_value = zkb_data.get('totalValue', 0)
-        dropped_value = zkb_data.get('droppedValue', 0)
-        destroyed_value = zkb_data.get('destroyedValue', 0)
+        total_value = zkb_data.total_value
+        dropped_value = zkb_data.dropped_value
+        destroyed_value = zkb_data.destroyed_value
 
         # 价值信息在右下角
         val_x, val_y = info_x + 150, bg_height - 100
         draw.text((val_x, val_y), f"总价值: {total_value:,.2f} ISK", font=SUBTITLE_FONT, fill=WHITE)
         val_y += 20
         draw.text((val_x, val_y), f"掉  落: {dropped_value:,.2f} ISK", font=SUBTITLE_FONT, fill=GREEN)
-        val_y += 40
+        val_y += 20
+        draw.text((val_x, val_y), f"摧  毁: {destroyed_value:,.2f} ISK", font=SUBTITLE_FONT, fill=RED)
+        val_y += 20
         draw.text((val_x, val_y), f"Kill #{killmail_id}", font=TEXT_FONT, fill=WHITE)
 
         # 上下分栏线
         draw.rectangle([avatar_x, avatar_y+victim_size+46, 680, avatar_y+victim_size+47], fill=GRAY)
 
-        # 保存图像
-        output_path = self.generate_unique_output_path(killmail_id)
-        background.save(output_path, optimize=True)
+        # 保存图像 (编码在线程中进行，不阻塞其他输出)
+        output_path = self.generate_unique_output_path(killmail_id, when=report.generated_at)
+        await asyncio.to_thread(background.save, output_path, optimize=True)
+
+        return output_path
 
-        return output_path, system_name
+    async def render_thumbnail(self, report, width=360):
+        """预览小图: 舰船图标、受害者、星系和总价值"""
+        icon_size, height = 64, 84
+        background = Image.new("RGB", (width, height), BLACK)
+        draw = text_cache.draw(background)
+        victim = report.killmail.victim
+        
+        ship_img = await self.image_manager.get_type_icon(victim.ship_type_id, icon_size) if victim.ship_type_id else None
+        if ship_img:
+            background.paste(ship_img, (10, 10), ship_img if ship_img.mode == "RGBA" else None)
+        
+        text_x = 10 + icon_size + 10
+        text_width = width - text_x - 10
+        draw.text((text_x, 8), self.fit_text(draw, report.victim_name, NAME_FONT, text_width), font=NAME_FONT, fill=WHITE)
+        draw.text((text_x, 33), self.fit_text(draw, report.victim_ship, TEXT_FONT, text_width), font=TEXT_FONT, fill=GRAY)
+        
+        system_text = f"{report.system_name} "
+        draw.text((text_x, 55), system_text, font=SMALL_FONT, fill=WHITE)
+        security_x = text_x + draw.textlength(system_text, font=SMALL_FONT)
+        if report.security_status is not None:
+            draw.text((security_x, 55), f"({report.security_status:.1f})", font=SMALL_FONT, fill=self.get_security_color(report.security_status))
+        zkb = report.zkb
+        if zkb and zkb.total_value:
+            value_text = f"{format_isk(zkb.total_value)} ISK"
+            draw.text((width - 10 - draw.textlength(value_text, font=SUBTITLE_FONT), 52), value_text, font=SUBTITLE_FONT, fill=WHITE)
+        
+        output_path = self.generate_unique_output_path(report.killmail.killmail_id, suffix="_thumb.png", when=report.generated_at)
+        await asyncio.to_thread(background.save, output_path, optimize=True)
+        return output_path
+
+    async def render_fit_card(self, report, width=420):
+        """装备卡片: 只绘制舰船和已装配的槽位 (高/中/低/改装件/子系统/无人机舱)"""
+        fitted = [(slot, lines) for slot, lines in report.groups.slots if slot <= SLOT_ORDER.index("  无人机舱")]
+        header_height = 84
+        height = header_height + sum(SLOT_HEADER_HEIGHT + len(lines) * ITEM_ROW_HEIGHT for _, lines in fitted) + 10
+        background = Image.new("RGB", (width, height), BLACK)
+        draw = text_cache.draw(background)
+        right = width - 10
+        victim = report.killmail.victim
+        
+        ship_img = await self.image_manager.get_type_icon(victim.ship_type_id, 64) if victim.ship_type_id else None
+        if ship_img:
+            background.paste(ship_img, (10, 10), ship_img if ship_img.mode == "RGBA" else None)
+        draw.text((84, 12), self.fit_text(draw, report.victim_ship, SHIP_FONT, right - 84), font=SHIP_FONT, fill=WHITE)
+        draw.text((84, 40), self.fit_text(draw, report.victim_name, TEXT_FONT, right - 84), font=TEXT_FONT, fill=GRAY)
+        
+        fit_x, fit_y = 10, header_height
+        for slot, lines in fitted:
+            slot_value = sum(line.value for line in lines)
+            draw.rectangle([fit_x - 2, fit_y, right, fit_y + 24], fill=GRAY_L)
+            draw.text((fit_x, fit_y), SLOT_ORDER[slot], font=SUBTITLEY_FONT, fill=WHITE)
+            if slot_value:
+                slot_value_text = format_isk(slot_value)
+                draw.text((right - 20 - draw.textlength(slot_value_text, font=ICON_FONT), fit_y + 2), slot_value_text, font=ICON_FONT, fill=GRAY)
+            fit_y += SLOT_HEADER_HEIGHT
+            for line in lines:
+                qty_destroyed = 0 if line.dropped else line.quantity
+                qty_dropped = line.quantity if line.dropped else 0
+                await self.draw_item_with_icon(draw, background, fit_x, fit_y, line.name, line.type_id, qty_destroyed, qty_dropped, line.sub_item, line.value, right)
+                fit_y += ITEM_ROW_HEIGHT
+        
+        output_path = self.generate_unique_output_path(report.killmail.killmail_id, suffix="_fit.png", when=report.generated_at)
+        await asyncio.to_thread(background.save, output_path, optimize=True)
+        return output_path
+
+    async def write_text_summary(self, report):
+        output_path = self.generate_unique_output_path(report.killmail.killmail_id, suffix=".txt", when=report.generated_at)
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.write(report.to_text())
+        return output_path
+
+    async def write_json_summary(self, report):
+        output_path = self.generate_unique_output_path(report.killmail.killmail_id, suffix=".json", when=report.generated_at)
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.write(report.to_json())
+        return output_path
 
 if __name__ == "__main__":
     try:
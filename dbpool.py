@@ -0,0 +1,99 @@
+import os
+import queue
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger("eve_monitor")
+
+# 批量查询的占位符数量档位，参数不足时用第一个值补齐，
+# 这样无论一次查多少个ID，每个连接上只会出现这几条预编译语句
+BULK_SIZES = (1, 8, 32, 128, 500)
+
+
+def bulk_size(count):
+    for size in BULK_SIZES:
+        if count <= size:
+            return size
+    return BULK_SIZES[-1]
+
+
+class ReadOnlyPool:
+    """
+    固定大小的只读SQLite连接池，与线程数无关。
+      - URI 形式 mode=ro 打开，immutable=True 时再加 immutable=1 (跳过加锁和变更检查，
+        要求库文件运行期间不被修改，WAL 需已检查点合并)
+      - 每个连接设置 mmap_size，多个连接/进程共享操作系统页缓存
+      - 连接依靠 sqlite3 的语句缓存复用预编译语句
+    """
+
+    def __init__(self, db_path, size=4, mmap_size=256 * 1024 * 1024, immutable=False):
+        self.db_path = db_path
+        self.size = size
+        self.mmap_size = mmap_size
+        self.immutable = immutable
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._all = []
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        uri = f"file:{os.path.abspath(self.db_path)}?mode=ro"
+        if self.immutable:
+            uri += "&immutable=1"
+        connection = sqlite3.connect(uri, uri=True, check_same_thread=False, cached_statements=32)
+        connection.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        return connection
+
+    @contextmanager
+    def connection(self):
+        """借出一个连接，池中无空闲且已达上限时等待其他线程归还"""
+        try:
+            connection = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+            if create:
+                try:
+                    connection = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+                self._all.append(connection)
+            else:
+                connection = self._idle.get()
+        try:
+            yield connection
+        finally:
+            self._idle.put(connection)
+
+    def fetch_one(self, sql, params=()):
+        with self.connection() as connection:
+            return connection.execute(sql, params).fetchone()
+
+    def fetch_map(self, sql, keys):
+        """
+        批量按主键读取: sql 中的 {placeholders} 替换为占位符，结果第一列为主键。
+        返回 {主键: 其余列 (单列时为值本身)}，相当于 SELECT 版的 executemany。
+        """
+        keys = list(dict.fromkeys(k for k in keys if k is not None))
+        result = {}
+        with self.connection() as connection:
+            for i in range(0, len(keys), BULK_SIZES[-1]):
+                batch = keys[i:i + BULK_SIZES[-1]]
+                size = bulk_size(len(batch))
+                params = batch + [batch[0]] * (size - len(batch))
+                for row in connection.execute(sql.format(placeholders=",".join("?" * size)), params):
+                    result[row[0]] = row[1] if len(row) == 2 else row[1:]
+        return result
+
+    def close(self):
+        for connection in self._all:
+            connection.close()
+        self._all = []
+        self._created = 0
+        self._idle = queue.LifoQueue()
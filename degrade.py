@@ -0,0 +1,71 @@
+import time
+import logging
+
+logger = logging.getLogger("eve_monitor")
+
+# 渲染档位，数值越大省掉的工作越多
+TIER_FULL = 0          # 完整渲染
+TIER_NO_PORTRAITS = 1  # 不下载头像和徽标，用舰船图标代替
+TIER_TEXT = 2          # 只生成文本摘要
+TIER_LOG_ONLY = 3      # 只做过滤并记录日志，不请求ESI
+
+TIER_NAMES = {
+    TIER_FULL: "完整渲染",
+    TIER_NO_PORTRAITS: "无头像",
+    TIER_TEXT: "仅文本",
+    TIER_LOG_ONLY: "仅记录",
+}
+
+
+class LoadGovernor:
+    """
+    按积压数量和击杀延迟 (接收到开始处理的秒数) 自动切换渲染档位。
+    thresholds[i] 为进入第 i+1 档的 (积压, 延迟秒)，任一项达到即升档，可以一次跳多档；
+    负载降到当前档阈值的 recover_ratio 以下并持续 hold 秒后才降一档，避免来回抖动。
+    """
+
+    def __init__(self, thresholds, hold=60, recover_ratio=0.5, clock=time.monotonic):
+        self.thresholds = list(thresholds)
+        self.hold = hold
+        self.recover_ratio = recover_ratio
+        self.clock = clock
+        self.tier = TIER_FULL
+        self.changed_at = clock()
+        self._calm_since = None
+        self.counts = [0] * (len(self.thresholds) + 1)  # 各档处理的击杀数
+
+    def _level(self, backlog, lag, ratio=1.0):
+        """负载对应的档位"""
+        level = TIER_FULL
+        for i, (max_backlog, max_lag) in enumerate(self.thresholds):
+            if backlog >= max_backlog * ratio or lag >= max_lag * ratio:
+                level = i + 1
+        return level
+
+    def observe(self, backlog, lag):
+        """记录当前负载，返回本次击杀应使用的档位"""
+        now = self.clock()
+        level = self._level(backlog, lag)
+        if level > self.tier:
+            self._switch(level, backlog, lag, now)
+        elif self.tier > TIER_FULL and self._level(backlog, lag, self.recover_ratio) < self.tier:
+            if self._calm_since is None:
+                self._calm_since = now
+            elif now - self._calm_since >= self.hold:
+                self._switch(self.tier - 1, backlog, lag, now)
+        else:
+            self._calm_since = None
+        self.counts[self.tier] += 1
+        return self.tier
+
+    def _switch(self, tier, backlog, lag, now):
+        direction = "升" if tier > self.tier else "恢复"
+        log = logger.warning if tier > self.tier else logger.info
+        log(f"负载{direction}档: {TIER_NAMES[self.tier]} -> {TIER_NAMES[tier]} "
+            f"(积压 {backlog}, 延迟 {lag:.1f}秒, 上一档持续 {now - self.changed_at:.0f}秒)")
+        self.tier = tier
+        self.changed_at = now
+        self._calm_since = None
+
+    def summary(self):
+        return ", ".join(f"{TIER_NAMES[tier]} {count}" for tier, count in enumerate(self.counts) if count)
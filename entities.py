@@ -0,0 +1,284 @@
+import time
+import asyncio
+import sqlite3
+import logging
+
+import aiohttp
+
+from scheduler import PRIORITY_PORTRAITS, RequestShed
+
+logger = logging.getLogger("eve_monitor")
+
+ESI_NAMES_URL = "https://esi.evetech.net/latest/universe/names/"
+ESI_BASE_URL = "https://esi.evetech.net/latest"
+
+# 需要后台刷新的实体类别；其他类别 (舰船、物品等) 名称不会变化，只缓存不刷新
+ENTITY_CATEGORIES = ("character", "corporation", "alliance")
+TICKER_CATEGORIES = ("corporation", "alliance")
+
+# 与渲染时使用的图像URL一致，预取后渲染直接命中本地缓存
+IMAGE_URLS = {
+    "character": "https://images.evetech.net/characters/{}/portrait?size=64",
+    "corporation": "https://images.evetech.net/corporations/{}/logo?size=32",
+    "alliance": "https://images.evetech.net/alliances/{}/logo?size=32",
+}
+
+
+class EntityProfile:
+    """角色/公司/联盟资料，has_image 为 None 表示尚未确认头像或徽标是否存在"""
+    __slots__ = ('entity_id', 'category', 'name', 'ticker', 'has_image', 'last_seen', 'seen_count', 'refreshed_at')
+
+    def __init__(self, entity_id, category=None, name=None, ticker=None, has_image=None,
+                 last_seen=0.0, seen_count=0, refreshed_at=0.0):
+        self.entity_id = entity_id
+        self.category = category
+        self.name = name
+        self.ticker = ticker
+        self.has_image = has_image
+        self.last_seen = last_seen
+        self.seen_count = seen_count
+        self.refreshed_at = refreshed_at
+
+    @classmethod
+    def from_row(cls, row):
+        entity_id, category, name, ticker, has_image, last_seen, seen_count, refreshed_at = row
+        return cls(entity_id, category, name, ticker, None if has_image is None else bool(has_image),
+                   last_seen, seen_count, refreshed_at)
+
+    def to_row(self):
+        has_image = None if self.has_image is None else int(self.has_image)
+        return (self.entity_id, self.category, self.name, self.ticker, has_image,
+                self.last_seen, self.seen_count, self.refreshed_at)
+
+    def needs_refresh(self, now, max_age):
+        if self.name is None or now - self.refreshed_at > max_age:
+            return True
+        if self.category not in ENTITY_CATEGORIES:
+            return False
+        return self.has_image is None or (self.category in TICKER_CATEGORIES and self.ticker is None)
+
+
+def killmail_entities(killmail):
+    """击杀中出现的角色、公司和联盟ID"""
+    ids = set()
+    for party in (killmail.victim, *killmail.attackers):
+        if party is None:
+            continue
+        for entity_id in (party.character_id, party.corporation_id, party.alliance_id):
+            if entity_id:
+                ids.add(entity_id)
+    return ids
+
+
+class EntityStore:
+    """
+    常见实体资料库 (SQLite WAL + 内存字典)。渲染时名称先查内存，再查数据库，都没有才请求ESI；
+    作为击杀观察者记录每个击杀中出现的实体，空闲时后台按最近出现顺序补全和刷新名称、简称和图像，
+    这样常见实体在渲染时不需要等待网络。多个进程共用同一个数据库。
+    """
+
+    COLUMNS = 'entity_id, category, name, ticker, has_image, last_seen, seen_count, refreshed_at'
+
+    def __init__(self, path="entities.db", max_age=7 * 86400, retention_days=90, load=True):
+        self.path = path
+        self.max_age = max_age
+        self.retention_days = retention_days
+        self.connection = sqlite3.connect(path, isolation_level=None, timeout=10)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS entities (
+            entity_id INTEGER PRIMARY KEY, category TEXT, name TEXT, ticker TEXT, has_image INTEGER,
+            last_seen REAL NOT NULL DEFAULT 0, seen_count INTEGER NOT NULL DEFAULT 0, refreshed_at REAL NOT NULL DEFAULT 0)''')
+        self.profiles = {}   # 实体ID -> EntityProfile
+        self._dirty = set()  # 出现记录尚未写入数据库的ID
+        if load:
+            self.load()
+
+    def prune(self):
+        """删除超过保留期既未出现也未解析过的实体 (包括只由 learn() 写入、从未出现在击杀中的舰船等名称)"""
+        self.flush()
+        cutoff = time.time() - self.retention_days * 86400
+        deleted = self.connection.execute(
+            'DELETE FROM entities WHERE MAX(last_seen, refreshed_at) < ?', (cutoff,)).rowcount
+        for entity_id in [i for i, p in self.profiles.items() if max(p.last_seen, p.refreshed_at) < cutoff]:
+            del self.profiles[entity_id]
+        return deleted
+
+    def load(self):
+        """清理过期实体并读取全部资料"""
+        deleted = self.prune()
+        self.profiles = {row[0]: EntityProfile.from_row(row)
+                         for row in self.connection.execute(f'SELECT {self.COLUMNS} FROM entities')}
+        named = sum(1 for profile in self.profiles.values() if profile.name)
+        logger.info(f"实体资料已加载: {len(self.profiles)}个, 已知名称 {named}, 清理 {deleted}")
+        return self
+
+    def get(self, entity_id):
+        return self.profiles.get(entity_id)
+
+    def _fetch(self, ids):
+        """从数据库读取内存中没有的实体 (其他进程写入的)"""
+        ids = list(ids)
+        for i in range(0, len(ids), 500):
+            batch = ids[i:i + 500]
+            rows = self.connection.execute(
+                f'SELECT {self.COLUMNS} FROM entities WHERE entity_id IN ({",".join("?" * len(batch))})', batch)
+            for row in rows:
+                self.profiles[row[0]] = EntityProfile.from_row(row)
+
+    def names(self, ids):
+        """已知的名称 {ID: 名称}，不访问网络"""
+        missing = [i for i in ids if i not in self.profiles]
+        if missing:
+            self._fetch(missing)
+        result = {}
+        for entity_id in ids:
+            profile = self.profiles.get(entity_id)
+            if profile is not None and profile.name:
+                result[entity_id] = profile.name
+        return result
+
+    def has_image(self, entity_id):
+        """True/False 为已确认，None 为未知"""
+        profile = self.profiles.get(entity_id)
+        return profile.has_image if profile is not None else None
+
+    def _profile(self, entity_id):
+        profile = self.profiles.get(entity_id)
+        if profile is None:
+            profile = self.profiles[entity_id] = EntityProfile(entity_id)
+        return profile
+
+    def _save(self, profiles):
+        """写入资料；与数据库中已有的合并，不会用空值或旧的出现记录覆盖其他进程写入的内容"""
+        self.connection.executemany(
+            f'INSERT INTO entities ({self.COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT(entity_id) DO UPDATE SET category = COALESCE(excluded.category, category), '
+            'name = COALESCE(excluded.name, name), ticker = COALESCE(excluded.ticker, ticker), '
+            'has_image = COALESCE(excluded.has_image, has_image), last_seen = MAX(last_seen, excluded.last_seen), '
+            'seen_count = MAX(seen_count, excluded.seen_count), refreshed_at = MAX(refreshed_at, excluded.refreshed_at)',
+            [profile.to_row() for profile in profiles])
+
+    def learn(self, names, categories=None):
+        """记录ESI名称解析结果: names {ID: 名称}, categories {ID: 类别}"""
+        now = time.time()
+        profiles = []
+        for entity_id, name in names.items():
+            profile = self._profile(entity_id)
+            profile.name = name
+            profile.category = (categories or {}).get(entity_id, profile.category)
+            profile.refreshed_at = now
+            profiles.append(profile)
+        if profiles:
+            self._save(profiles)
+
+    def seen(self, ids, when=None):
+        """记录实体出现，写入延迟到 flush()"""
+        when = when or time.time()
+        for entity_id in ids:
+            profile = self._profile(entity_id)
+            profile.last_seen = max(profile.last_seen, when)
+            profile.seen_count += 1
+            self._dirty.add(entity_id)
+
+    def __call__(self, killmail, zkb):
+        """作为击杀观察者: 记录击杀中出现的实体，用于预热"""
+        self.seen(killmail_entities(killmail))
+
+    def flush(self):
+        """写入出现记录"""
+        if not self._dirty:
+            return 0
+        profiles = [self.profiles[entity_id] for entity_id in self._dirty]
+        self._dirty = set()
+        self._save(profiles)
+        return len(profiles)
+
+    def stale(self, limit=100):
+        """需要补全或刷新的实体，最近出现的优先"""
+        now = time.time()
+        candidates = [profile for profile in self.profiles.values()
+                      if profile.seen_count and profile.needs_refresh(now, self.max_age)]
+        candidates.sort(key=lambda profile: profile.last_seen, reverse=True)
+        return candidates[:limit]
+
+    # ---------- 后台刷新 ----------
+
+    async def _esi(self, session, scheduler, method, url, **kwargs):
+        await scheduler.acquire(url, PRIORITY_PORTRAITS)
+        async with session.request(method, url, timeout=aiohttp.ClientTimeout(total=30), **kwargs) as response:
+            scheduler.record_response(url, response.status, response.headers)
+            if response.status == 404:
+                return None
+            response.raise_for_status()
+            return await response.json()
+
+    async def _resolve(self, session, scheduler, ids):
+        """批量解析名称；ESI 在任一ID无效时整批返回404，此时二分重试"""
+        results = await self._esi(session, scheduler, "POST", ESI_NAMES_URL, json=ids)
+        if results is None and len(ids) > 1:
+            half = len(ids) // 2
+            return await self._resolve(session, scheduler, ids[:half]) + await self._resolve(session, scheduler, ids[half:])
+        return results or []
+
+    async def refresh(self, get_session, scheduler, fetch_image=None, limit=100):
+        """
+        补全一批实体: 名称 (批量请求)、公司/联盟简称、头像/徽标。
+        fetch_image(url) 把图像下载到本地缓存，返回 True/False (存在/不存在)，无法确定时返回 None。
+        全部使用最低优先级，负载高时由调度器丢弃。返回处理的实体数。
+        """
+        profiles = self.stale(limit)
+        if not profiles:
+            return 0
+        session = await get_session()
+        now = time.time()
+        try:
+            refresh_names = [p.entity_id for p in profiles if p.name is None or now - p.refreshed_at > self.max_age]
+            if refresh_names:
+                results = await self._resolve(session, scheduler, refresh_names)
+                self.learn({obj['id']: obj['name'] for obj in results},
+                           {obj['id']: obj.get('category') for obj in results})
+                for entity_id in set(refresh_names) - {obj['id'] for obj in results}:
+                    # ESI不认识的ID (如NPC) 到期前不再请求
+                    self._profile(entity_id).refreshed_at = now
+
+            for profile in profiles:
+                if profile.category in TICKER_CATEGORIES and profile.ticker is None:
+                    data = await self._esi(session, scheduler, "GET", f"{ESI_BASE_URL}/{profile.category}s/{profile.entity_id}/")
+                    profile.ticker = (data or {}).get('ticker', "")
+                if fetch_image and profile.category in IMAGE_URLS and profile.has_image is None:
+                    profile.has_image = await fetch_image(IMAGE_URLS[profile.category].format(profile.entity_id))
+        finally:
+            self._save(profiles)
+        return len(profiles)
+
+    async def refresh_forever(self, get_session, scheduler, fetch_image=None, idle=None, interval=60, limit=100):
+        """后台定期写入出现记录，并在 idle() 为真时刷新一批实体；每天清理一次过期实体"""
+        pruned_at = time.time()
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.flush()
+                if time.time() - pruned_at >= 86400:
+                    pruned_at = time.time()
+                    deleted = self.prune()
+                    if deleted:
+                        logger.info(f"实体资料已清理 {deleted} 条过期记录")
+                if idle is None or idle():
+                    refreshed = await self.refresh(get_session, scheduler, fetch_image, limit)
+                    if refreshed:
+                        logger.debug(f"已刷新 {refreshed} 个实体资料")
+            except asyncio.CancelledError:
+                raise
+            except RequestShed:
+                pass  # 负载高时让出请求配额，下一轮再刷新
+            except Exception as e:
+                logger.warning(f"刷新实体资料失败: {e}")
+
+    def close(self):
+        try:
+            self.flush()
+            self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except sqlite3.Error:
+            pass
+        self.connection.close()
@@ -0,0 +1,126 @@
+# 受害者物品按槽位分组与合并
+
+# 槽位显示顺序，下标即槽位编号
+SLOT_ORDER = ["  高槽", "  中槽", "  低槽", "  改装件", "  子系统槽", "  无人机舱", "  货舱", "  燃料舱", "  舰船维护舱", "  舰队机库", "  其他槽位"]
+SLOT_OTHER = len(SLOT_ORDER) - 1
+
+ITEM_ROW_HEIGHT = 25    # 物品行高
+SLOT_HEADER_HEIGHT = 30  # 槽位标题行高
+
+
+def _build_flag_table():
+    """预先计算 flag -> 槽位编号 查找表"""
+    table = [SLOT_OTHER] * 256
+    ranges = [
+        (range(27, 35), 0),    # 高槽
+        (range(19, 27), 1),    # 中槽
+        (range(11, 19), 2),    # 低槽
+        (range(92, 100), 3),   # 改装件
+        (range(125, 133), 4),  # 子系统槽
+        ((87, 88), 5),         # 无人机舱
+        ((5,), 6),             # 货舱
+        ((133,), 7),           # 燃料舱
+        ((90,), 8),            # 舰船维护舱
+        ((155,), 9),           # 舰队机库
+    ]
+    for flags, slot in ranges:
+        for flag in flags:
+            table[flag] = slot
+    return tuple(table)
+
+
+SLOT_BY_FLAG = _build_flag_table()
+
+
+def slot_index(flag):
+    """根据flag获取槽位编号"""
+    if 0 <= flag < len(SLOT_BY_FLAG):
+        return SLOT_BY_FLAG[flag]
+    return SLOT_OTHER
+
+
+class ItemLine:
+    """合并后的一行物品：同一槽位、同一物品、同为子物品、同为掉落/摧毁的数量累加"""
+    __slots__ = ('slot', 'type_id', 'sub_item', 'dropped', 'quantity', 'name', 'value', 'order')
+
+    def __init__(self, slot, type_id, sub_item, dropped, order):
+        self.slot = slot
+        self.type_id = type_id
+        self.sub_item = sub_item
+        self.dropped = dropped
+        self.quantity = 0
+        self.name = None
+        self.value = 0.0
+        self.order = order
+
+    @property
+    def slot_name(self):
+        return SLOT_ORDER[self.slot]
+
+
+class ItemGroups:
+    """按槽位排好序的物品行，同时给出绘制所需的行数和高度"""
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.slots = []
+        for line in lines:
+            if not self.slots or self.slots[-1][0] != line.slot:
+                self.slots.append((line.slot, []))
+            self.slots[-1][1].append(line)
+
+    def type_ids(self):
+        return {line.type_id for line in self.lines if line.type_id}
+
+    def apply_names(self, names, default="Unknown Item"):
+        for line in self.lines:
+            line.name = names.get(line.type_id) or default
+
+    def apply_prices(self, price_index):
+        """按本地价格索引计算每行价值"""
+        for line in self.lines:
+            line.value = price_index.price(line.type_id) * line.quantity if line.type_id else 0.0
+
+    def slot_value(self, slot):
+        return sum(line.value for slot_, lines in self.slots if slot_ == slot for line in lines)
+
+    def top_drops(self, n=5):
+        """价值最高的掉落物品"""
+        dropped = [line for line in self.lines if line.dropped and line.value > 0]
+        return sorted(dropped, key=lambda l: l.value, reverse=True)[:n]
+
+    @property
+    def row_count(self):
+        return len(self.lines)
+
+    @property
+    def height(self):
+        """全部物品行和槽位标题的总高度"""
+        return len(self.lines) * ITEM_ROW_HEIGHT + len(self.slots) * SLOT_HEADER_HEIGHT
+
+
+def aggregate_items(items):
+    """
+    单次遍历受害者物品 (含容器内子物品)，按 (槽位, typeID, 子物品, 掉落/摧毁) 累加数量。
+    同一物品的摧毁行排在掉落行之前，物品按首次出现的顺序排列。
+    """
+    lines = {}
+    first_seen = {}
+
+    def add(slot, item, sub_item):
+        base = (slot, item.type_id, sub_item)
+        order = first_seen.setdefault(base, len(first_seen))
+        for dropped, qty in ((False, item.qty_destroyed), (True, item.qty_dropped)):
+            if qty > 0:
+                line = lines.get(base + (dropped,))
+                if line is None:
+                    line = lines[base + (dropped,)] = ItemLine(slot, item.type_id, sub_item, dropped, order)
+                line.quantity += qty
+
+    for itm in items:
+        slot = slot_index(itm.flag)
+        add(slot, itm, False)
+        for sub_item in itm.items:
+            add(slot, sub_item, True)
+
+    return ItemGroups(sorted(lines.values(), key=lambda l: (l.slot, l.order, l.dropped)))
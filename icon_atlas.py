@@ -0,0 +1,164 @@
+import os
+import re
+import mmap
+import sys
+import json
+import time
+import bisect
+import logging
+from array import array
+from PIL import Image
+
+from include import SDE_ICONS_DIR, ATLAS_DIR, ATLAS_SIZES
+
+logger = logging.getLogger("eve_monitor")
+
+# 图集文件布局:
+#   atlas_index.bin   已排序的 typeID 数组 (uint32)，数组下标即图标在图集中的槽位
+#   atlas_{size}.rgba 每个尺寸一个文件，按槽位顺序连续存放 size*size*4 字节的 RGBA 像素
+#   atlas_meta.json   尺寸列表、图标数量、构建时间
+INDEX_FILE = "atlas_index.bin"
+META_FILE = "atlas_meta.json"
+ICON_FILE_RE = re.compile(r'^(\d+)_(\d+)\.png$')
+
+
+def atlas_file(atlas_dir, size):
+    return os.path.join(atlas_dir, f"atlas_{size}.rgba")
+
+
+def scan_icon_dir(icon_dir=SDE_ICONS_DIR):
+    """扫描图标目录，返回 {typeID: {尺寸: 文件路径}}"""
+    sources = {}
+    with os.scandir(icon_dir) as entries:
+        for entry in entries:
+            match = ICON_FILE_RE.match(entry.name)
+            if not match or not entry.is_file():
+                continue
+            type_id, size = int(match.group(1)), int(match.group(2))
+            sources.setdefault(type_id, {})[size] = entry.path
+    return sources
+
+
+def pick_source(available, size):
+    """选择用于生成目标尺寸的源图：优先不小于目标的最小尺寸，否则取最大尺寸"""
+    larger = [s for s in available if s >= size]
+    return available[min(larger)] if larger else available[max(available)]
+
+
+def build_atlases(icon_dir=SDE_ICONS_DIR, atlas_dir=ATLAS_DIR, sizes=ATLAS_SIZES):
+    """把图标目录下的所有物品图标按绘制尺寸打包成图集文件"""
+    start = time.perf_counter()
+    sources = scan_icon_dir(icon_dir)
+    type_ids = sorted(sources)
+    os.makedirs(atlas_dir, exist_ok=True)
+
+    # 先写入临时文件，全部完成后再替换，避免运行中的进程读到半成品
+    outputs = {size: open(atlas_file(atlas_dir, size) + ".tmp", "wb") for size in sizes}
+    blank = {size: bytes(size * size * 4) for size in sizes}
+    failed = 0
+    try:
+        for type_id in type_ids:
+            available = sources[type_id]
+            decoded = {}
+            for size in sizes:
+                path = pick_source(available, size)
+                try:
+                    if path not in decoded:
+                        with Image.open(path) as img:
+                            decoded[path] = img.convert("RGBA")
+                    icon = decoded[path]
+                    if icon.size != (size, size):
+                        icon = icon.resize((size, size), Image.LANCZOS)
+                    outputs[size].write(icon.tobytes())
+                except Exception as e:
+                    # 保持槽位对齐，损坏的图标写入透明像素
+                    logger.error(f"打包图标 {path} 失败: {e}")
+                    outputs[size].write(blank[size])
+                    failed += 1
+    finally:
+        for f in outputs.values():
+            f.close()
+
+    with open(os.path.join(atlas_dir, INDEX_FILE) + ".tmp", "wb") as f:
+        array('I', type_ids).tofile(f)
+    for size in sizes:
+        os.replace(atlas_file(atlas_dir, size) + ".tmp", atlas_file(atlas_dir, size))
+    os.replace(os.path.join(atlas_dir, INDEX_FILE) + ".tmp", os.path.join(atlas_dir, INDEX_FILE))
+
+    meta = {'sizes': list(sizes), 'count': len(type_ids), 'built_at': int(time.time())}
+    with open(os.path.join(atlas_dir, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+    elapsed = time.perf_counter() - start
+    logger.info(f"图集构建完成: {len(type_ids)}个图标, 尺寸 {list(sizes)}, 失败 {failed}, 耗时 {elapsed:.1f}秒")
+    return meta
+
+
+class IconAtlas:
+    """内存映射的图标图集，查询结果直接引用已解码的像素缓冲区"""
+
+    def __init__(self, atlas_dir=ATLAS_DIR):
+        self.atlas_dir = atlas_dir
+        self.type_ids = None
+        self.sizes = ()
+        self._maps = {}
+        self._loaded = False
+
+    def _load(self):
+        """首次使用时读取索引，图集文件不存在时视为空图集"""
+        self._loaded = True
+        try:
+            with open(os.path.join(self.atlas_dir, META_FILE), encoding="utf-8") as f:
+                meta = json.load(f)
+            index = array('I')
+            with open(os.path.join(self.atlas_dir, INDEX_FILE), "rb") as f:
+                index.frombytes(f.read())
+        except FileNotFoundError:
+            logger.info(f"未找到图标图集 {self.atlas_dir}，使用单文件图标")
+            return
+        except Exception as e:
+            logger.error(f"读取图标图集索引失败: {e}")
+            return
+        self.type_ids = index
+        self.sizes = tuple(meta.get('sizes', ()))
+
+    def _map(self, size):
+        mm = self._maps.get(size)
+        if mm is None:
+            with open(atlas_file(self.atlas_dir, size), "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[size] = mm
+        return mm
+
+    def get(self, type_id, size):
+        """返回指定尺寸的RGBA图标，图集中没有时返回None"""
+        if not self._loaded:
+            self._load()
+        if not self.type_ids or size not in self.sizes:
+            return None
+        slot = bisect.bisect_left(self.type_ids, int(type_id))
+        if slot >= len(self.type_ids) or self.type_ids[slot] != int(type_id):
+            return None
+        cell = size * size * 4
+        try:
+            buf = memoryview(self._map(size))[slot * cell:(slot + 1) * cell]
+            return Image.frombuffer("RGBA", (size, size), buf, "raw", "RGBA", 0, 1)
+        except Exception as e:
+            logger.error(f"读取图集图标失败 (ID: {type_id}, 尺寸: {size}): {e}")
+            return None
+
+    def close(self):
+        # 仍被图像引用的映射由垃圾回收关闭
+        for mm in self._maps.values():
+            try:
+                mm.close()
+            except BufferError:
+                pass
+        self._maps = {}
+
+
+# 构建图集
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    icon_dir = sys.argv[1] if len(sys.argv) > 1 else SDE_ICONS_DIR
+    build_atlases(icon_dir)
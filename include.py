@@ -1,5 +1,7 @@
 from PIL import ImageFont, Image
 import os
+import time
+from startup import startup_profile
 
 # 1. zKillboard RedisQ 队列ID
 #    请访问 https://zkillboard.com/api/redisq/ 并登录，获取你自己的 personal queueID
@@ -21,28 +23,127 @@ vips = [
 #    只有当击杀报告的总价值超过这个数值时，程序才会生成图片（除非涉及VIP或官员）
 ISK_THRESHOLD = 1000000000  # 当前设置为 1b ISK (10亿)
 
+# 5. 击杀接收
+QUEUE_IDS = [QUEUE_ID]  # 可填写多个RedisQ队列ID
+REDISQ_TTW = 10         # 长轮询服务端等待秒数 (1-10)，越大空闲时请求越少，不影响延迟
+REDISQ_CONSUMERS = 2    # 每个队列并行的长轮询数，保证一个请求返回后另一个已在等待
+INGEST_REORDER_WINDOW = 0  # 秒；>0 时在窗口内按击杀ID排序后再处理，会增加相应延迟
+ZKB_WEBSOCKET = False   # 同时订阅 zKillboard websocket 击杀流
+
+# 6. 出站请求限速 (每秒请求数, 突发容量)，未列出的主机使用默认值
+HOST_RATE_LIMITS = {
+    "esi.evetech.net": (20, 40),
+    "images.evetech.net": (30, 60),
+    "zkillredisq.stream": (10, 10),
+    "zkillboard.com": (1, 2),
+    "sde.jita.space": (5, 10),
+}
+
+# 7. 多进程分片 (0 表示单进程运行；N>0 时主进程只负责接收和分发，N个工作进程负责丰富和渲染)
+WORKER_COUNT = 0
+WORKER_QUEUE_SIZE = 50        # 每个工作进程的最大积压击杀数
+COMPLETE_CONCURRENCY = 8      # 协调器同时从ESI获取完整击杀的数量
+DB_MMAP_SIZE = 256 * 1024 * 1024  # items.db 只读连接的 mmap 大小，多个进程共享同一份页缓存
+DB_POOL_SIZE = 4              # items.db 只读连接池大小，与线程数无关
+
+# 8. 输出格式 (每种输出单独开关和配置，共用同一次丰富结果)
+OUTPUT_LAYOUTS = {
+    "full": {"enabled": True},                      # 完整击杀图 (700px)
+    "thumbnail": {"enabled": False, "width": 360},  # 预览小图
+    "fit_card": {"enabled": False, "width": 420},   # 仅装备的卡片
+    "text": {"enabled": False},                     # 纯文本摘要 (.txt)
+    "json": {"enabled": False},                     # JSON摘要 (.json)
+}
+
+# 9. 本地查询服务 (route / distance / kill)，与击杀监控同进程运行
+QUERY_SERVER_ENABLED = False
+QUERY_HOST = "127.0.0.1"
+QUERY_PORT = 8765
+QUERY_CONCURRENCY = {"route": 2, "distance": 16, "kill": 4, "jump": 16}            # 各命令并发上限
+QUERY_CACHE_TTL = {"route": 3600, "distance": 86400, "kill": 600, "jump": 86400}   # 各命令结果缓存秒数
+ROUTE_CACHE_TTL = 7 * 86400      # 跳跃路线缓存有效期 (秒)，星图很少变化
+ROUTE_CACHE_SIZE = 2048          # 最多缓存的路线条数
+ROUTE_HUBS = ["4-HWWF", "耶舒尔", "Aeschee", "Onne"]  # 启动时预先计算这些星系之间的路线
+ROUTE_WARM_SHIPS = [("Archon", "555"), ("Rorqual", "555")]  # 预热的 (舰船, 技能)，技能依次为 校对/燃料节约/跳货
+ROUTE_WARM_INTERVAL = 6 * 3600   # 定期刷新即将过期的预热路线 (秒)
+
+# 10. 附近击杀提醒: 关注星系附近的任何击杀都提醒，不受 ISK_THRESHOLD 限制
+PROXIMITY_ALERTS_ENABLED = False
+PROXIMITY_SYSTEMS = None   # 关注星系名称列表，None 表示使用 calc_dist.WATCHED_SYSTEMS
+PROXIMITY_LY = 6.0         # 光年范围
+PROXIMITY_GATE_JUMPS = 3   # 星门跳数范围 (需要 sde/mapSolarSystemJumps.csv)，0 表示只按光年
+
+# 11. 积压时自动降级: 完整渲染 -> 无头像 -> 仅文本 -> 仅记录，负载回落后自动恢复
+DEGRADE_ENABLED = True
+DEGRADE_THRESHOLDS = [(20, 60), (50, 180), (150, 600)]  # 进入各降级档的 (积压击杀数, 延迟秒)，任一达到即降级
+DEGRADE_HOLD = 60  # 负载回落后保持多少秒再恢复一档
+
 # ==============================================================================
 #                            路径与样式配置 (通常无需修改)
 # ==============================================================================
 
 # 1. 字体文件路径 (需要保证 "fonts" 文件夹和字体文件存在)
 
+class LazyFont:
+    """首次绘制时才加载的字体，导入本模块时不读取字体文件"""
+
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self._font = None
+
+    def load(self):
+        if self._font is None:
+            start = time.perf_counter()
+            self._font = ImageFont.truetype(self.path, self.size)
+            startup_profile.record(f"font:{os.path.basename(self.path)}:{self.size}", time.perf_counter() - start)
+        return self._font
+
+    def __getattr__(self, name):
+        # ImageDraw 只调用 getmask2/getlength/getbbox 等方法，按需转发给真实字体
+        return getattr(self.load(), name)
+
 BOLD_PATH = "fonts/OPPOSans-Bold.ttf"
 MEDIUM_PATH = "fonts/OPPOSans-Medium.ttf"
 TEXT_PATH = "fonts/OPPOSans-Regular.ttf"
 YAHEI_PATH = "fonts/yahei.ttf"
-NAME_FONT = ImageFont.truetype(BOLD_PATH, 20)
-SHIP_FONT = ImageFont.truetype(MEDIUM_PATH, 20)
-TEXT_FONT = ImageFont.truetype(MEDIUM_PATH, 16)
-SMALL_FONT = ImageFont.truetype(MEDIUM_PATH, 14)
-ICON_FONT = ImageFont.truetype(TEXT_PATH, 14)
-ICONY_FONT = ImageFont.truetype(YAHEI_PATH, 16)
-SUBTITLE_FONT = ImageFont.truetype(MEDIUM_PATH, 18)
-SUBTITLEY_FONT = ImageFont.truetype(YAHEI_PATH, 18)
+NAME_FONT = LazyFont(BOLD_PATH, 20)
+SHIP_FONT = LazyFont(MEDIUM_PATH, 20)
+TEXT_FONT = LazyFont(MEDIUM_PATH, 16)
+SMALL_FONT = LazyFont(MEDIUM_PATH, 14)
+ICON_FONT = LazyFont(TEXT_PATH, 14)
+ICONY_FONT = LazyFont(YAHEI_PATH, 16)
+SUBTITLE_FONT = LazyFont(MEDIUM_PATH, 18)
+SUBTITLEY_FONT = LazyFont(YAHEI_PATH, 18)
+FONT_FALLBACKS = [YAHEI_PATH, MEDIUM_PATH] # 字体缺字时依次尝试的后备字体
+TEXT_CACHE_BYTES = 16 * 1024 * 1024 # 文字位图缓存上限 (灰度位图总像素数)
+TEXT_CACHE_ENTRIES = 65536          # 文字宽度/字体切分/字形覆盖缓存各自的条目上限
 
 # 2. EVE SDE 静态数据路径 (需要保证 "sde" 文件夹和数据存在)
 SDE_DIR = "sde"
 SDE_ICONS_DIR = os.path.join(SDE_DIR, 'Types') # 图标缓存目录
+ATLAS_DIR = os.path.join(SDE_DIR, 'atlas') # 图标图集目录 (python icon_atlas.py 生成)
+ATLAS_SIZES = (24, 40, 64, 80, 128) # 图集包含的绘制尺寸
+IMAGE_MEMORY_CACHE = 512 # 内存中保留的已解码头像/徽标/图标数量
+IMAGE_MEMORY_TTL = 3600 # 已解码图像在内存中的有效期 (秒)，过期后重新读取本地缓存
+SNAPSHOT_DIR = os.path.join(SDE_DIR, 'snapshots') # SDE表解析结果的二进制快照
+PRICE_SNAPSHOT = os.path.join(SDE_DIR, 'prices.json') # 市场价格快照 (ESI /markets/prices/)
+PRICE_REFRESH_INTERVAL = 6 * 3600 # 价格快照刷新间隔 (秒)
+STATS_DIR = 'stats' # 击杀统计数据 (按天分桶)
+ROUTE_CACHE_FILE = os.path.join('cache', 'routes.marshal') # 跳跃路线缓存
+PROFILE_DIR = 'profiles' # 性能剖析/内存快照/阻塞调用栈输出目录
+PROFILE_BLOCKING_MS = 200 # 事件循环超过该毫秒数无响应时记录调用栈
+JOURNAL_ENABLED = True # 击杀处理日志: 重启后继续未完成的击杀，已发送的击杀不再重复输出
+JOURNAL_PATH = 'journal.db'
+JOURNAL_RETENTION_DAYS = 7 # 已完成记录的保留天数 (去重范围)
+JOURNAL_MAX_ATTEMPTS = 3 # 未完成的击杀最多随重启恢复几次，超过后标记为失败
+ENTITY_STORE_ENABLED = True # 实体资料库: 常见角色/公司/联盟的名称和图像在后台刷新，渲染时不等待网络
+ENTITY_DB_PATH = 'entities.db'
+ENTITY_MAX_AGE = 7 * 86400 # 名称和简称的刷新间隔 (秒)
+ENTITY_RETENTION_DAYS = 90 # 超过该天数未出现的实体从资料库删除
+ENTITY_REFRESH_INTERVAL = 60 # 后台刷新检查间隔 (秒)，有积压时跳过
+ENTITY_REFRESH_BATCH = 100 # 每轮最多刷新的实体数
+STATS_RETENTION_DAYS = 90 # 统计数据保留天数
 
 WHITE = (255,255,255)
 GREEN = (34,139,34)
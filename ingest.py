@@ -0,0 +1,189 @@
+import json
+import time
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+import aiohttp
+
+from models import Killmail, Zkb, loads
+from scheduler import PRIORITY_KILLMAIL
+
+logger = logging.getLogger("eve_monitor")
+
+REDISQ_URL = "https://zkillredisq.stream/listen.php"
+ZKB_WEBSOCKET_URL = "wss://zkillboard.com/websocket/"
+
+
+class KillSource(ABC):
+    """击杀来源接口：run() 持续运行，每收到一个击杀调用一次 emit(Killmail, Zkb, 来源名)"""
+
+    name = "source"
+
+    @abstractmethod
+    async def run(self, emit):
+        """持续接收击杀，出错时自行重试，只在被取消时返回"""
+
+
+class RedisQSource(KillSource):
+    """RedisQ 长轮询来源，请求之间不做空闲等待，等待时间完全由服务端 ttw 决定"""
+
+    def __init__(self, queue_id, get_session, scheduler, headers=None, ttw=10, consumer=0):
+        self.queue_id = queue_id
+        self.get_session = get_session
+        self.scheduler = scheduler
+        self.headers = headers or {}
+        self.ttw = max(1, min(10, int(ttw)))
+        self.name = f"redisq:{queue_id}#{consumer}"
+
+    async def run(self, emit):
+        url = REDISQ_URL
+        params = {'queueID': self.queue_id, 'ttw': self.ttw}
+        # 单次请求超时需大于服务端等待时间
+        timeout = aiohttp.ClientTimeout(total=self.ttw + 20)
+        while True:
+            try:
+                await self.scheduler.acquire(url, PRIORITY_KILLMAIL)
+                session = await self.get_session()
+                async with session.get(url, params=params, headers=self.headers, timeout=timeout) as response:
+                    self.scheduler.record_response(url, response.status, response.headers)
+                    if response.status != 200:
+                        logger.warning(f"{self.name} 返回非200状态码: {response.status}")
+                        self.scheduler.record_failure(url)
+                        continue
+                    data = loads(await response.read())
+                package = (data or {}).get("package")
+                if package:
+                    # 新版RedisQ只推送killID和zkb，完整击杀由处理流程从ESI获取
+                    killmail = package.get("killmail") or {'killmail_id': package.get("killID")}
+                    await emit(Killmail.from_esi(killmail), Zkb.from_dict(package.get("zkb")), self.name)
+            except asyncio.CancelledError:
+                raise
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.error(f"{self.name} 长轮询失败: {e}")
+                self.scheduler.record_failure(url)
+            except Exception as e:
+                logger.error(f"{self.name} 处理响应失败: {e}")
+                self.scheduler.record_failure(url)
+
+
+class WebSocketSource(KillSource):
+    """zKillboard websocket 击杀流，作为RedisQ之外的推送来源"""
+
+    def __init__(self, get_session, url=ZKB_WEBSOCKET_URL, channel="killstream", heartbeat=30):
+        self.get_session = get_session
+        self.url = url
+        self.channel = channel
+        self.heartbeat = heartbeat
+        self.name = f"websocket:{channel}"
+
+    async def run(self, emit):
+        failures = 0
+        while True:
+            try:
+                session = await self.get_session()
+                async with session.ws_connect(self.url, heartbeat=self.heartbeat) as ws:
+                    await ws.send_str(json.dumps({"action": "sub", "channel": self.channel}))
+                    logger.info(f"{self.name} 已订阅")
+                    failures = 0
+                    async for msg in ws:
+                        if msg.type != aiohttp.WSMsgType.TEXT:
+                            if msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                                break
+                            continue
+                        data = loads(msg.data)
+                        # 击杀流消息本身就是ESI击杀，zkb字段内嵌其中
+                        if isinstance(data, dict) and data.get('killmail_id'):
+                            killmail = Killmail.from_esi(data)
+                            await emit(killmail, killmail.zkb, self.name)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"{self.name} 连接失败: {e}")
+            failures += 1
+            await asyncio.sleep(min(60, 2 ** failures))
+
+
+class KillIngestor:
+    """
+    汇总多个来源 (多个RedisQ队列、每队列多个并行长轮询、websocket)，
+    按killmail_id去重后放入同一个队列，按到达顺序交给处理流程。
+    reorder_window > 0 时，在窗口内收到的击杀按killmail_id排序后再交出。
+    """
+
+    def __init__(self, sources, maxsize=1000, dedup_size=5000, reorder_window=0):
+        self.sources = sources
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.dedup_size = dedup_size
+        self.reorder_window = reorder_window
+        self._seen = OrderedDict()
+        self._pending = []
+        self._tasks = []
+        self.duplicates = 0
+
+    async def _emit(self, killmail, zkb, source):
+        kill_id = killmail.killmail_id if killmail else None
+        if not kill_id or not zkb:
+            return
+        if kill_id in self._seen:
+            self.duplicates += 1
+            logger.debug(f"重复击杀 {kill_id} (来自 {source})，忽略")
+            return
+        self._seen[kill_id] = source
+        if len(self._seen) > self.dedup_size:
+            self._seen.popitem(last=False)
+        await self.queue.put((killmail, zkb, time.monotonic()))
+
+    def start(self):
+        for source in self.sources:
+            self._tasks.append(asyncio.create_task(self._run_source(source), name=source.name))
+        logger.info(f"击杀接收已启动: {', '.join(s.name for s in self.sources)}")
+
+    async def _run_source(self, source):
+        try:
+            await source.run(self._emit)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"击杀来源 {source.name} 异常退出: {e}")
+
+    async def get(self):
+        """取出下一个击杀，返回 (killmail, zkb, 接收时间)"""
+        if self._pending:
+            return self._pending.pop(0)
+        item = await self.queue.get()
+        if self.reorder_window <= 0:
+            return item
+
+        # 在窗口内收集并行消费者返回的击杀，按ID排序
+        batch = [item]
+        deadline = time.monotonic() + self.reorder_window
+        while (remaining := deadline - time.monotonic()) > 0:
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        batch.sort(key=lambda entry: entry[0].killmail_id)
+        self._pending = batch[1:]
+        return batch[0]
+
+    def qsize(self):
+        return self.queue.qsize() + len(self._pending)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+def build_kill_sources(get_session, scheduler, headers, queue_ids, ttw=10, consumers=1, websocket=False):
+    """根据配置创建击杀来源列表"""
+    sources = []
+    for queue_id in queue_ids:
+        for consumer in range(max(1, consumers)):
+            sources.append(RedisQSource(queue_id, get_session, scheduler, headers, ttw, consumer))
+    if websocket:
+        sources.append(WebSocketSource(get_session))
+    return sources
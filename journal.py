@@ -0,0 +1,134 @@
+import time
+import asyncio
+import pickle
+import sqlite3
+import logging
+
+logger = logging.getLogger("eve_monitor")
+
+# 击杀处理状态，只能向前推进
+RECEIVED = 0    # 已从接收端取出
+ENRICHED = 1    # 已获取ESI详情并解析名称
+RENDERED = 2    # 输出文件已生成
+DELIVERED = 3   # 已发送 (输出已打印给下游)
+SKIPPED = 4     # 未通过过滤或降级为仅记录，无需输出
+FAILED = 5      # 处理失败 (如ESI不可用)，不再重试
+
+FINISHED = (DELIVERED, SKIPPED, FAILED)
+STATE_NAMES = {RECEIVED: "已接收", ENRICHED: "已丰富", RENDERED: "已渲染", DELIVERED: "已发送", SKIPPED: "已跳过", FAILED: "失败"}
+
+
+class KillJournal:
+    """
+    击杀处理日志 (SQLite WAL)。接收时写入击杀和zkb数据，之后逐步推进状态；
+    进程在处理中途退出时，重启后 pending() 返回未完成的击杀重新处理；
+    每次恢复计一次尝试，超过 max_attempts 次仍未完成的击杀 (如每次都让进程崩溃) 标记为失败，
+    已记录的击杀ID常驻内存，重复的击杀 (含重启后重放) 直接丢弃。
+    WAL + synchronous=NORMAL 下每次提交只追加WAL，不等待fsync，进程崩溃不丢数据。
+    """
+
+    def __init__(self, path="journal.db", retention_days=7, load=True, max_attempts=3):
+        self.path = path
+        self.retention_days = retention_days
+        self.max_attempts = max_attempts
+        self.connection = sqlite3.connect(path, isolation_level=None, timeout=10)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS kills (
+            killmail_id INTEGER PRIMARY KEY, state INTEGER NOT NULL,
+            received_at REAL NOT NULL, updated_at REAL NOT NULL, payload BLOB,
+            attempts INTEGER NOT NULL DEFAULT 0)''')
+        columns = {row[1] for row in self.connection.execute('PRAGMA table_info(kills)')}
+        if 'attempts' not in columns:
+            self.connection.execute('ALTER TABLE kills ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS kills_state ON kills (state) WHERE payload IS NOT NULL')
+        self.loaded = load
+        self.states = {}  # 击杀ID -> 状态，工作进程只推进状态时不加载
+        if load:
+            self.prune()
+            unfinished = sum(1 for state in self.states.values() if state not in FINISHED)
+            logger.info(f"处理日志已加载: {len(self.states)}个击杀, 未完成 {unfinished}")
+
+    def __contains__(self, killmail_id):
+        return killmail_id in self.states
+
+    def state(self, killmail_id):
+        return self.states.get(killmail_id)
+
+    def record(self, killmail, zkb):
+        """记录新接收的击杀；已记录过的返回 False (重复)"""
+        killmail_id = killmail.killmail_id
+        if killmail_id in self.states:
+            return False
+        now = time.time()
+        payload = pickle.dumps((killmail, zkb), pickle.HIGHEST_PROTOCOL)
+        self.connection.execute(
+            'INSERT OR IGNORE INTO kills (killmail_id, state, received_at, updated_at, payload) VALUES (?, ?, ?, ?, ?)',
+            (killmail_id, RECEIVED, now, now, payload))
+        self.states[killmail_id] = RECEIVED
+        return True
+
+    def advance(self, killmail_id, state):
+        """推进状态 (不会回退，已完成的不再改变)；完成后删除击杀数据，只保留ID用于去重"""
+        current = self.states.get(killmail_id, -1)
+        if not killmail_id or current >= state or current in FINISHED:
+            return
+        payload = ", payload = NULL" if state in FINISHED else ""
+        self.connection.execute(
+            f'UPDATE kills SET state = ?, updated_at = ?{payload} WHERE killmail_id = ? AND state < ? '
+            f'AND state NOT IN ({",".join("?" * len(FINISHED))})',
+            (state, time.time(), killmail_id, state, *FINISHED))
+        if self.loaded:
+            self.states[killmail_id] = state
+
+    def pending(self):
+        """
+        上次退出时未完成的击杀: [(killmail, zkb, 状态), ...]，按击杀ID排序。
+        返回前先记一次尝试，已恢复 max_attempts 次仍未完成的击杀标记为失败，不再返回。
+        """
+        rows = self.connection.execute(
+            f'SELECT killmail_id, state, payload, attempts FROM kills WHERE state NOT IN ({",".join("?" * len(FINISHED))}) '
+            'AND payload IS NOT NULL ORDER BY killmail_id', FINISHED).fetchall()
+        pending = []
+        for killmail_id, state, payload, attempts in rows:
+            if attempts >= self.max_attempts:
+                logger.error(f"处理日志中的击杀 {killmail_id} 已恢复 {attempts} 次仍未完成，标记为失败")
+                self.advance(killmail_id, FAILED)
+                continue
+            try:
+                killmail, zkb = pickle.loads(payload)
+                pending.append((killmail, zkb, state))
+            except Exception as e:
+                logger.error(f"处理日志中的击杀 {killmail_id} 无法恢复: {e}")
+                self.advance(killmail_id, FAILED)
+        # 先提交尝试次数再处理，处理时进程崩溃也会计入
+        self.connection.executemany('UPDATE kills SET attempts = attempts + 1 WHERE killmail_id = ?',
+                                    [(killmail.killmail_id,) for killmail, _, _ in pending])
+        return pending
+
+    def prune(self):
+        """删除超过保留期的已完成记录，并重新读取内存中的ID集合"""
+        cutoff = time.time() - self.retention_days * 86400
+        deleted = self.connection.execute(
+            f'DELETE FROM kills WHERE received_at < ? AND state IN ({",".join("?" * len(FINISHED))})',
+            (cutoff, *FINISHED)).rowcount
+        if self.loaded:
+            self.states = dict(self.connection.execute('SELECT killmail_id, state FROM kills'))
+        return deleted
+
+    async def prune_forever(self, interval=86400):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                deleted = self.prune()
+                if deleted:
+                    logger.info(f"处理日志已清理 {deleted} 条过期记录")
+            except Exception as e:
+                logger.error(f"清理处理日志失败: {e}")
+
+    def close(self):
+        try:
+            self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except sqlite3.Error:
+            pass
+        self.connection.close()
@@ -0,0 +1,270 @@
+import os
+import re
+import sys
+import json
+import math
+import sqlite3
+import logging
+from array import array
+from itertools import accumulate
+
+from include import SDE_DIR, SNAPSHOT_DIR
+from startup import load_snapshot
+
+logger = logging.getLogger("eve_monitor")
+
+TYPE_DOGMA_YAML = os.path.join(SDE_DIR, 'fsd', 'typeDogma.yaml')
+
+# dogma 属性ID
+ATTR_JUMP_FUEL_TYPE = 866       # jumpDriveConsumptionType 燃料物品ID
+ATTR_JUMP_RANGE = 867           # jumpDriveRange 基础跳跃距离 (ly)
+ATTR_JUMP_FUEL = 868            # jumpDriveConsumptionAmount 每光年燃料
+ATTR_FATIGUE_MULTIPLIER = 1971  # jumpFatigueMultiplier 疲劳距离系数 (跳货/长须鲸为 0.1)
+
+# 跳跃疲劳规则 (分钟)
+FATIGUE_FLOOR = 10      # 计算新疲劳时的下限
+FATIGUE_CAP = 300       # 疲劳上限 5 小时
+COOLDOWN_CAP = 30       # 跳跃冷却上限
+
+JUMP_FREIGHTER_GROUP = 902
+
+# SDE 不存在时使用的内置表: 舰船 -> (基础跳跃距离ly, 每光年燃料, 疲劳系数)
+JUMP_SHIPS = {
+    # 航母 / 无畏 / 战力辅助舰
+    "Archon": (3.5, 3000, 1.0), "Chimera": (3.5, 3000, 1.0), "Thanatos": (3.5, 3000, 1.0), "Nidhoggur": (3.5, 3000, 1.0),
+    "Revelation": (3.5, 3000, 1.0), "Phoenix": (3.5, 3000, 1.0), "Moros": (3.5, 3000, 1.0), "Naglfar": (3.5, 3000, 1.0),
+    "Apostle": (3.5, 3000, 1.0), "Minokawa": (3.5, 3000, 1.0), "Ninazu": (3.5, 3000, 1.0), "Lif": (3.5, 3000, 1.0),
+    # 超级航母 / 泰坦
+    "Aeon": (3.0, 3000, 1.0), "Wyvern": (3.0, 3000, 1.0), "Nyx": (3.0, 3000, 1.0), "Hel": (3.0, 3000, 1.0),
+    "Avatar": (3.0, 3000, 1.0), "Leviathan": (3.0, 3000, 1.0), "Erebus": (3.0, 3000, 1.0), "Ragnarok": (3.0, 3000, 1.0),
+    # 工业旗舰 / 跳货
+    "Rorqual": (5.0, 4000, 0.1),
+    "Ark": (5.0, 10000, 0.1), "Rhea": (5.0, 10000, 0.1), "Anshar": (5.0, 10000, 0.1), "Nomad": (5.0, 10000, 0.1),
+}
+JUMP_FREIGHTERS = frozenset(["ark", "rhea", "anshar", "nomad"])
+
+# 不依赖缩进宽度和换行符 (SDE 有 CRLF 版本)
+_ATTRIBUTE = re.compile(rb'-\s+attributeID:\s*(\d+)\s+value:\s*([-\d.eE+]+)')
+_JUMP_RANGE_MARKER = re.compile(rb'attributeID:\s*%d\r?\n' % ATTR_JUMP_RANGE)
+
+
+class JumpHull:
+    """一种舰船的跳跃参数 (未计技能)"""
+    __slots__ = ('type_id', 'name', 'base_range', 'fuel_per_ly', 'fuel_type_id', 'fatigue_multiplier', 'jump_freighter')
+
+    def __init__(self, type_id, name, base_range, fuel_per_ly, fuel_type_id=0, fatigue_multiplier=1.0, jump_freighter=False):
+        self.type_id = type_id
+        self.name = name
+        self.base_range = base_range
+        self.fuel_per_ly = fuel_per_ly
+        self.fuel_type_id = fuel_type_id
+        self.fatigue_multiplier = fatigue_multiplier
+        self.jump_freighter = jump_freighter
+
+    def configure(self, skills="555"):
+        """按 dotlan 风格的技能串 (跳跃校对/燃料节约/跳货，如 "544") 生成跳跃配置"""
+        calibration, conservation, freighter = [int(c) for c in str(skills).ljust(3, "0")[:3]]
+        fuel = self.fuel_per_ly * (1 - 0.1 * conservation)
+        if self.jump_freighter:
+            fuel *= 1 - 0.1 * freighter
+        return JumpConfig(self, str(skills), self.base_range * (1 + 0.2 * calibration), fuel)
+
+
+class JumpConfig:
+    """舰船 + 技能后的实际跳跃距离和每光年燃料"""
+    __slots__ = ('hull', 'skills', 'range_ly', 'fuel_per_ly')
+
+    def __init__(self, hull, skills, range_ly, fuel_per_ly):
+        self.hull = hull
+        self.skills = skills
+        self.range_ly = range_ly
+        self.fuel_per_ly = fuel_per_ly
+
+    @property
+    def label(self):
+        return f"{self.hull.name} {self.skills}"
+
+
+def _parse_dogma(dogma_path):
+    """从 typeDogma.yaml 中只取带跳跃引擎属性的物品: typeID -> {属性ID: 值}"""
+    from sde_update import iter_type_chunks
+    marker = str(ATTR_JUMP_RANGE).encode()
+    wanted = {ATTR_JUMP_FUEL_TYPE, ATTR_JUMP_RANGE, ATTR_JUMP_FUEL, ATTR_FATIGUE_MULTIPLIER}
+    hulls = {}
+    for type_id, chunk in iter_type_chunks(dogma_path):
+        # 绝大部分物品没有跳跃引擎，先做字节查找再解析
+        if marker not in chunk or not _JUMP_RANGE_MARKER.search(chunk):
+            continue
+        attributes = {int(a): float(v) for a, v in _ATTRIBUTE.findall(chunk) if int(a) in wanted}
+        if attributes.get(ATTR_JUMP_RANGE, 0) > 0:
+            hulls[type_id] = attributes
+    return hulls
+
+
+def load_hulls(dogma_path=TYPE_DOGMA_YAML, db_path="items.db"):
+    """
+    读取各舰船的跳跃参数，返回 {小写英文名: JumpHull}。
+    有 SDE 时从 typeDogma.yaml 的属性读取 (结果存快照)，舰船名取自 items.db；否则使用内置表。
+    """
+    hulls = {name.lower(): JumpHull(0, name, r, f, 0, m, name.lower() in JUMP_FREIGHTERS)
+             for name, (r, f, m) in JUMP_SHIPS.items()}
+    if not os.path.exists(dogma_path):
+        return hulls
+
+    dogma = load_snapshot(dogma_path, lambda: _parse_dogma(dogma_path), SNAPSHOT_DIR)
+    if not dogma:
+        logger.warning(f"{dogma_path} 中没有解析到带跳跃引擎的舰船，使用内置跳跃参数表")
+        return hulls
+    try:
+        connection = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            ids = list(dogma)
+            rows = connection.execute(
+                f"SELECT id, name, groupid FROM items WHERE id IN ({','.join('?' * len(ids))})", ids).fetchall()
+        finally:
+            connection.close()
+    except sqlite3.Error as e:
+        logger.warning(f"读取舰船名称失败，使用内置跳跃参数表: {e}")
+        return hulls
+
+    for type_id, name, group_id in rows:
+        name = json.loads(name).get('en') or str(type_id)
+        attributes = dogma[type_id]
+        hulls[name.lower()] = JumpHull(
+            type_id, name, attributes[ATTR_JUMP_RANGE], attributes.get(ATTR_JUMP_FUEL, 0),
+            int(attributes.get(ATTR_JUMP_FUEL_TYPE, 0)), attributes.get(ATTR_FATIGUE_MULTIPLIER, 1.0),
+            group_id == JUMP_FREIGHTER_GROUP,
+        )
+    return hulls
+
+
+class JumpPlan:
+    """一条路线在一种跳跃配置下的逐跳结果，时间单位为分钟"""
+    __slots__ = ('config', 'distances', 'fuel', 'fatigue', 'cooldown', 'cumulative_fuel', 'elapsed', 'out_of_range')
+
+    def __init__(self, config, distances, fuel, fatigue, cooldown, cumulative_fuel, elapsed, out_of_range):
+        self.config = config
+        self.distances = distances            # 每跳光年
+        self.fuel = fuel                      # 每跳燃料
+        self.fatigue = fatigue                # 每跳后的疲劳 (蓝色计时)
+        self.cooldown = cooldown              # 每跳后的跳跃冷却 (红色计时)
+        self.cumulative_fuel = cumulative_fuel
+        self.elapsed = elapsed                # 到达每一跳时已经过的时间
+        self.out_of_range = out_of_range      # 超出跳跃距离的跳序号
+
+    @property
+    def total_fuel(self):
+        return self.cumulative_fuel[-1] if self.cumulative_fuel else 0
+
+    @property
+    def feasible(self):
+        return not self.out_of_range
+
+    def to_dict(self):
+        return {
+            'ship': self.config.hull.name, 'skills': self.config.skills, 'range': round(self.config.range_ly, 2),
+            'total_fuel': self.total_fuel, 'feasible': self.feasible, 'out_of_range': list(self.out_of_range),
+            'hops': [
+                {'ly': round(d, 3), 'fuel': f, 'fatigue': round(fa, 1), 'cooldown': round(c, 1), 'elapsed': round(e, 1)}
+                for d, f, fa, c, e in zip(self.distances, self.fuel, self.fatigue, self.cooldown, self.elapsed)
+            ],
+        }
+
+
+def evaluate(distances, config, fatigue=0.0, wait=0.0):
+    """
+    单条路线: distances 为每跳光年，fatigue 为出发时已有的疲劳，
+    wait 为每次冷却结束后额外等待的分钟数 (0 表示冷却一结束就跳)。
+    """
+    return evaluate_many([distances], [config], fatigue, wait)[0][0]
+
+
+def evaluate_many(routes, configs, fatigue=0.0, wait=0.0):
+    """
+    批量计算: 对每条路线 × 每种跳跃配置算出逐跳和累计的燃料、疲劳和冷却，
+    返回 plans[路线序号][配置序号]。每条路线的距离只转换一次，按配置共用。
+    """
+    routes = [array('d', distances) for distances in routes]
+    plans = []
+    for distances in routes:
+        row = []
+        for config in configs:
+            multiplier = config.hull.fatigue_multiplier
+            fuel = array('q', (math.ceil(d * config.fuel_per_ly) for d in distances))
+            fatigue_after, cooldown, elapsed = array('d'), array('d'), array('d')
+            current, clock = fatigue, 0.0
+            for d in distances:
+                effective = d * multiplier
+                elapsed.append(clock)
+                # 冷却按跳跃前的疲劳计算，新疲劳 = max(原疲劳, 10分钟) × (1 + 有效光年)
+                red = min(COOLDOWN_CAP, max(current / 10, 1 + effective))
+                current = min(FATIGUE_CAP, max(current, FATIGUE_FLOOR) * (1 + effective))
+                cooldown.append(red)
+                fatigue_after.append(current)
+                # 等冷却结束再跳，疲劳随时间按分钟衰减
+                clock += red + wait
+                current = max(0.0, current - red - wait)
+            out_of_range = [i for i, d in enumerate(distances) if d > config.range_ly + 1e-9]
+            row.append(JumpPlan(config, distances, fuel, fatigue_after, cooldown,
+                                array('q', accumulate(fuel)), elapsed, out_of_range))
+        plans.append(row)
+    return plans
+
+
+_hulls = None
+
+
+def hulls():
+    """进程内共用的舰船跳跃参数表，首次使用时加载"""
+    global _hulls
+    if _hulls is None:
+        _hulls = load_hulls()
+    return _hulls
+
+
+def jump_config(ship, skills="555"):
+    hull = hulls().get(str(ship).strip().lower())
+    if hull is None:
+        raise ValueError(f"未知的跳跃舰船: {ship}")
+    return hull.configure(skills)
+
+
+def ship_profile(ship, skills="555"):
+    """(最大跳跃距离 ly, 每光年燃料)"""
+    config = jump_config(ship, skills)
+    return config.range_ly, config.fuel_per_ly
+
+
+def route_distances(systems):
+    """相邻星系之间的光年距离"""
+    return [a.distance_ly(b) for a, b in zip(systems, systems[1:])]
+
+
+def format_minutes(minutes):
+    hours, minutes = divmod(int(round(minutes)), 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m"
+
+
+# 命令行: python jumpcalc.py 4-HWWF,星系2,星系3 Archon:555 Rhea:544 ...
+if __name__ == "__main__":
+    from universe import default_index, SystemLookupError
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if len(sys.argv) < 3:
+        print("用法: python jumpcalc.py 星系1,星系2,... 舰船:技能 [舰船:技能 ...]")
+        sys.exit(1)
+    index = default_index()
+    systems = []
+    for name in sys.argv[1].split(","):
+        try:
+            systems.append(index.resolve(name))
+        except SystemLookupError as e:
+            print(e)
+            sys.exit(1)
+    configs = [jump_config(*arg.split(":", 1)) if ":" in arg else jump_config(arg) for arg in sys.argv[2:]]
+    for plan in evaluate_many([route_distances(systems)], configs)[0]:
+        print(f"{plan.config.label} ({plan.config.range_ly:.2f}ly): 燃料 {plan.total_fuel:,}"
+              f"{'' if plan.feasible else '  超出跳跃距离: 第' + ','.join(str(i + 1) for i in plan.out_of_range) + '跳'}")
+        for i, (a, b) in enumerate(zip(systems, systems[1:])):
+            print(f"  {a.name} -> {b.name}: {plan.distances[i]:.2f}ly 燃料 {plan.fuel[i]:,} "
+                  f"冷却 {format_minutes(plan.cooldown[i])} 疲劳 {format_minutes(plan.fatigue[i])}")
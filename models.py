@@ -0,0 +1,212 @@
+import sys
+import json
+
+# 优先使用更快的JSON解码器，未安装时回退到标准库
+try:
+    import orjson
+
+    def loads(data):
+        return orjson.loads(data)
+except ImportError:
+    def loads(data):
+        return json.loads(data)
+
+
+class Item:
+    """受害者物品，嵌套容器内的物品放在 items 中并标记 sub_item"""
+    __slots__ = ('type_id', 'flag', 'qty_destroyed', 'qty_dropped', 'singleton', 'items', 'sub_item', 'name')
+
+    def __init__(self, type_id, flag=-1, qty_destroyed=0, qty_dropped=0, singleton=0, items=(), sub_item=False):
+        self.type_id = type_id
+        self.flag = flag
+        self.qty_destroyed = qty_destroyed
+        self.qty_dropped = qty_dropped
+        self.singleton = singleton
+        self.items = items
+        self.sub_item = sub_item
+        self.name = None
+
+    @classmethod
+    def from_esi(cls, data, sub_item=False):
+        get = data.get
+        nested = get('items')
+        return cls(
+            get('item_type_id'),
+            get('flag', -1),
+            get('quantity_destroyed', 0),
+            get('quantity_dropped', 0),
+            get('singleton', 0),
+            tuple(cls.from_esi(sub, True) for sub in nested) if nested else (),
+            sub_item,
+        )
+
+
+class Attacker:
+    """攻击者，名称字段在丰富阶段填入"""
+    __slots__ = ('character_id', 'corporation_id', 'alliance_id', 'faction_id', 'ship_type_id', 'weapon_type_id',
+                 'damage_done', 'final_blow', 'security_status',
+                 'character_name', 'corporation_name', 'alliance_name', 'ship_type_name', 'weapon_type_name')
+
+    def __init__(self, character_id=None, corporation_id=None, alliance_id=None, faction_id=None,
+                 ship_type_id=None, weapon_type_id=None, damage_done=0, final_blow=False, security_status=0.0):
+        self.character_id = character_id
+        self.corporation_id = corporation_id
+        self.alliance_id = alliance_id
+        self.faction_id = faction_id
+        self.ship_type_id = ship_type_id
+        self.weapon_type_id = weapon_type_id
+        self.damage_done = damage_done
+        self.final_blow = final_blow
+        self.security_status = security_status
+        self.character_name = None
+        self.corporation_name = None
+        self.alliance_name = None
+        self.ship_type_name = None
+        self.weapon_type_name = None
+
+    @classmethod
+    def from_esi(cls, data):
+        get = data.get
+        return cls(
+            get('character_id'),
+            get('corporation_id'),
+            get('alliance_id'),
+            get('faction_id'),
+            get('ship_type_id'),
+            get('weapon_type_id'),
+            get('damage_done', 0),
+            get('final_blow', False),
+            get('security_status', 0.0),
+        )
+
+
+class Victim:
+    """受害者"""
+    __slots__ = ('character_id', 'corporation_id', 'alliance_id', 'faction_id', 'ship_type_id', 'damage_taken', 'items',
+                 'character_name', 'corporation_name', 'alliance_name', 'ship_type_name')
+
+    def __init__(self, character_id=None, corporation_id=None, alliance_id=None, faction_id=None,
+                 ship_type_id=None, damage_taken=0, items=()):
+        self.character_id = character_id
+        self.corporation_id = corporation_id
+        self.alliance_id = alliance_id
+        self.faction_id = faction_id
+        self.ship_type_id = ship_type_id
+        self.damage_taken = damage_taken
+        self.items = items
+        self.character_name = None
+        self.corporation_name = None
+        self.alliance_name = None
+        self.ship_type_name = None
+
+    @classmethod
+    def from_esi(cls, data):
+        get = data.get
+        items = get('items')
+        return cls(
+            get('character_id'),
+            get('corporation_id'),
+            get('alliance_id'),
+            get('faction_id'),
+            get('ship_type_id'),
+            get('damage_taken', 0),
+            tuple(Item.from_esi(itm) for itm in items) if items else (),
+        )
+
+
+class Zkb:
+    """zKillboard 附加信息"""
+    __slots__ = ('hash', 'location_id', 'fitted_value', 'dropped_value', 'destroyed_value', 'total_value',
+                 'points', 'npc', 'solo', 'awox')
+
+    def __init__(self, hash=None, location_id=None, fitted_value=0.0, dropped_value=0.0, destroyed_value=0.0,
+                 total_value=0.0, points=0, npc=False, solo=False, awox=False):
+        self.hash = hash
+        self.location_id = location_id
+        self.fitted_value = fitted_value
+        self.dropped_value = dropped_value
+        self.destroyed_value = destroyed_value
+        self.total_value = total_value
+        self.points = points
+        self.npc = npc
+        self.solo = solo
+        self.awox = awox
+
+    @classmethod
+    def from_dict(cls, data):
+        if data is None:
+            return None
+        if isinstance(data, cls):
+            return data
+        get = data.get
+        return cls(
+            get('hash'),
+            get('locationID'),
+            get('fittedValue') or 0.0,
+            get('droppedValue') or 0.0,
+            get('destroyedValue') or 0.0,
+            get('totalValue') or 0.0,
+            get('points') or 0,
+            get('npc', False),
+            get('solo', False),
+            get('awox', False),
+        )
+
+    def __repr__(self):
+        return f"Zkb(hash={self.hash}, total_value={self.total_value:,.0f}, dropped_value={self.dropped_value:,.0f})"
+
+
+class Killmail:
+    """击杀邮件，替代原先在各处理阶段之间传递和修改的嵌套字典"""
+    __slots__ = ('killmail_id', 'killmail_time', 'solar_system_id', 'victim', 'attackers', 'zkb')
+
+    def __init__(self, killmail_id, killmail_time=None, solar_system_id=None, victim=None, attackers=(), zkb=None):
+        self.killmail_id = killmail_id
+        self.killmail_time = killmail_time
+        self.solar_system_id = solar_system_id
+        self.victim = victim if victim is not None else Victim()
+        self.attackers = attackers
+        self.zkb = zkb
+
+    @classmethod
+    def from_esi(cls, data, zkb=None):
+        """从ESI/RedisQ的击杀JSON (字典或原始字节) 构建模型"""
+        if isinstance(data, (bytes, bytearray, str)):
+            data = loads(data)
+        get = data.get
+        victim = get('victim')
+        attackers = get('attackers')
+        return cls(
+            get('killmail_id'),
+            get('killmail_time'),
+            get('solar_system_id'),
+            Victim.from_esi(victim) if victim else None,
+            tuple(Attacker.from_esi(a) for a in attackers) if attackers else (),
+            Zkb.from_dict(zkb if zkb is not None else get('zkb')),
+        )
+
+    @property
+    def has_body(self):
+        """是否包含完整击杀内容；新版RedisQ只推送killID和zkb，此时为 False，需要从ESI获取"""
+        return self.solar_system_id is not None
+
+    def memory_size(self):
+        """估算该击杀模型占用的内存 (字节)"""
+        return deep_sizeof(self)
+
+
+def deep_sizeof(obj, seen=None):
+    """递归计算对象及其引用对象的内存占用，支持 __slots__ 对象、字典和序列"""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(v, seen) for v in obj)
+    elif hasattr(type(obj), '__slots__'):
+        size += sum(deep_sizeof(getattr(obj, slot), seen) for slot in type(obj).__slots__ if hasattr(obj, slot))
+    return size
@@ -1,69 +1,110 @@
+import os
 import asyncio
-import json
-import sqlite3
+import time
+import marshal
+import logging
+import itertools
 import aiohttp
 from bs4 import BeautifulSoup
 import re
 
-async def name_ex(system_name, cursor):
-    if contains_chinese(system_name):
-        system_id = get_system_id(system_name)
-    else:
-        system_id = None
-
-    # 查询给定 solarSystemName or ID 下的所有物品
-    query = '''
-    SELECT solarSystemName, solarSystemID
-    FROM mapSolarSystems
-    WHERE solarSystemName LIKE ? COLLATE NOCASE OR solarSystemID = ?
-    '''
-    cursor.execute(query, (f"{system_name}%", system_id))
-    item = cursor.fetchall()
-    if item[0] != []:
-        en_name, sys_id = item[0]
-    else:
+from cache import TTLCache
+from universe import default_index, SystemLookupError
+
+logger = logging.getLogger("eve_monitor")
+
+async def name_ex(system_name, index):
+    """星系名称 (英文名/ID) 转为 (中文名, 英文名)，找不到时返回 None"""
+    system = index.lookup(system_name)
+    if system is None:
         return None
-    
-    with open('zh_systems.json', 'r', encoding='utf-8') as f:
-        systems = json.load(f)
-    details = systems.get(str(sys_id))
-    if details:
-        zh_name = details[1]
-    
-    return zh_name, en_name
-
-
-# Function to check if a string contains Chinese characters
-def contains_chinese(text):
-    # This regex matches any Chinese character
-    return bool(re.search(r'[\u4e00-\u9fff]', text))
-
-def get_system_id(name):
-    # Load the JSON data from the file
-    with open('zh_systems.json', 'r', encoding='utf-8') as f:
-        eve_systems = json.load(f)
-
-    for system_id, details in eve_systems.items():
-        if details[1] == name:  # The name is the second element in the list
-            return system_id
-
-    # 如果没有完全匹配，则进行模糊匹配（检查输入是否为系统名称的一部分）
-    for system_id, details in eve_systems.items():
-        if details[1].startswith(name):
-            return system_id
-    return None  # If no system found
-
-async def get_jump_route(ship, range_, start, end):
-    conn = sqlite3.connect("mapSolarSystems.db")
-    cursor = conn.cursor()
-
-    en_names, zh_names = [], []
+    return system.zh_name, system.name
+
+
+class RouteCache:
+    """
+    跳跃路线缓存: 键为 (舰船, 技能, 起点星系ID, 终点星系ID)，带过期时间和LRU淘汰，
+    保存到磁盘，重启后仍然有效。同一对星系无论用中文名、英文名还是ID查询都命中同一条。
+    """
+
+    def __init__(self, path, maxsize=2048, ttl=7 * 86400):
+        self.path = path
+        self.cache = TTLCache(maxsize, ttl)
+        self.dirty = False
+
+    @staticmethod
+    def key(ship, range_, start_id, end_id):
+        return (str(ship).strip().lower(), str(range_).strip(), int(start_id), int(end_id))
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def put(self, key, route):
+        self.cache.put(key, route)
+        self.dirty = True
+
+    def expires_in(self, key):
+        """条目剩余有效秒数，不存在时为 0"""
+        return max(0.0, self.cache.expires(key) - time.time())
+
+    def load(self):
+        try:
+            with open(self.path, "rb") as f:
+                entries = marshal.load(f)
+            self.cache.restore((tuple(key), expires, tuple(value)) for key, expires, value in entries)
+            logger.info(f"已加载 {len(self.cache)} 条缓存路线")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"读取路线缓存 {self.path} 失败: {e}")
+        return self
+
+    def save(self):
+        if not self.dirty:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            marshal.dump(self.cache.items(), f)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+    def __len__(self):
+        return len(self.cache)
+
+
+async def get_jump_route(ship, range_, start, end, index=None, session=None, cache=None):
+    """
+    查询旗舰跳跃路线。index 为常驻的 SystemIndex，session 为共用的 aiohttp 会话，
+    均不传时使用进程内共用索引并临时创建会话。cache 为 RouteCache 时先查缓存，
+    成功的结果写回缓存。
+    """
+    index = index or default_index()
+
+    endpoints = []
     for system_name in [start, end]:
-        zh_name, en_name = await name_ex(system_name, cursor)
-        en_names.append(en_name)
-        zh_names.append(zh_name)
+        try:
+            endpoints.append(index.resolve(system_name))
+        except SystemLookupError as e:
+            return str(e)
+
+    key = RouteCache.key(ship, range_, endpoints[0].system_id, endpoints[1].system_id)
+    if cache is not None:
+        route = cache.get(key)
+        if route is not None:
+            return route
+
+    route = await fetch_jump_route(ship, range_, endpoints[0].name, endpoints[1].name, index, session)
+    if cache is not None and not isinstance(route, str):
+        cache.put(key, route)
+    return route
+
 
-    url = f'https://evemaps.dotlan.net/jump/{ship},{range_}/{en_names[0]}:{en_names[1]}'
+async def fetch_jump_route(ship, range_, start_name, end_name, index, session=None):
+    """从 dotlan 抓取并解析路线，返回 (路线文本, 燃料, 光年) 或错误信息"""
+    url = f'https://evemaps.dotlan.net/jump/{ship},{range_}/{start_name}:{end_name}'
     headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
                       "(KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36",
@@ -71,8 +112,12 @@ async def get_jump_route(ship, range_, start, end):
         "Accept-Language": "zh-CN,zh;q=0.9,en-US;q=0.8,en;q=0.7",
     }
 
-    async with aiohttp.ClientSession(headers=headers) as session:
-        async with session.get(url) as resp:
+    if session is None:
+        async with aiohttp.ClientSession() as own_session:
+            async with own_session.get(url, headers=headers) as resp:
+                html_content = await resp.text()
+    else:
+        async with session.get(url, headers=headers) as resp:
             html_content = await resp.text()
 
     soup = BeautifulSoup(html_content, 'html.parser')
@@ -135,13 +180,70 @@ async def get_jump_route(ship, range_, start, end):
     # 转换系统名称为中英文组合（确保 name_ex 返回正确的名称）
     systems_converted = []
     for s in systems:
-        zh_name, en_name = await name_ex(s, cursor)
+        names = await name_ex(s, index)
+        zh_name, en_name = names if names else (s, s)
         systems_converted.append(f"{zh_name}({en_name})")
     route_str = " --> ".join(systems_converted)
 
     return (route_str, total_fuel, total_distance)
 
 
+async def warm_routes(hubs, ships, cache, index=None, session=None, concurrency=2, refresh_before=86400):
+    """
+    预先计算枢纽星系之间 (双向) 各舰船配置的路线。已缓存且剩余有效期超过
+    refresh_before 秒的跳过，因此可以定期调用，让常用路线始终保持在缓存中。
+    ships 为 [(舰船, 技能), ...]。返回本次实际抓取的路线数。
+    """
+    index = index or default_index()
+    systems = []
+    for name in hubs:
+        system = index.lookup(name)
+        if system is None:
+            logger.warning(f"预热路线: 未找到枢纽星系 {name}")
+        else:
+            systems.append(system)
+
+    jobs = []
+    for (ship, range_), (start, end) in itertools.product(ships, itertools.permutations(systems, 2)):
+        key = RouteCache.key(ship, range_, start.system_id, end.system_id)
+        if cache.expires_in(key) <= refresh_before:
+            jobs.append((key, ship, range_, start, end))
+    if not jobs:
+        return 0
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def warm(key, ship, range_, start, end):
+        async with semaphore:
+            try:
+                route = await fetch_jump_route(ship, range_, start.name, end.name, index, session)
+            except Exception as e:
+                logger.warning(f"预热路线 {ship} {start.name} -> {end.name} 失败: {e}")
+                return 0
+        if isinstance(route, str):
+            logger.warning(f"预热路线 {ship} {start.name} -> {end.name} 失败: {route}")
+            return 0
+        cache.put(key, route)
+        return 1
+
+    start_time = time.perf_counter()
+    warmed = sum(await asyncio.gather(*(warm(*job) for job in jobs)))
+    cache.save()
+    logger.info(f"预热路线: {warmed}/{len(jobs)} 条, 耗时 {time.perf_counter() - start_time:.1f}s, 缓存共 {len(cache)} 条")
+    return warmed
+
+
+async def warm_routes_forever(hubs, ships, cache, index=None, get_session=None, interval=6 * 3600, **kwargs):
+    """启动时预热一次，之后定期刷新即将过期的枢纽路线"""
+    while True:
+        try:
+            session = await get_session() if get_session else None
+            await warm_routes(hubs, ships, cache, index, session, **kwargs)
+        except Exception as e:
+            logger.error(f"预热路线出错: {e}")
+        await asyncio.sleep(interval)
+
+
 # 测试调用
 if __name__ == '__main__':
     ship = 'Archon'
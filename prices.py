@@ -0,0 +1,123 @@
+import os
+import json
+import time
+import bisect
+import asyncio
+import logging
+from array import array
+
+import aiohttp
+
+from include import PRICE_SNAPSHOT, PRICE_REFRESH_INTERVAL
+from scheduler import PRIORITY_IMAGES
+
+logger = logging.getLogger("eve_monitor")
+
+ESI_PRICES_URL = "https://esi.evetech.net/latest/markets/prices/?datasource=tranquility"
+
+
+def format_isk(value):
+    """把ISK数值格式化为简短形式，如 1.23b / 45.6m / 789k"""
+    for unit, scale in (("t", 1e12), ("b", 1e9), ("m", 1e6), ("k", 1e3)):
+        if value >= scale:
+            return f"{value / scale:.2f}{unit}" if value < scale * 100 else f"{value / scale:.0f}{unit}"
+    return f"{value:.0f}"
+
+
+class PriceIndex:
+    """
+    本地市场价格索引: 已排序的typeID数组 + 并行的价格数组，按二分查找取价，不做任何逐物品网络请求。
+    价格快照为ESI /markets/prices/ 的原始JSON，由 refresh() 定期整批更新。
+    """
+
+    def __init__(self, snapshot_path=PRICE_SNAPSHOT):
+        self.snapshot_path = snapshot_path
+        self.type_ids = array('I')
+        self.prices = array('d')
+        self.updated_at = 0
+        self._loaded = False
+
+    def load(self, data=None):
+        """从快照 (或已下载的数据) 构建价格数组"""
+        self._loaded = True
+        if data is None:
+            try:
+                with open(self.snapshot_path, "rb") as f:
+                    data = json.loads(f.read())
+                self.updated_at = os.path.getmtime(self.snapshot_path)
+            except FileNotFoundError:
+                logger.info(f"未找到价格快照 {self.snapshot_path}，物品不显示价值")
+                return
+            except Exception as e:
+                logger.error(f"读取价格快照失败: {e}")
+                return
+
+        entries = {}
+        for row in data:
+            price = row.get('average_price') or row.get('adjusted_price')
+            if row.get('type_id') and price:
+                entries[int(row['type_id'])] = float(price)
+        ordered = sorted(entries)
+        self.type_ids = array('I', ordered)
+        self.prices = array('d', (entries[t] for t in ordered))
+        logger.info(f"价格索引已加载: {len(ordered)}个物品")
+
+    def price(self, type_id):
+        """单价，没有价格时返回0"""
+        if not self._loaded:
+            self.load()
+        i = bisect.bisect_left(self.type_ids, type_id)
+        if i < len(self.type_ids) and self.type_ids[i] == type_id:
+            return self.prices[i]
+        return 0.0
+
+    def __len__(self):
+        if not self._loaded:
+            self.load()
+        return len(self.type_ids)
+
+    async def refresh(self, get_session, scheduler):
+        """整批下载最新价格，写入快照并重建索引"""
+        await scheduler.acquire(ESI_PRICES_URL, PRIORITY_IMAGES)
+        session = await get_session()
+        async with session.get(ESI_PRICES_URL, timeout=aiohttp.ClientTimeout(total=60)) as response:
+            scheduler.record_response(ESI_PRICES_URL, response.status, response.headers)
+            response.raise_for_status()
+            raw = await response.read()
+        data = json.loads(raw)
+
+        os.makedirs(os.path.dirname(self.snapshot_path) or ".", exist_ok=True)
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(raw)
+        os.replace(tmp_path, self.snapshot_path)
+        self.load(data)
+        self.updated_at = time.time()
+
+    async def refresh_forever(self, get_session, scheduler, interval=PRICE_REFRESH_INTERVAL):
+        """后台定期刷新价格，快照未过期时先等待到期"""
+        while True:
+            if not self._loaded:
+                self.load()
+            wait = self.updated_at + interval - time.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                await self.refresh(get_session, scheduler)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"刷新价格失败: {e}")
+                scheduler.record_failure(ESI_PRICES_URL)
+                await asyncio.sleep(min(interval, 600))
+
+    async def watch(self, interval=60):
+        """只读模式: 由其他进程负责下载，快照文件更新后重新加载"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                mtime = os.path.getmtime(self.snapshot_path)
+            except OSError:
+                continue
+            if mtime > self.updated_at:
+                self.load()
@@ -0,0 +1,239 @@
+import io
+import os
+import sys
+import time
+import pstats
+import signal
+import asyncio
+import cProfile
+import logging
+import threading
+import traceback
+import tracemalloc
+from collections import Counter
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+logger = logging.getLogger("eve_monitor")
+
+
+def _timestamp():
+    return datetime.now().strftime('%Y%m%d_%H%M%S')
+
+
+def folded_stack(frame):
+    """栈帧 -> 火焰图使用的折叠格式 "模块:函数;模块:函数;..." (由外到内)"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class Profiler:
+    """
+    线上监控的性能诊断，不需要重启:
+      - 逐击杀 cProfile: arm(n) 后接下来 n 个击杀的处理过程各生成一份 .prof 和前 40 行摘要 .txt
+      - 事件循环看门狗: 循环超过 blocking_ms 没有响应时，记录此刻事件循环线程的调用栈
+      - tracemalloc 快照: 首次调用开始跟踪，之后每次保存快照并与上一次比较
+      - 调用栈采样: 后台线程定时采样事件循环线程，输出火焰图折叠格式
+    文件写入 out_dir，文件名带击杀ID (或当时正在处理的击杀ID)。
+    触发方式: SIGUSR1 剖析下一个击杀，SIGUSR2 保存内存快照和任务列表，或查询服务的 /profile 命令。
+    """
+
+    def __init__(self, out_dir="profiles", blocking_ms=200, top=40):
+        self.out_dir = out_dir
+        self.blocking_ms = blocking_ms
+        self.top = top
+        self.armed = 0
+        self.current_kill = None
+        self.max_lag_ms = 0.0
+        self._beat = time.monotonic()
+        self._loop_thread_id = None
+        self._previous_snapshot = None
+        self._watchdog = None
+        self._heartbeat = None
+        self._stopping = threading.Event()
+
+    def _path(self, kind, tag, suffix):
+        os.makedirs(self.out_dir, exist_ok=True)
+        return os.path.join(self.out_dir, f"{kind}_{tag}_{_timestamp()}{suffix}")
+
+    @property
+    def tag(self):
+        return self.current_kill if self.current_kill is not None else "idle"
+
+    # ---------- 逐击杀 cProfile ----------
+
+    def arm(self, count=1):
+        self.armed += count
+        logger.info(f"性能剖析: 接下来 {self.armed} 个击杀将记录 cProfile")
+        return self.armed
+
+    @asynccontextmanager
+    async def kill(self, killmail_id):
+        """包住单个击杀的处理过程；armed 时记录 cProfile (同一线程上并发运行的任务也会计入)"""
+        self.current_kill = killmail_id
+        profile = None
+        if self.armed > 0:
+            self.armed -= 1
+            profile = cProfile.Profile()
+            profile.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.current_kill = None
+            if profile is not None:
+                profile.disable()
+                elapsed = time.perf_counter() - start
+                await asyncio.to_thread(self._dump_profile, profile, killmail_id, elapsed)
+
+    def _dump_profile(self, profile, killmail_id, elapsed):
+        path = self._path("kill", killmail_id, ".prof")
+        profile.dump_stats(path)
+        summary = io.StringIO()
+        summary.write(f"击杀 {killmail_id} 处理耗时 {elapsed * 1000:.0f}ms\n\n")
+        pstats.Stats(profile, stream=summary).sort_stats("cumulative").print_stats(self.top)
+        with open(path[:-len(".prof")] + ".txt", "w", encoding="utf-8") as f:
+            f.write(summary.getvalue())
+        logger.info(f"性能剖析已保存: {path} (耗时 {elapsed * 1000:.0f}ms)")
+
+    # ---------- 事件循环看门狗 ----------
+
+    def start(self, interval=0.1):
+        """在事件循环中调用: 启动心跳协程和看门狗线程"""
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopping.clear()
+        self._heartbeat = asyncio.create_task(self._heartbeat_loop(interval))
+        self._watchdog = threading.Thread(target=self._watch, args=(interval,), name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+        logger.info(f"事件循环看门狗已启动 (阻塞阈值 {self.blocking_ms}ms)")
+
+    def stop(self):
+        self._stopping.set()
+        if self._heartbeat:
+            self._heartbeat.cancel()
+            self._heartbeat = None
+
+    async def _heartbeat_loop(self, interval):
+        while True:
+            expected = time.monotonic() + interval
+            self._beat = time.monotonic()
+            await asyncio.sleep(interval)
+            lag_ms = (time.monotonic() - expected) * 1000
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+            if lag_ms > self.blocking_ms:
+                logger.warning(f"事件循环阻塞了 {lag_ms:.0f}ms (击杀: {self.tag})")
+
+    def _watch(self, interval):
+        """看门狗线程: 心跳超时时抓取事件循环线程当前的调用栈，每次阻塞只记录一次"""
+        reported_beat = None
+        while not self._stopping.wait(interval / 2):
+            beat = self._beat
+            stalled_ms = (time.monotonic() - beat) * 1000
+            if stalled_ms <= self.blocking_ms + interval * 1000 or beat == reported_beat:
+                continue
+            reported_beat = beat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = "".join(traceback.format_stack(frame))
+            logger.warning(f"事件循环已阻塞 {stalled_ms:.0f}ms, 击杀: {self.tag}, 当前调用栈:\n{stack}")
+            try:
+                os.makedirs(self.out_dir, exist_ok=True)
+                with open(os.path.join(self.out_dir, "blocking.log"), "a", encoding="utf-8") as f:
+                    f.write(f"=== {datetime.now().isoformat()} 阻塞 {stalled_ms:.0f}ms 击杀 {self.tag}\n{stack}\n")
+            except OSError:
+                pass
+
+    # ---------- 任务列表 / 内存 / 采样 ----------
+
+    def dump_tasks(self):
+        """当前所有 asyncio 任务及其挂起位置"""
+        lines = []
+        for task in asyncio.all_tasks():
+            frames = task.get_stack(limit=1)
+            where = f"{os.path.basename(frames[0].f_code.co_filename)}:{frames[0].f_lineno} {frames[0].f_code.co_name}" if frames else "-"
+            lines.append(f"{task.get_name()}: {where}")
+        lines.sort()
+        path = self._path("tasks", self.tag, ".txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"{len(lines)} 个任务, 最大循环延迟 {self.max_lag_ms:.0f}ms\n" + "\n".join(lines) + "\n")
+        logger.info(f"任务列表已保存: {path} ({len(lines)} 个任务)")
+        return path
+
+    def memory_snapshot(self, frames=10):
+        """首次调用开始 tracemalloc 跟踪；之后保存快照，并列出与上一次相比增长最多的位置"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            logger.info("tracemalloc 已开始跟踪，再次触发时保存快照")
+            return None
+        snapshot = tracemalloc.take_snapshot()
+        path = self._path("memory", self.tag, ".tracemalloc")
+        snapshot.dump(path)
+        if self._previous_snapshot is not None:
+            stats = snapshot.compare_to(self._previous_snapshot, "lineno")
+            title = "与上一次快照相比增长最多"
+        else:
+            stats = snapshot.statistics("lineno")
+            title = "占用最多"
+        current, peak = tracemalloc.get_traced_memory()
+        with open(path[:-len(".tracemalloc")] + ".txt", "w", encoding="utf-8") as f:
+            f.write(f"当前 {current / 1048576:.1f}MB, 峰值 {peak / 1048576:.1f}MB\n{title}:\n")
+            f.write("\n".join(str(stat) for stat in stats[:self.top]) + "\n")
+        self._previous_snapshot = snapshot
+        logger.info(f"内存快照已保存: {path} (当前 {current / 1048576:.1f}MB)")
+        return path
+
+    def sample(self, seconds=10.0, interval=0.005):
+        """
+        在调用线程中定时采样事件循环线程的调用栈，输出火焰图折叠格式
+        (flamegraph.pl / speedscope 可直接读取)。应通过 to_thread 调用。
+        """
+        counts = Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is not None:
+                counts[folded_stack(frame)] += 1
+            time.sleep(interval)
+        path = self._path("sample", self.tag, ".folded")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in counts.most_common():
+                f.write(f"{stack} {count}\n")
+        logger.info(f"调用栈采样已保存: {path} ({sum(counts.values())} 个样本)")
+        return path
+
+    # ---------- 触发 ----------
+
+    def install_signals(self, loop=None):
+        """SIGUSR1: 剖析下一个击杀；SIGUSR2: 保存任务列表和内存快照。不支持信号的平台跳过"""
+        if not hasattr(signal, "SIGUSR1"):
+            return False
+        loop = loop or asyncio.get_running_loop()
+        try:
+            loop.add_signal_handler(signal.SIGUSR1, self.arm)
+            loop.add_signal_handler(signal.SIGUSR2, lambda: (self.dump_tasks(), self.memory_snapshot()))
+        except (NotImplementedError, RuntimeError):
+            return False
+        logger.info(f"性能诊断: kill -USR1 {os.getpid()} 剖析下一个击杀, kill -USR2 {os.getpid()} 保存任务列表和内存快照")
+        return True
+
+    async def command(self, action, count=1, seconds=10.0):
+        """管理命令入口 (查询服务 /profile)，返回生成的文件或状态"""
+        if action == "kill":
+            return {'armed': self.arm(count)}
+        if action == "tasks":
+            return {'path': self.dump_tasks()}
+        if action == "memory":
+            path = await asyncio.to_thread(self.memory_snapshot)
+            return {'path': path, 'tracing': tracemalloc.is_tracing()}
+        if action == "sample":
+            return {'path': await asyncio.to_thread(self.sample, seconds)}
+        if action == "status":
+            return {'armed': self.armed, 'current_kill': self.current_kill, 'max_lag_ms': round(self.max_lag_ms, 1),
+                    'tracing': tracemalloc.is_tracing()}
+        raise ValueError(f"未知操作: {action}")
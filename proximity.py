@@ -0,0 +1,138 @@
+import os
+import csv
+import time
+import logging
+from collections import deque
+
+from include import SDE_DIR, SNAPSHOT_DIR
+from startup import load_snapshot
+from universe import default_index, LIGHT_YEAR
+
+logger = logging.getLogger("eve_monitor")
+
+GATE_JUMPS_CSV = os.path.join(SDE_DIR, 'mapSolarSystemJumps.csv')  # 星门连接 (fromSolarSystemID, toSolarSystemID)
+
+
+def parse_gate_jumps(path):
+    """星门连接表 -> {星系ID: [相邻星系ID, ...]}"""
+    gates = {}
+    with open(path, mode='r', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            gates.setdefault(int(row['fromSolarSystemID']), []).append(int(row['toSolarSystemID']))
+    return gates
+
+
+def load_gate_jumps(path=GATE_JUMPS_CSV):
+    """读取星门连接，源文件未变化时直接读取快照；没有该文件时返回 None"""
+    if not os.path.exists(path):
+        return None
+    return load_snapshot(path, lambda: parse_gate_jumps(path), SNAPSHOT_DIR)
+
+
+def gate_distances(gates, origin, max_jumps):
+    """从 origin 出发 max_jumps 个星门以内的星系 -> 跳数"""
+    seen = {origin: 0}
+    frontier = deque([origin])
+    while frontier:
+        system_id = frontier.popleft()
+        jumps = seen[system_id]
+        if jumps >= max_jumps:
+            continue
+        for neighbor in gates.get(system_id, ()):
+            if neighbor not in seen:
+                seen[neighbor] = jumps + 1
+                frontier.append(neighbor)
+    return seen
+
+
+def nearest_system(index, x, y, z):
+    return min(index.systems.values(), key=lambda s: (s.x - x) ** 2 + (s.y - y) ** 2 + (s.z - z) ** 2, default=None)
+
+
+class ProximityWatch:
+    """
+    关注星系附近的击杀提醒。配置变化时为每个星系一次算出所属关注区域的位掩码
+    (第 k 位表示在第 k 个关注星系的 max_ly 光年或 max_jumps 个星门以内)，
+    之后判断击杀只需一次字典查找和位运算。
+    """
+
+    def __init__(self, watched, max_ly=6.0, max_jumps=3, index=None, gates=None):
+        self.index = index or default_index()
+        self.gates = gates
+        self.watched = []
+        self.max_ly = max_ly
+        self.max_jumps = max_jumps
+        self.masks = {}    # 星系ID -> 位掩码，只保存非零项
+        self._jumps = []   # 每个关注星系: {星系ID: 星门跳数}
+        self.configure(watched, max_ly, max_jumps)
+
+    def configure(self, watched=None, max_ly=None, max_jumps=None):
+        """
+        修改关注星系或范围，重新计算全部位掩码。
+        watched 为星系名列表，或 {简称: [x, y, z]} (与 calc_dist.WATCHED_SYSTEMS 相同)。
+        """
+        start = time.perf_counter()
+        index = self.index.load()
+        if watched is not None:
+            self.watched = []
+            for name in watched:
+                if isinstance(watched, dict):
+                    # calc_dist.WATCHED_SYSTEMS 形式: 简称 -> 坐标，按坐标找到星系
+                    system = nearest_system(index, *watched[name])
+                else:
+                    system = index.lookup(name)
+                if system is None:
+                    logger.warning(f"附近击杀提醒: 未找到关注星系 {name}")
+                else:
+                    self.watched.append(system)
+        if max_ly is not None:
+            self.max_ly = max_ly
+        if max_jumps is not None:
+            self.max_jumps = max_jumps
+        if self.max_jumps and self.gates is None:
+            logger.warning(f"未找到 {GATE_JUMPS_CSV}，附近击杀只按光年判断")
+
+        masks = {}
+        limit = (self.max_ly * LIGHT_YEAR) ** 2
+        systems = list(index.systems.values())
+        self._jumps = []
+        for bit, center in enumerate(self.watched):
+            flag = 1 << bit
+            cx, cy, cz = center.x, center.y, center.z
+            # 比较距离的平方，避免逐个开方
+            for s in systems:
+                if (s.x - cx) ** 2 + (s.y - cy) ** 2 + (s.z - cz) ** 2 <= limit:
+                    masks[s.system_id] = masks.get(s.system_id, 0) | flag
+            jumps = gate_distances(self.gates, center.system_id, self.max_jumps) if self.gates and self.max_jumps else {}
+            for system_id in jumps:
+                masks[system_id] = masks.get(system_id, 0) | flag
+            self._jumps.append(jumps)
+        self.masks = masks
+        logger.info(f"附近击杀区域: {len(self.watched)}个关注星系, 覆盖{len(masks)}个星系 "
+                    f"({self.max_ly}ly / {self.max_jumps}跳), 耗时 {(time.perf_counter() - start) * 1000:.0f}ms")
+
+    def zones(self, system_id):
+        """星系所属关注区域的位掩码，0 表示不在任何区域内"""
+        return self.masks.get(system_id, 0)
+
+    def matches(self, system_id):
+        """命中的关注区域: [(关注星系, 光年, 星门跳数或None), ...]；不在区域内时为空，不做任何计算"""
+        mask = self.masks.get(system_id, 0)
+        if not mask:
+            return []
+        system = self.index.get(system_id)
+        return [(center, system.distance_ly(center), self._jumps[bit].get(system_id))
+                for bit, center in enumerate(self.watched) if mask >> bit & 1]
+
+    def __call__(self, killmail, zkb):
+        """作为击杀观察者使用 (需要包含星系的完整击杀): 命中时记录提醒日志，与击杀价值无关"""
+        matches = self.matches(killmail.solar_system_id)
+        if not matches:
+            return matches
+        system = self.index.get(killmail.solar_system_id)
+        near = ", ".join(f"{center.name} {ly:.1f}ly" + (f"/{jumps}跳" if jumps is not None else "")
+                         for center, ly, jumps in matches)
+        value = f", 价值 {zkb.total_value:,.0f} ISK" if zkb else ""
+        logger.info(f"附近击杀: https://zkillboard.com/kill/{killmail.killmail_id}/ "
+                    f"{system.zh_name}({system.name}), 靠近 {near}{value}")
+        return matches
@@ -0,0 +1,208 @@
+import json
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+from aiohttp import web
+
+from cache import TTLCache
+from calc_dist import calc_dist, WATCHED_SYSTEMS
+from nav import get_jump_route
+from jumpcalc import evaluate_many, jump_config, route_distances, format_minutes
+from universe import SystemLookupError
+
+logger = logging.getLogger("eve_monitor")
+
+
+class QueryError(Exception):
+    """查询失败，status 为返回的HTTP状态码"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class CommandLimiter:
+    """单个命令的并发上限；排队的请求过多时直接拒绝，而不是无限堆积"""
+
+    def __init__(self, limit, max_waiting):
+        self._semaphore = asyncio.Semaphore(limit)
+        self.max_waiting = max_waiting
+        self.waiting = 0
+
+    @asynccontextmanager
+    async def slot(self):
+        if self.waiting >= self.max_waiting:
+            raise QueryError("请求过多，请稍后再试", 429)
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        try:
+            yield
+        finally:
+            self._semaphore.release()
+
+
+class QueryServer:
+    """
+    与击杀监控同进程的本地查询服务，常驻星系索引，提供:
+      GET /route?ship=Archon&range=544&start=4-HWWF&end=耶舒尔
+      GET /distance?system=Aeschee
+      GET /kill?id=123456789
+      GET /jump?route=4-HWWF,Aeschee,Onne&ships=Archon:555,Rhea:544
+      GET /profile?action=kill|tasks|memory|sample|status (传入 profiler 时可用，结果不缓存)
+    返回 JSON: {"ok": true, "result": {...}, "text": "...", "cached": false}
+    相同查询在有效期内直接返回缓存，并发的相同查询只执行一次。
+    """
+
+    def __init__(self, index, get_session=None, kill_lookup=None, host="127.0.0.1", port=8765,
+                 concurrency=None, cache_ttl=None, max_waiting=20, cache_size=512, route_cache=None, profiler=None):
+        self.index = index
+        self.route_cache = route_cache
+        self.profiler = profiler
+        self.get_session = get_session
+        self.kill_lookup = kill_lookup
+        self.host = host
+        self.port = port
+        self.commands = {'route': self.route, 'distance': self.distance, 'kill': self.kill, 'jump': self.jump}
+        if profiler is not None:
+            self.commands['profile'] = self.profile
+        concurrency = concurrency or {}
+        self.limiters = {name: CommandLimiter(concurrency.get(name, 4), max_waiting) for name in self.commands}
+        self.cache_ttl = cache_ttl or {}
+        self.cache = TTLCache(cache_size)
+        self._inflight = {}
+        self._runner = None
+
+    async def start(self):
+        # 启动前加载星系索引，首个查询不再付出加载成本
+        await asyncio.to_thread(self.index.load)
+        app = web.Application()
+        app.router.add_get('/{command}', self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"查询服务已启动: http://{self.host}:{self.port}/ ({', '.join(self.commands)})")
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+        if self.route_cache is not None:
+            self.route_cache.save()
+
+    def _response(self, body, status=200):
+        return web.json_response(body, status=status, dumps=lambda o: json.dumps(o, ensure_ascii=False))
+
+    async def handle(self, request):
+        command = request.match_info['command']
+        handler = self.commands.get(command)
+        if handler is None:
+            return self._response({'ok': False, 'error': f"未知命令: {command}"}, 404)
+        params = dict(request.query)
+        start = time.perf_counter()
+        try:
+            (result, text), cached = await self.execute(command, handler, params)
+        except QueryError as e:
+            return self._response({'ok': False, 'error': str(e)}, e.status)
+        except Exception as e:
+            logger.exception(f"查询 {command} {params} 失败: {e}")
+            return self._response({'ok': False, 'error': "查询失败"}, 500)
+        logger.info(f"查询 {command} {params} 耗时 {(time.perf_counter() - start) * 1000:.0f}ms{' (缓存)' if cached else ''}")
+        return self._response({'ok': True, 'result': result, 'text': text, 'cached': cached})
+
+    async def execute(self, command, handler, params):
+        """缓存 -> 合并进行中的相同查询 -> 按命令限流执行"""
+        if command == 'profile':
+            return await handler(params), False
+        key = (command, tuple(sorted(params.items())))
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached, True
+
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._run(command, handler, params, key))
+            self._inflight[key] = future
+            future.add_done_callback(lambda f: self._inflight.pop(key, None))
+        return await asyncio.shield(future), False
+
+    async def _run(self, command, handler, params, key):
+        async with self.limiters[command].slot():
+            value = await handler(params)
+        self.cache.put(key, value, self.cache_ttl.get(command))
+        return value
+
+    def _param(self, params, name):
+        value = params.get(name, "").strip()
+        if not value:
+            raise QueryError(f"缺少参数: {name}")
+        return value
+
+    async def route(self, params):
+        ship = self._param(params, 'ship')
+        jump_range = self._param(params, 'range')
+        start, end = self._param(params, 'start'), self._param(params, 'end')
+        session = await self.get_session() if self.get_session else None
+        route = await get_jump_route(ship, jump_range, start, end, self.index, session, self.route_cache)
+        if isinstance(route, str):
+            raise QueryError(route, 404 if route.startswith(("未找到", "星系名称不唯一")) else 502)
+        route_str, total_fuel, total_distance = route
+        text = (f"跳跃路线：{route_str}\n"
+                f"总共消耗燃料：{total_fuel} 同位素\n"
+                f"总共光年距离：{total_distance:.3f} ly")
+        return {'ship': ship, 'range': jump_range, 'route': route_str, 'fuel': total_fuel, 'distance': total_distance}, text
+
+    async def distance(self, params):
+        system_name = self._param(params, 'system')
+        result = calc_dist(system_name, self.index)
+        if result is None:
+            raise QueryError(f"未找到星系: {system_name}", 404)
+        *distances, en_name, zh_name = result
+        distances = dict(zip(WATCHED_SYSTEMS, distances))
+        text = "\n".join([f"{name}: {ly:.2f}" for name, ly in distances.items()] + [f"{en_name}, {zh_name}"])
+        return {'system': en_name, 'zh_name': zh_name, 'distances': distances}, text
+
+    async def jump(self, params):
+        """按星系序列计算各舰船配置的逐跳燃料、冷却和疲劳"""
+        systems = []
+        for name in self._param(params, 'route').split(","):
+            try:
+                systems.append(self.index.resolve(name))
+            except SystemLookupError as e:
+                raise QueryError(str(e), 404)
+        if len(systems) < 2:
+            raise QueryError("路线至少需要两个星系")
+        try:
+            configs = [jump_config(*ship.split(":", 1)) for ship in self._param(params, 'ships').split(",")]
+        except ValueError as e:
+            raise QueryError(str(e))
+        plans = evaluate_many([route_distances(systems)], configs)[0]
+        lines = []
+        for plan in plans:
+            note = "" if plan.feasible else f" (第{','.join(str(i + 1) for i in plan.out_of_range)}跳超出距离)"
+            lines.append(f"{plan.config.label}: 燃料 {plan.total_fuel:,}, 到达时疲劳 {format_minutes(plan.fatigue[-1])}{note}")
+        route = [system.name for system in systems]
+        return {'route': route, 'plans': [plan.to_dict() for plan in plans]}, " --> ".join(route) + "\n" + "\n".join(lines)
+
+    async def profile(self, params):
+        action = params.get('action', 'status')
+        try:
+            result = await self.profiler.command(action, int(params.get('count', 1)), float(params.get('seconds', 10)))
+        except ValueError as e:
+            raise QueryError(str(e))
+        return result, json.dumps(result, ensure_ascii=False)
+
+    async def kill(self, params):
+        if self.kill_lookup is None:
+            raise QueryError("击杀查询不可用", 503)
+        kill_id = self._param(params, 'id')
+        if not kill_id.isdigit():
+            raise QueryError(f"无效的击杀ID: {kill_id}")
+        report = await self.kill_lookup(int(kill_id))
+        if report is None:
+            raise QueryError(f"未找到击杀: {kill_id}", 404)
+        return report.to_dict(), report.to_text()
@@ -0,0 +1,268 @@
+import sys
+import time
+import math
+import logging
+
+from universe import default_index, SystemLookupError, LIGHT_YEAR
+from jumpcalc import ship_profile
+
+logger = logging.getLogger("eve_monitor")
+
+# 旗舰无法跳入的星域: 乔夫星域和波赫文
+NO_JUMP_REGIONS = frozenset([10000004, 10000017, 10000019, 10000070])
+HIGHSEC = 0.45  # 安等四舍五入后 >= 0.5 为高安
+
+
+def jumpable(system):
+    """旗舰能否跳入: 只限新伊甸的低安/00，不含乔夫星域和波赫文"""
+    return (30000000 <= system.system_id < 31000000 and system.security < HIGHSEC
+            and system.region_id not in NO_JUMP_REGIONS)
+
+
+class JumpGraph:
+    """
+    某一跳跃距离下的跳跃图。星系按边长为跳跃距离的立方网格分桶，
+    每个星系只需检查相邻 27 个格子，一次建出全部邻接表。
+    """
+
+    def __init__(self, index, range_ly):
+        self.range_ly = range_ly
+        self.nodes = [s for s in index.systems.values() if jumpable(s)]
+        self.position = {s.system_id: i for i, s in enumerate(self.nodes)}
+        self.neighbors = [[] for _ in self.nodes]  # 节点序号 -> [(邻居序号, 距离ly), ...]
+        self._build()
+
+    def _build(self):
+        cell = self.range_ly
+        coords = [(s.x / LIGHT_YEAR, s.y / LIGHT_YEAR, s.z / LIGHT_YEAR) for s in self.nodes]
+        grid = {}
+        for i, (x, y, z) in enumerate(coords):
+            grid.setdefault((math.floor(x / cell), math.floor(y / cell), math.floor(z / cell)), []).append(i)
+
+        limit = self.range_ly * self.range_ly
+        offsets = [(dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1)]
+        neighbors = self.neighbors
+        for (cx, cy, cz), members in grid.items():
+            candidates = []
+            for dx, dy, dz in offsets:
+                candidates += grid.get((cx + dx, cy + dy, cz + dz), ())
+            for i in members:
+                x, y, z = coords[i]
+                for j in candidates:
+                    # 每条边只计算一次，两端同时加入
+                    if j <= i:
+                        continue
+                    ox, oy, oz = coords[j]
+                    dx, dy, dz = x - ox, y - oy, z - oz
+                    d2 = dx * dx + dy * dy + dz * dz
+                    if d2 <= limit:
+                        d = math.sqrt(d2)
+                        neighbors[i].append((j, d))
+                        neighbors[j].append((i, d))
+
+    def edge_count(self):
+        return sum(len(n) for n in self.neighbors) // 2
+
+
+class ReachResult:
+    """可达结果: 星系ID -> (最少跳数, 该跳数下的最少燃料, 出发星系ID)"""
+    __slots__ = ('sources', 'range_ly', 'max_jumps', 'systems')
+
+    def __init__(self, sources, range_ly, max_jumps, systems):
+        self.sources = sources
+        self.range_ly = range_ly
+        self.max_jumps = max_jumps
+        self.systems = systems
+
+    def __len__(self):
+        return len(self.systems)
+
+    def __contains__(self, system_id):
+        return system_id in self.systems
+
+    def jumps(self, system_id):
+        entry = self.systems.get(system_id)
+        return entry[0] if entry else None
+
+    def by_jumps(self):
+        """跳数 -> 星系ID列表"""
+        layers = {}
+        for system_id, (jumps, _, _) in self.systems.items():
+            layers.setdefault(jumps, []).append(system_id)
+        return dict(sorted(layers.items()))
+
+
+class ReachEngine:
+    """批量可达计算，按跳跃距离缓存跳跃图"""
+
+    def __init__(self, index=None, max_graphs=4):
+        self.index = index or default_index()
+        self.max_graphs = max_graphs
+        self._graphs = {}
+
+    def graph(self, range_ly):
+        key = round(range_ly, 3)
+        graph = self._graphs.pop(key, None)
+        if graph is None:
+            start = time.perf_counter()
+            graph = JumpGraph(self.index.load(), key)
+            logger.info(f"跳跃图 {key}ly: {len(graph.nodes)}个星系 {graph.edge_count()}条边, "
+                        f"耗时 {(time.perf_counter() - start) * 1000:.0f}ms")
+        self._graphs[key] = graph
+        while len(self._graphs) > self.max_graphs:
+            self._graphs.pop(next(iter(self._graphs)))
+        return graph
+
+    def _resolve(self, names):
+        systems = []
+        for name in names:
+            if hasattr(name, 'system_id'):
+                systems.append(name)
+                continue
+            try:
+                systems.append(self.index.resolve(name))
+            except SystemLookupError as e:
+                raise ValueError(str(e))
+        return systems
+
+    def reach(self, sources, range_ly, max_jumps, fuel_per_ly=0.0):
+        """
+        多源 BFS: 从任一出发星系在 max_jumps 跳内可到达的星系。
+        同一跳数的多条路径取燃料最少的一条；出发星系本身为 0 跳。
+        """
+        graph = self.graph(range_ly)
+        sources = self._resolve(sources)
+        best = {}  # 节点序号 -> (跳数, 燃料, 出发星系ID)
+        frontier = []
+        for system in sources:
+            i = graph.position.get(system.system_id)
+            if i is None:
+                logger.warning(f"{system.name} 不能作为旗舰跳跃起点 (高安/虫洞/乔夫)")
+                continue
+            best[i] = (0, 0.0, system.system_id)
+            frontier.append(i)
+
+        neighbors = graph.neighbors
+        for jumps in range(1, max_jumps + 1):
+            layer = {}
+            for i in frontier:
+                _, fuel, origin = best[i]
+                for j, distance in neighbors[i]:
+                    if j in best:
+                        continue
+                    cost = fuel + distance * fuel_per_ly
+                    current = layer.get(j)
+                    if current is None or cost < current[1]:
+                        layer[j] = (jumps, cost, origin)
+            if not layer:
+                break
+            best.update(layer)
+            frontier = list(layer)
+
+        nodes = graph.nodes
+        systems = {nodes[i].system_id: (j, round(f), origin) for i, (j, f, origin) in best.items()}
+        return ReachResult([s.system_id for s in sources], range_ly, max_jumps, systems)
+
+    def common_reach(self, sources, range_ly, max_jumps, fuel_per_ly=0.0):
+        """
+        所有出发星系都能在 max_jumps 跳内到达的星系 (交集)。
+        每个星系记录各出发点中最多的跳数、对应燃料和出发星系。
+        """
+        sources = self._resolve(sources)
+        results = [self.reach([s], range_ly, max_jumps, fuel_per_ly) for s in sources]
+        if not results:
+            return ReachResult([], range_ly, max_jumps, {})
+        common = set(results[0].systems)
+        for result in results[1:]:
+            common &= result.systems.keys()
+        systems = {system_id: max((r.systems[system_id] for r in results), key=lambda e: (e[0], e[1]))
+                   for system_id in common}
+        return ReachResult([s.system_id for s in sources], range_ly, max_jumps, systems)
+
+
+JUMP_COLORS = [(255, 215, 0), (80, 220, 100), (60, 170, 255), (200, 120, 255), (255, 120, 80), (255, 255, 255)]
+
+
+def render_reach_map(result, index=None, path="reach.png", region_ids=None, size=1200, font=None):
+    """
+    把可达结果画成俯视星图 (x/z 平面)。region_ids 为空时画出包含全部可达星系的星域，
+    不可达星系为灰点，可达星系按跳数着色，出发星系标注名称。
+    """
+    from PIL import Image, ImageDraw
+
+    index = index or default_index()
+    if not region_ids:
+        region_ids = {index.systems[system_id].region_id for system_id in result.systems}
+    region_ids = set(region_ids)
+    systems = [s for s in index.systems.values() if s.region_id in region_ids and s.system_id < 31000000]
+    if not systems:
+        raise ValueError("没有可绘制的星系")
+
+    margin = 40
+    xs = [s.x for s in systems]
+    zs = [s.z for s in systems]
+    min_x, max_x, min_z, max_z = min(xs), max(xs), min(zs), max(zs)
+    scale = (size - 2 * margin) / max(max_x - min_x, max_z - min_z, 1.0)
+
+    def project(system):
+        # 星图北方为 z 轴正方向，图片 y 轴向下所以取反
+        return margin + (system.x - min_x) * scale, size - margin - (system.z - min_z) * scale
+
+    image = Image.new("RGB", (size, size), (12, 14, 20))
+    draw = ImageDraw.Draw(image)
+    for system in systems:
+        x, y = project(system)
+        entry = result.systems.get(system.system_id)
+        if entry is None:
+            draw.ellipse((x - 1.5, y - 1.5, x + 1.5, y + 1.5), fill=(70, 70, 80))
+        else:
+            color = JUMP_COLORS[min(entry[0], len(JUMP_COLORS) - 1)]
+            draw.ellipse((x - 3, y - 3, x + 3, y + 3), fill=color)
+
+    for system_id in result.sources:
+        system = index.systems[system_id]
+        if system.region_id not in region_ids:
+            continue
+        x, y = project(system)
+        draw.ellipse((x - 6, y - 6, x + 6, y + 6), outline=JUMP_COLORS[0], width=2)
+        draw.text((x + 8, y - 8), f"{system.zh_name}({system.name})", fill=(255, 255, 255), font=font)
+
+    legend_y = margin // 2
+    for jumps, members in result.by_jumps().items():
+        color = JUMP_COLORS[min(jumps, len(JUMP_COLORS) - 1)]
+        draw.text((margin, legend_y), f"{jumps}跳: {len(members)}", fill=color, font=font)
+        legend_y += 18
+    image.save(path)
+    return path
+
+
+# 命令行: python reach.py Archon 555 3 4-HWWF [更多出发星系...] [--common] [--map out.png]
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    args = sys.argv[1:]
+    map_path = None
+    if "--map" in args:
+        map_path = args.pop(args.index("--map") + 1)
+        args.remove("--map")
+    common = "--common" in args
+    if common:
+        args.remove("--common")
+    if len(args) < 4:
+        print("用法: python reach.py 舰船 技能 最大跳数 出发星系... [--common] [--map out.png]")
+        sys.exit(1)
+
+    ship, skills, max_jumps, sources = args[0], args[1], int(args[2]), args[3:]
+    range_ly, fuel_per_ly = ship_profile(ship, skills)
+    engine = ReachEngine()
+    start = time.perf_counter()
+    if common:
+        result = engine.common_reach(sources, range_ly, max_jumps, fuel_per_ly)
+    else:
+        result = engine.reach(sources, range_ly, max_jumps, fuel_per_ly)
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"{ship} {range_ly:.2f}ly, {max_jumps}跳内可达 {len(result)} 个星系 ({elapsed:.0f}ms)")
+    for jumps, members in result.by_jumps().items():
+        print(f"  {jumps}跳: {len(members)}")
+    if map_path:
+        from include import ICONY_FONT
+        print(render_reach_map(result, engine.index, map_path, font=ICONY_FONT))
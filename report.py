@@ -0,0 +1,93 @@
+import json
+
+from fitting import SLOT_ORDER
+from prices import format_isk
+
+
+class KillReport:
+    """
+    一次丰富的结果 (星系、名称、物品分组与价格)，由各输出格式共用，
+    生成N种输出只需一次ESI/丰富请求加N次本地渲染。
+    """
+    __slots__ = ('killmail', 'killmail_time', 'system_name', 'security_status', 'constellation', 'region',
+                 'victim_name', 'victim_corp', 'victim_alliance', 'victim_ship', 'final_blow_name',
+                 'groups', 'top_drops', 'generated_at')
+
+    def __init__(self, killmail, killmail_time, system_name, security_status, constellation, region,
+                 victim_name, victim_corp, victim_alliance, victim_ship, final_blow_name, groups, top_drops,
+                 generated_at=None):
+        self.killmail = killmail
+        self.killmail_time = killmail_time
+        self.system_name = system_name
+        self.security_status = security_status
+        self.constellation = constellation
+        self.region = region
+        self.victim_name = victim_name
+        self.victim_corp = victim_corp
+        self.victim_alliance = victim_alliance
+        self.victim_ship = victim_ship
+        self.final_blow_name = final_blow_name
+        self.groups = groups
+        self.top_drops = top_drops
+        self.generated_at = generated_at  # 同一击杀的各输出文件使用相同的时间戳
+
+    @property
+    def zkb(self):
+        return self.killmail.zkb
+
+    def slot_lines(self):
+        """按槽位列出的物品文本行"""
+        lines = []
+        for slot, slot_items in self.groups.slots:
+            slot_name = SLOT_ORDER[slot].strip()
+            slot_value = sum(line.value for line in slot_items)
+            lines.append(f"{slot_name}: {format_isk(slot_value)}" if slot_value else slot_name + ":")
+            for line in slot_items:
+                value_note = f" ({format_isk(line.value)})" if line.value else ""
+                indent = "    - " if line.sub_item else " - "
+                lines.append(f"{indent}{line.name} x{line.quantity} {'掉落' if line.dropped else '摧毁'}{value_note}")
+        if self.top_drops:
+            lines.append("最贵掉落:")
+            lines += [f" - {line.name} x{line.quantity} ({format_isk(line.value)})" for line in self.top_drops]
+        return lines
+
+    def to_text(self):
+        """纯文本摘要"""
+        zkb = self.zkb
+        security = f" ({self.security_status:.1f})" if self.security_status is not None else ""
+        lines = [
+            f"Kill #{self.killmail.killmail_id}  {self.killmail_time}",
+            f"{self.victim_name} [{self.victim_corp}{' / ' + self.victim_alliance if self.victim_alliance else ''}]",
+            f"舰船: {self.victim_ship}",
+            f"星系: {self.system_name}{security} < {self.constellation} < {self.region}",
+            f"参与人数: {len(self.killmail.attackers)}  最后一击: {self.final_blow_name or '-'}",
+        ]
+        if zkb:
+            lines.append(f"总价值: {zkb.total_value:,.2f} ISK  掉落: {zkb.dropped_value:,.2f} ISK  摧毁: {zkb.destroyed_value:,.2f} ISK")
+        lines.append("")
+        lines += self.slot_lines()
+        return "\n".join(lines)
+
+    def to_dict(self):
+        """JSON摘要"""
+        killmail = self.killmail
+        zkb = self.zkb
+        return {
+            'killmail_id': killmail.killmail_id,
+            'killmail_time': self.killmail_time,
+            'system': {'id': killmail.solar_system_id, 'name': self.system_name, 'security': self.security_status,
+                       'constellation': self.constellation, 'region': self.region},
+            'victim': {'name': self.victim_name, 'corporation': self.victim_corp, 'alliance': self.victim_alliance,
+                       'ship': self.victim_ship, 'ship_type_id': killmail.victim.ship_type_id,
+                       'damage_taken': killmail.victim.damage_taken},
+            'attackers': {'count': len(killmail.attackers), 'final_blow': self.final_blow_name},
+            'value': {'total': zkb.total_value, 'dropped': zkb.dropped_value, 'destroyed': zkb.destroyed_value} if zkb else None,
+            'items': [
+                {'slot': SLOT_ORDER[line.slot].strip(), 'type_id': line.type_id, 'name': line.name,
+                 'quantity': line.quantity, 'dropped': line.dropped, 'sub_item': line.sub_item, 'value': line.value}
+                for line in self.groups.lines
+            ],
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), ensure_ascii=False, indent=2)
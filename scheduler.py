@@ -0,0 +1,203 @@
+import time
+import asyncio
+import logging
+import threading
+from urllib.parse import urlsplit
+
+logger = logging.getLogger("eve_monitor")
+
+# 请求优先级，数值越小越优先
+PRIORITY_KILLMAIL = 0
+PRIORITY_NAMES = 1
+PRIORITY_IMAGES = 2
+PRIORITY_PORTRAITS = 3
+
+PRIORITY_LABELS = {
+    PRIORITY_KILLMAIL: "killmail",
+    PRIORITY_NAMES: "names",
+    PRIORITY_IMAGES: "images",
+    PRIORITY_PORTRAITS: "portraits",
+}
+
+
+class RequestShed(Exception):
+    """负载过高或错误预算不足时被丢弃的低优先级请求"""
+
+
+class TokenBucket:
+    """令牌桶，rate 为每秒补充的令牌数，capacity 为允许的突发量"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self, now):
+        """尝试取一个令牌，成功返回0，否则返回需要等待的秒数"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class HostState:
+    """单个主机的限速、退避、排队情况和错误预算 (只有返回ESI错误限额头的主机才有预算)"""
+
+    def __init__(self, rate, capacity):
+        self.bucket = TokenBucket(rate, capacity)
+        self.failures = 0
+        self.backoff_until = 0
+        self.waiting = [0] * len(PRIORITY_LABELS)
+        self.error_remain = None
+        self.error_reset_at = 0
+
+
+class RequestScheduler:
+    """
+    统一的出站请求调度器:
+      - 每个主机一个令牌桶
+      - 按优先级排队，低优先级让位于同主机上等待中的高优先级请求
+      - 按主机跟踪ESI错误预算 (X-ESI-Error-Limit-Remain/Reset)，预算紧张时丢弃该主机的低优先级请求
+      - 网络失败时按主机统一指数退避，而不是每个调用者各自重试
+    同时提供 asyncio 和线程 (requests) 两种获取方式。
+    """
+
+    def __init__(self, host_limits=None, default_limit=(10, 20),
+                 error_budget_low=40, error_budget_critical=10,
+                 shed_queue_depth=20, max_backoff=60):
+        self.host_limits = host_limits or {}
+        self.default_limit = default_limit
+        self.error_budget_low = error_budget_low
+        self.error_budget_critical = error_budget_critical
+        self.shed_queue_depth = shed_queue_depth
+        self.max_backoff = max_backoff
+
+        self.shed_counts = [0] * len(PRIORITY_LABELS)
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _host(self, url):
+        host = urlsplit(url).hostname or ""
+        state = self._hosts.get(host)
+        if state is None:
+            rate, capacity = self.host_limits.get(host, self.default_limit)
+            state = self._hosts[host] = HostState(rate, capacity)
+        return state
+
+    def _should_shed(self, state, priority, now):
+        """判断请求是否应被丢弃 (调用时已持有锁)"""
+        if priority == PRIORITY_KILLMAIL:
+            return False
+        if state.error_remain is not None and now < state.error_reset_at:
+            if state.error_remain <= self.error_budget_critical:
+                return True
+            if state.error_remain <= self.error_budget_low and priority >= PRIORITY_IMAGES:
+                return True
+        # 高优先级请求积压时放弃头像，保证击杀本身不被拖慢
+        if priority == PRIORITY_PORTRAITS and sum(state.waiting[:PRIORITY_PORTRAITS]) >= self.shed_queue_depth:
+            return True
+        return False
+
+    def _try_admit(self, state, priority):
+        """尝试放行一个请求，返回需要等待的秒数，0表示已放行"""
+        now = time.monotonic()
+        with self._lock:
+            if self._should_shed(state, priority, now):
+                self.shed_counts[priority] += 1
+                raise RequestShed(f"丢弃{PRIORITY_LABELS[priority]}请求")
+            # 错误预算耗尽时，击杀请求等到重置时间
+            if state.error_remain is not None and state.error_remain <= self.error_budget_critical and now < state.error_reset_at:
+                return state.error_reset_at - now
+            if now < state.backoff_until:
+                return state.backoff_until - now
+            if any(state.waiting[:priority]):
+                return 0.05
+            return state.bucket.take(now)
+
+    def _enter(self, state, priority):
+        with self._lock:
+            state.waiting[priority] += 1
+
+    def _leave(self, state, priority):
+        with self._lock:
+            state.waiting[priority] -= 1
+
+    async def acquire(self, url, priority=PRIORITY_IMAGES):
+        """异步获取请求许可，被丢弃时抛出 RequestShed"""
+        state = self._host(url)
+        self._enter(state, priority)
+        try:
+            while True:
+                wait = self._try_admit(state, priority)
+                if not wait:
+                    return
+                await asyncio.sleep(wait)
+        finally:
+            self._leave(state, priority)
+
+    def acquire_sync(self, url, priority=PRIORITY_NAMES):
+        """线程中使用的阻塞版本"""
+        state = self._host(url)
+        self._enter(state, priority)
+        try:
+            while True:
+                wait = self._try_admit(state, priority)
+                if not wait:
+                    return
+                time.sleep(wait)
+        finally:
+            self._leave(state, priority)
+
+    def record_response(self, url, status, headers=None):
+        """记录响应状态和ESI错误限额头"""
+        headers = headers or {}
+        state = self._host(url)
+        now = time.monotonic()
+        with self._lock:
+            remain = headers.get('X-ESI-Error-Limit-Remain')
+            reset = headers.get('X-ESI-Error-Limit-Reset')
+            if remain is not None and reset is not None:
+                try:
+                    state.error_remain = int(remain)
+                    state.error_reset_at = now + int(reset)
+                except ValueError:
+                    pass
+            if status in (420, 429):
+                # 已被限流，等待服务器给出的时间
+                retry_after = headers.get('Retry-After') or reset or 60
+                try:
+                    retry_after = float(retry_after)
+                except ValueError:
+                    retry_after = 60
+                state.backoff_until = max(state.backoff_until, now + retry_after)
+                if status == 420:
+                    state.error_remain = 0
+                    state.error_reset_at = max(state.error_reset_at, now + retry_after)
+                logger.warning(f"请求被限流 ({status})，{urlsplit(url).hostname} 暂停 {retry_after:.0f}秒")
+            elif status < 500:
+                state.failures = 0
+
+        if state.error_remain is not None and state.error_remain <= self.error_budget_low:
+            logger.warning(f"ESI错误预算偏低: {urlsplit(url).hostname} 剩余 {state.error_remain}")
+
+    def record_failure(self, url):
+        """记录网络失败，对该主机整体进行指数退避"""
+        state = self._host(url)
+        with self._lock:
+            state.failures += 1
+            delay = min(self.max_backoff, 2 ** (state.failures - 1))
+            state.backoff_until = max(state.backoff_until, time.monotonic() + delay)
+        logger.warning(f"{urlsplit(url).hostname} 请求失败 {state.failures} 次，退避 {delay}秒")
+        return delay
+
+    def stats(self):
+        """返回当前调度状态，便于日志和排查"""
+        with self._lock:
+            return {
+                'error_remain': {host: s.error_remain for host, s in self._hosts.items() if s.error_remain is not None},
+                'shed': {PRIORITY_LABELS[p]: n for p, n in enumerate(self.shed_counts)},
+                'waiting': {host: sum(s.waiting) for host, s in self._hosts.items()},
+            }
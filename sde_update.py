@@ -0,0 +1,246 @@
+import os
+import re
+import sys
+import csv
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+from array import array
+
+from include import SDE_DIR, SDE_ICONS_DIR, ATLAS_DIR, ATLAS_SIZES, SNAPSHOT_DIR
+from startup import load_snapshot, source_signature
+
+logger = logging.getLogger("eve_monitor")
+
+TYPES_YAML = os.path.join(SDE_DIR, 'fsd', 'types.yaml')
+ARTIFACT_MANIFEST = os.path.join(SDE_DIR, 'artifacts.json')  # 各派生文件上次生成时的输入指纹
+TYPE_GROUPS_FILE = os.path.join(SDE_DIR, 'type_groups.bin')   # 已排序的typeID数组 + 对应的groupID数组
+
+# 星系/星座/星域表及其主键，KillmailProcessor 按需加载
+UNIVERSE_TABLES = [
+    (os.path.join(SDE_DIR, 'mapSolarSystems.csv'), 'solarSystemID'),
+    (os.path.join(SDE_DIR, 'mapConstellations.csv'), 'constellationID'),
+    (os.path.join(SDE_DIR, 'mapRegions.csv'), 'regionID'),
+]
+
+_TOP_LEVEL_KEY = re.compile(rb'^(\d+):')
+
+
+class UpdateReport:
+    """一次SDE更新的变更统计和耗时"""
+
+    def __init__(self):
+        self.added = 0
+        self.changed = 0
+        self.removed = 0
+        self.unchanged = 0
+        self.artifacts = []
+        self.timings = {}
+
+    @property
+    def types_changed(self):
+        return self.added + self.changed + self.removed > 0
+
+    def __str__(self):
+        lines = [f"物品: 新增 {self.added}, 修改 {self.changed}, 删除 {self.removed}, 未变 {self.unchanged}",
+                 f"重新生成: {', '.join(self.artifacts) or '无'}"]
+        lines += [f"  {step:<20} {seconds:8.2f}s" for step, seconds in self.timings.items()]
+        return "\n".join(lines)
+
+
+def iter_type_chunks(path):
+    """
+    逐个读取 types.yaml 顶层条目，返回 (typeID, 原始文本)。
+    顶层键都从行首开始，按行切分即可，不需要把整个文件载入内存。
+    """
+    type_id, chunk = None, []
+    with open(path, 'rb') as f:
+        for line in f:
+            match = _TOP_LEVEL_KEY.match(line)
+            if match:
+                if type_id is not None:
+                    yield type_id, b"".join(chunk)
+                type_id, chunk = int(match.group(1)), []
+            if type_id is not None:
+                chunk.append(line)
+    if type_id is not None:
+        yield type_id, b"".join(chunk)
+
+
+def _yaml_loader():
+    import yaml
+    return getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+def type_row(type_id, item):
+    """items 表的一行，与原全量导入的字段一致"""
+    names = item.get('name') or {}
+    name = json.dumps({'zh': names.get('zh', ''), 'en': names.get('en', '')}, ensure_ascii=False)
+    return (type_id, name, item.get('marketGroupID', 0), item.get('groupID', 0))
+
+
+def ensure_schema(connection):
+    connection.execute('''CREATE TABLE IF NOT EXISTS items (
+        id INTEGER PRIMARY KEY, name TEXT, market_id INTEGER, groupid INTEGER)''')
+    connection.execute('CREATE TABLE IF NOT EXISTS type_hashes (id INTEGER PRIMARY KEY, hash TEXT)')
+
+
+def update_types(connection, path=TYPES_YAML, report=None):
+    """
+    流式读取 types.yaml，按每个物品原始文本的哈希与上次导入比较，
+    只解析并写入新增/变化的物品，删除已不存在的物品，全部在一个事务中完成。
+    首次运行时 (原全量导入的库没有哈希) 所有物品都会重写一次并记录哈希。
+    """
+    import yaml
+    report = report or UpdateReport()
+    loader = _yaml_loader()
+    start = time.perf_counter()
+    ensure_schema(connection)
+    old_hashes = dict(connection.execute('SELECT id, hash FROM type_hashes'))
+    existing = {row[0] for row in connection.execute('SELECT id FROM items')}
+
+    upserts, new_hashes, seen = [], [], set()
+    for type_id, chunk in iter_type_chunks(path):
+        seen.add(type_id)
+        digest = hashlib.blake2b(chunk, digest_size=16).hexdigest()
+        old = old_hashes.get(type_id)
+        if old == digest:
+            report.unchanged += 1
+            continue
+        if old is None and type_id not in existing:
+            report.added += 1
+        else:
+            report.changed += 1
+        item = yaml.load(chunk, Loader=loader)[type_id]
+        upserts.append(type_row(type_id, item))
+        new_hashes.append((type_id, digest))
+    # 与物品表比较，原全量导入中从未记录哈希的物品也能被删除
+    removed = [(type_id,) for type_id in (existing | old_hashes.keys()) - seen]
+    report.removed = len(removed)
+    report.timings['diff types'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with connection:
+        connection.executemany('INSERT OR REPLACE INTO items (id, name, market_id, groupid) VALUES (?, ?, ?, ?)', upserts)
+        connection.executemany('INSERT OR REPLACE INTO type_hashes (id, hash) VALUES (?, ?)', new_hashes)
+        connection.executemany('DELETE FROM items WHERE id = ?', removed)
+        connection.executemany('DELETE FROM type_hashes WHERE id = ?', removed)
+    report.timings['write types'] = time.perf_counter() - start
+    return report
+
+
+def parse_csv(filename, key_field):
+    """解析CSV数据到字典"""
+    data = {}
+    try:
+        with open(filename, mode='r', encoding='utf-8') as file:
+            reader = csv.DictReader(file)
+            for row in reader:
+                key = int(row[key_field])
+                data[key] = row
+    except Exception as e:
+        logger.error(f"加载CSV {filename} 失败: {e}")
+    return data
+
+
+def load_csv(filename, key_field):
+    """加载CSV表，源文件未变化时直接读取快照"""
+    return load_snapshot(filename, lambda: parse_csv(filename, key_field), SNAPSHOT_DIR)
+
+
+def write_type_groups(connection, path=TYPE_GROUPS_FILE):
+    """导出 typeID -> groupID 的并行数组，格式: 数量(uint32) + typeID数组 + groupID数组"""
+    rows = connection.execute('SELECT id, groupid FROM items ORDER BY id').fetchall()
+    type_ids = array('I', (row[0] for row in rows))
+    group_ids = array('I', (row[1] or 0 for row in rows))
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        array('I', [len(rows)]).tofile(f)
+        type_ids.tofile(f)
+        group_ids.tofile(f)
+    os.replace(tmp_path, path)
+
+
+def load_type_groups(path=TYPE_GROUPS_FILE):
+    """读取 write_type_groups 生成的数组，返回 (typeID数组, groupID数组)"""
+    with open(path, 'rb') as f:
+        count = array('I')
+        count.fromfile(f, 1)
+        type_ids, group_ids = array('I'), array('I')
+        type_ids.fromfile(f, count[0])
+        group_ids.fromfile(f, count[0])
+    return type_ids, group_ids
+
+
+def icon_fingerprint(icon_dir=SDE_ICONS_DIR, sizes=ATLAS_SIZES):
+    """图标目录的文件名、大小和修改时间，任一图标变化都会改变指纹"""
+    digest = hashlib.blake2b(repr(tuple(sizes)).encode(), digest_size=16)
+    with os.scandir(icon_dir) as entries:
+        for name, stat in sorted((e.name, e.stat()) for e in entries if e.is_file()):
+            digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+def types_fingerprint(connection):
+    digest = hashlib.blake2b(digest_size=16)
+    for (value,) in connection.execute('SELECT hash FROM type_hashes ORDER BY id'):
+        digest.update(value.encode())
+    return digest.hexdigest()
+
+
+def universe_fingerprint():
+    return repr([source_signature(path) if os.path.exists(path) else None for path, _ in UNIVERSE_TABLES])
+
+
+def update_artifacts(connection, report, manifest_path=ARTIFACT_MANIFEST):
+    """只重新生成输入发生变化的派生文件"""
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        manifest = {}
+
+    def rebuild(name, fingerprint, build, output=None):
+        if manifest.get(name) == fingerprint and (output is None or os.path.exists(output)):
+            return
+        start = time.perf_counter()
+        build()
+        manifest[name] = fingerprint
+        report.artifacts.append(name)
+        report.timings[f'build {name}'] = time.perf_counter() - start
+
+    rebuild('type_groups', types_fingerprint(connection), lambda: write_type_groups(connection), TYPE_GROUPS_FILE)
+    rebuild('universe', universe_fingerprint(), lambda: [load_csv(path, key) for path, key in UNIVERSE_TABLES])
+    if os.path.isdir(SDE_ICONS_DIR):
+        from icon_atlas import build_atlases
+        rebuild('atlas', icon_fingerprint(), build_atlases, os.path.join(ATLAS_DIR, 'atlas_meta.json'))
+
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+    return report
+
+
+def run_update(db_path='items.db', types_path=TYPES_YAML):
+    """增量更新物品库和派生文件，返回更新报告"""
+    start = time.perf_counter()
+    connection = sqlite3.connect(db_path)
+    try:
+        connection.execute("PRAGMA journal_mode=WAL")
+        report = update_types(connection, types_path)
+        update_artifacts(connection, report)
+        # 合并WAL，保证以 immutable 打开的只读连接能看到全部数据
+        connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        connection.close()
+    report.timings['total'] = time.perf_counter() - start
+    logger.info(f"SDE更新完成:\n{report}")
+    return report
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    run_update(types_path=sys.argv[1] if len(sys.argv) > 1 else TYPES_YAML)
@@ -0,0 +1,84 @@
+import os
+import sys
+import time
+import marshal
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger("eve_monitor")
+
+
+class StartupProfile:
+    """记录各组件的冷启动/首次加载耗时，便于跟踪重启时间"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.records = []
+
+    def record(self, component, seconds):
+        self.records.append((component, seconds))
+        logger.debug(f"加载 {component} 耗时 {seconds * 1000:.1f}ms")
+
+    @contextmanager
+    def measure(self, component):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(component, time.perf_counter() - start)
+
+    def report(self):
+        """生成启动耗时报告，按耗时从高到低排列"""
+        total = time.perf_counter() - self.started
+        lines = [f"启动耗时报告 (自程序启动 {total * 1000:.0f}ms):"]
+        for component, seconds in sorted(self.records, key=lambda r: r[1], reverse=True):
+            lines.append(f"  {component:<40} {seconds * 1000:8.1f}ms")
+        return "\n".join(lines)
+
+    def log_report(self):
+        logger.info(self.report())
+
+
+startup_profile = StartupProfile()
+
+
+def source_signature(path):
+    """源文件签名：大小、修改时间和解释器版本 (marshal格式与版本相关)"""
+    stat = os.stat(path)
+    return (stat.st_size, stat.st_mtime_ns, marshal.version, sys.version_info[:2])
+
+
+def load_snapshot(source_path, build, snapshot_dir):
+    """
+    读取源文件解析结果的二进制快照；源文件变化或快照不存在时调用 build() 重新解析并写入快照。
+    快照使用 marshal，只适用于由 dict/list/str/int/float 组成的数据。
+    """
+    name = os.path.basename(source_path)
+    snapshot_path = os.path.join(snapshot_dir, name + ".marshal")
+    try:
+        signature = source_signature(source_path)
+    except OSError:
+        signature = None
+
+    if signature is not None and os.path.exists(snapshot_path):
+        try:
+            with startup_profile.measure(f"snapshot:{name}"):
+                with open(snapshot_path, "rb") as f:
+                    cached_signature, data = marshal.load(f)
+            if tuple(cached_signature) == signature:
+                return data
+        except Exception as e:
+            logger.warning(f"读取快照 {snapshot_path} 失败，将重新解析: {e}")
+
+    with startup_profile.measure(f"parse:{name}"):
+        data = build()
+    if signature is not None and data:
+        try:
+            os.makedirs(snapshot_dir, exist_ok=True)
+            tmp_path = snapshot_path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                marshal.dump((signature, data), f)
+            os.replace(tmp_path, snapshot_path)
+        except Exception as e:
+            logger.warning(f"写入快照 {snapshot_path} 失败: {e}")
+    return data
@@ -0,0 +1,349 @@
+import os
+import sys
+import time
+import zlib
+import heapq
+import marshal
+import asyncio
+import logging
+from array import array
+from datetime import datetime, timedelta, timezone
+
+logger = logging.getLogger("eve_monitor")
+
+# 统计维度: 攻击方按参与计数，受害方按损失计数
+DIMENSIONS = (
+    'killer_character', 'killer_corporation', 'killer_alliance', 'killer_ship', 'final_blow',
+    'victim_corporation', 'victim_alliance', 'ship_lost',
+    'system', 'region',
+)
+# 按星域细分的维度，每个星域单独一组前K项 (不建计数草图)
+REGIONAL_DIMENSIONS = ('killer_character', 'killer_alliance', 'ship_lost')
+METRICS = ('kills', 'isk')
+
+_PRIME = (1 << 61) - 1
+_SEEDS = ((0x9E3779B1, 0x7F4A7C15), (0x85EBCA77, 0xC2B2AE3D), (0x27D4EB2F, 0x165667B1), (0xFD7046C5, 0xB55A4F09))
+
+
+class CountMinSketch:
+    """Count-Min 计数草图: 任意键的计数估计值只会偏大，占用固定内存 (depth × width 个单精度浮点数)"""
+
+    def __init__(self, width=1024, depth=4, rows=None):
+        self.width = width
+        self.depth = depth
+        self.rows = rows or [array('f', bytes(4 * width)) for _ in range(depth)]
+
+    def _indexes(self, key):
+        # 键都是整数ID，使用固定参数的乘法哈希，保证持久化后跨进程一致
+        for a, b in _SEEDS[:self.depth]:
+            yield ((a * key + b) % _PRIME) % self.width
+
+    def add(self, key, amount=1.0):
+        for row, index in zip(self.rows, self._indexes(key)):
+            row[index] += amount
+
+    def estimate(self, key):
+        return min(row[index] for row, index in zip(self.rows, self._indexes(key)))
+
+    def dump(self):
+        # 草图大部分为0，压缩后体积很小
+        return (self.width, self.depth, zlib.compress(b"".join(row.tobytes() for row in self.rows)))
+
+    @classmethod
+    def load(cls, data):
+        width, depth, raw = data
+        raw = zlib.decompress(raw)
+        loaded = []
+        for i in range(depth):
+            row = array('f')
+            row.frombytes(raw[i * 4 * width:(i + 1) * 4 * width])
+            loaded.append(row)
+        return cls(width, depth, loaded)
+
+
+class SpaceSaving:
+    """Space-Saving 算法的前K项统计: 最多保留 capacity 个键，满时替换计数最小的键"""
+
+    def __init__(self, capacity=100, counters=None):
+        self.capacity = capacity
+        self.counters = counters or {}  # 键 -> [计数, 误差上界]
+        self._heap = None  # (计数, 键) 最小堆，计数只增不减，过期条目在淘汰时修正
+
+    def _pop_min(self):
+        if self._heap is None:
+            self._heap = [(c[0], k) for k, c in self.counters.items()]
+            heapq.heapify(self._heap)
+        while True:
+            count, key = heapq.heappop(self._heap)
+            current = self.counters[key][0]
+            if current == count:
+                return key, count
+            heapq.heappush(self._heap, (current, key))
+
+    def add(self, key, amount=1.0):
+        counter = self.counters.get(key)
+        if counter is not None:
+            counter[0] += amount
+            return
+        if len(self.counters) < self.capacity:
+            self.counters[key] = [amount, 0.0]
+        else:
+            min_key, min_count = self._pop_min()
+            del self.counters[min_key]
+            self.counters[key] = [min_count + amount, min_count]
+        if self._heap is not None:
+            heapq.heappush(self._heap, (self.counters[key][0], key))
+
+    def top(self, n):
+        return sorted(((k, c[0]) for k, c in self.counters.items()), key=lambda kv: kv[1], reverse=True)[:n]
+
+    def dump(self):
+        return (self.capacity, self.counters)
+
+    @classmethod
+    def load(cls, data):
+        capacity, counters = data
+        return cls(capacity, {k: list(v) for k, v in counters.items()})
+
+
+class StatsBucket:
+    """一个时间桶 (一天) 内各维度、各指标的计数草图和前K项"""
+
+    def __init__(self, day, width=1024, depth=4, capacity=100):
+        self.day = day
+        self.kills = 0
+        self.isk = 0.0
+        self.sketches = {}
+        self.tops = {}
+        self.dirty = False
+        self._width, self._depth, self._capacity = width, depth, capacity
+
+    def _key(self, dimension, metric):
+        return f"{dimension}:{metric}"
+
+    def add(self, dimension, entity_id, isk, sketch=True):
+        for metric, amount in (('kills', 1.0), ('isk', isk)):
+            key = self._key(dimension, metric)
+            top = self.tops.get(key)
+            if top is None:
+                top = self.tops[key] = SpaceSaving(self._capacity)
+            top.add(entity_id, amount)
+            if sketch:
+                if key not in self.sketches:
+                    self.sketches[key] = CountMinSketch(self._width, self._depth)
+                self.sketches[key].add(entity_id, amount)
+        self.dirty = True
+
+    def dump(self):
+        return {
+            'day': self.day, 'kills': self.kills, 'isk': self.isk,
+            'sketches': {k: s.dump() for k, s in self.sketches.items()},
+            'tops': {k: t.dump() for k, t in self.tops.items()},
+        }
+
+    @classmethod
+    def load(cls, data):
+        bucket = cls(data['day'])
+        bucket.kills = data['kills']
+        bucket.isk = data['isk']
+        bucket.sketches = {k: CountMinSketch.load(v) for k, v in data['sketches'].items()}
+        bucket.tops = {k: SpaceSaving.load(v) for k, v in data['tops'].items()}
+        return bucket
+
+
+class StatsEngine:
+    """
+    增量聚合已接收的击杀，按天分桶保存各维度的击杀数/ISK计数草图和前K项。
+    查询只合并相关日期的桶，不重新扫描原始击杀；超过保留期的桶被丢弃，内存和磁盘占用有上限。
+    """
+
+    def __init__(self, stats_dir, region_of=None, retention_days=90, width=1024, depth=4, capacity=100):
+        self.stats_dir = stats_dir
+        self.region_of = region_of or (lambda system_id: None)
+        self.retention_days = retention_days
+        self.width, self.depth, self.capacity = width, depth, capacity
+        self.buckets = {}
+        self._loaded = False
+
+    def _day_of(self, killmail):
+        """击杀时间所在的日期 (UTC)，格式 20250101"""
+        killmail_time = killmail.killmail_time
+        if killmail_time:
+            return int(killmail_time[:10].replace('-', ''))
+        return int(datetime.now(timezone.utc).strftime('%Y%m%d'))
+
+    def _bucket(self, day):
+        bucket = self.buckets.get(day)
+        if bucket is None:
+            bucket = self.buckets[day] = StatsBucket(day, self.width, self.depth, self.capacity)
+        return bucket
+
+    def record(self, killmail, zkb):
+        """记录一个击杀；需要包含星系、受害者和攻击者的完整击杀 (ESI)，只有killID时只计入每日总数"""
+        if not self._loaded:
+            self.load()
+        bucket = self._bucket(self._day_of(killmail))
+        isk = zkb.total_value if zkb else 0.0
+        victim = killmail.victim
+        system_id = killmail.solar_system_id
+        region_id = self.region_of(system_id) if system_id else None
+
+        entities = {
+            'victim_corporation': victim.corporation_id,
+            'victim_alliance': victim.alliance_id,
+            'ship_lost': victim.ship_type_id,
+            'system': system_id,
+            'region': region_id,
+        }
+        for dimension, entity_id in entities.items():
+            if entity_id:
+                bucket.add(dimension, entity_id, isk)
+
+        # 同一击杀中同一公司/联盟/舰船只计一次
+        killers = {'killer_character': set(), 'killer_corporation': set(), 'killer_alliance': set(),
+                   'killer_ship': set(), 'final_blow': set()}
+        for attacker in killmail.attackers:
+            for dimension, entity_id in (('killer_character', attacker.character_id),
+                                         ('killer_corporation', attacker.corporation_id),
+                                         ('killer_alliance', attacker.alliance_id),
+                                         ('killer_ship', attacker.ship_type_id),
+                                         ('final_blow', attacker.character_id if attacker.final_blow else None)):
+                if entity_id:
+                    killers[dimension].add(entity_id)
+        for dimension, entity_ids in killers.items():
+            for entity_id in entity_ids:
+                bucket.add(dimension, entity_id, isk)
+
+        if region_id:
+            regional = {'killer_character': killers['killer_character'],
+                        'killer_alliance': killers['killer_alliance'],
+                        'ship_lost': {victim.ship_type_id} if victim.ship_type_id else ()}
+            for dimension in REGIONAL_DIMENSIONS:
+                entity_ids = regional[dimension]
+                for entity_id in entity_ids:
+                    bucket.add(f"{dimension}@{region_id}", entity_id, isk, sketch=False)
+
+        bucket.kills += 1
+        bucket.isk += isk
+        bucket.dirty = True
+
+    def _days(self, days, until=None):
+        until = until or datetime.now(timezone.utc)
+        return {int((until - timedelta(days=i)).strftime('%Y%m%d')) for i in range(days)}
+
+    def _query_buckets(self, days, until=None):
+        if not self._loaded:
+            self.load()
+        wanted = self._days(days, until)
+        return [bucket for day, bucket in self.buckets.items() if day in wanted]
+
+    def top(self, dimension, metric='kills', days=7, n=10, region_id=None, until=None):
+        """最近 days 天内某维度的前N项，返回 [(实体ID, 数值)]"""
+        if region_id is not None:
+            dimension = f"{dimension}@{region_id}"
+        key = f"{dimension}:{metric}"
+        totals = {}
+        for bucket in self._query_buckets(days, until):
+            top = bucket.tops.get(key)
+            if top is None:
+                continue
+            for entity_id, count in top.counters.items():
+                totals[entity_id] = totals.get(entity_id, 0.0) + count[0]
+        return sorted(totals.items(), key=lambda kv: kv[1], reverse=True)[:n]
+
+    def estimate(self, dimension, entity_id, metric='kills', days=7, until=None):
+        """最近 days 天内某个实体的计数估计 (Count-Min，不小于真实值)"""
+        key = f"{dimension}:{metric}"
+        return sum(bucket.sketches[key].estimate(entity_id)
+                   for bucket in self._query_buckets(days, until) if key in bucket.sketches)
+
+    def totals(self, days=7, until=None):
+        buckets = self._query_buckets(days, until)
+        return sum(b.kills for b in buckets), sum(b.isk for b in buckets)
+
+    def _path(self, day):
+        return os.path.join(self.stats_dir, f"{day}.stats")
+
+    def load(self):
+        """读取保留期内的全部日期桶"""
+        self._loaded = True
+        if not os.path.isdir(self.stats_dir):
+            return
+        start = time.perf_counter()
+        for name in os.listdir(self.stats_dir):
+            if not name.endswith(".stats"):
+                continue
+            try:
+                with open(os.path.join(self.stats_dir, name), "rb") as f:
+                    bucket = StatsBucket.load(marshal.load(f))
+                self.buckets.setdefault(bucket.day, bucket)
+            except Exception as e:
+                logger.warning(f"读取统计文件 {name} 失败: {e}")
+        self.expire()
+        logger.info(f"已加载 {len(self.buckets)} 天的统计数据, 耗时 {(time.perf_counter() - start) * 1000:.0f}ms")
+
+    def expire(self):
+        """丢弃超过保留期的日期桶"""
+        cutoff = int((datetime.now(timezone.utc) - timedelta(days=self.retention_days)).strftime('%Y%m%d'))
+        for day in [d for d in self.buckets if d < cutoff]:
+            del self.buckets[day]
+            try:
+                os.remove(self._path(day))
+            except OSError:
+                pass
+
+    def snapshot(self):
+        """
+        清理过期桶，并把有变化的日期桶序列化为 [(日期, 数据), ...]。
+        必须在调用 record() 的线程 (事件循环) 中执行，写入磁盘由 write() 在其他线程完成。
+        """
+        self.expire()
+        snapshots = []
+        for bucket in self.buckets.values():
+            if bucket.dirty:
+                snapshots.append((bucket.day, marshal.dumps(bucket.dump())))
+                bucket.dirty = False
+        return snapshots
+
+    def write(self, snapshots):
+        """写入 snapshot() 的结果，只访问传入的数据，可在线程中执行"""
+        if not snapshots:
+            return
+        os.makedirs(self.stats_dir, exist_ok=True)
+        for day, data in snapshots:
+            path = self._path(day)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+    def flush(self):
+        """把有变化的日期桶写入磁盘"""
+        self.write(self.snapshot())
+
+    async def flush_forever(self, interval=60):
+        while True:
+            await asyncio.sleep(interval)
+            snapshots = self.snapshot()
+            try:
+                await asyncio.to_thread(self.write, snapshots)
+            except Exception as e:
+                logger.error(f"保存统计数据失败: {e}")
+                # 下次重新写入
+                for day, _ in snapshots:
+                    bucket = self.buckets.get(day)
+                    if bucket is not None:
+                        bucket.dirty = True
+
+if __name__ == '__main__':
+    # 用法: python stats.py <维度> [kills|isk] [天数] [星域ID]
+    from include import STATS_DIR
+    dimension = sys.argv[1] if len(sys.argv) > 1 else 'killer_alliance'
+    metric = sys.argv[2] if len(sys.argv) > 2 else 'kills'
+    days = int(sys.argv[3]) if len(sys.argv) > 3 else 7
+    region_id = int(sys.argv[4]) if len(sys.argv) > 4 else None
+    engine = StatsEngine(STATS_DIR)
+    kills, isk = engine.totals(days)
+    print(f"最近{days}天: {kills} 个击杀, {isk:,.0f} ISK")
+    for entity_id, value in engine.top(dimension, metric, days, 20, region_id):
+        print(f"{entity_id:>12} {value:>20,.0f}")
@@ -0,0 +1,47 @@
+import asyncio
+
+from ingest import KillIngestor, KillSource
+from models import Killmail, Zkb
+
+
+class ListSource(KillSource):
+    """依次交出给定的击杀ID"""
+
+    def __init__(self, name, kill_ids):
+        self.name = name
+        self.kill_ids = kill_ids
+
+    async def run(self, emit):
+        for kill_id in self.kill_ids:
+            await emit(Killmail.from_esi({'killmail_id': kill_id}), Zkb.from_dict({'hash': 'abc'}), self.name)
+
+
+async def received(ingestor, count):
+    ingestor.start()
+    try:
+        return [(await ingestor.get())[0].killmail_id for _ in range(count)]
+    finally:
+        await ingestor.stop()
+
+
+def test_duplicates_across_sources_are_dropped():
+    ingestor = KillIngestor([ListSource("a", [1, 2, 3]), ListSource("b", [2, 3, 4])])
+    assert sorted(asyncio.run(received(ingestor, 4))) == [1, 2, 3, 4]
+    assert ingestor.duplicates == 2
+    assert ingestor.qsize() == 0
+
+
+def test_dedup_memory_is_bounded():
+    ingestor = KillIngestor([ListSource("a", [1, 2, 3, 1])], dedup_size=2)
+    assert asyncio.run(received(ingestor, 4)) == [1, 2, 3, 1]
+    assert len(ingestor._seen) == 2
+
+
+def test_reorder_window_sorts_by_killmail_id():
+    ingestor = KillIngestor([ListSource("a", [5, 3, 4]), ListSource("b", [1, 2])], reorder_window=0.05)
+    assert asyncio.run(received(ingestor, 5)) == [1, 2, 3, 4, 5]
+
+
+def test_without_reorder_window_arrival_order_is_kept():
+    ingestor = KillIngestor([ListSource("a", [5, 3, 4])])
+    assert asyncio.run(received(ingestor, 3)) == [5, 3, 4]
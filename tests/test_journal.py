@@ -0,0 +1,68 @@
+from journal import KillJournal, RECEIVED, ENRICHED, RENDERED, DELIVERED, FAILED
+from models import Killmail, Zkb
+
+
+def kill(killmail_id):
+    return Killmail.from_esi({'killmail_id': killmail_id}), Zkb.from_dict({'hash': 'abc'})
+
+
+def test_record_rejects_duplicates(tmp_path):
+    journal = KillJournal(tmp_path / "journal.db")
+    assert journal.record(*kill(1))
+    assert not journal.record(*kill(1))
+    journal.close()
+
+    journal = KillJournal(tmp_path / "journal.db")
+    assert 1 in journal
+    assert not journal.record(*kill(1))
+    journal.close()
+
+
+def test_state_only_moves_forward(tmp_path):
+    journal = KillJournal(tmp_path / "journal.db")
+    journal.record(*kill(1))
+    journal.advance(1, RENDERED)
+    journal.advance(1, ENRICHED)
+    assert journal.state(1) == RENDERED
+
+    journal.advance(1, DELIVERED)
+    journal.advance(1, FAILED)
+    assert journal.state(1) == DELIVERED
+    journal.close()
+
+    journal = KillJournal(tmp_path / "journal.db")
+    assert journal.state(1) == DELIVERED
+    journal.close()
+
+
+def test_pending_returns_unfinished_kills_in_order(tmp_path):
+    journal = KillJournal(tmp_path / "journal.db")
+    for killmail_id in (3, 1, 2):
+        journal.record(*kill(killmail_id))
+    journal.advance(2, ENRICHED)
+    journal.advance(3, DELIVERED)
+    journal.close()
+
+    journal = KillJournal(tmp_path / "journal.db")
+    pending = journal.pending()
+    assert [(k.killmail_id, state) for k, _, state in pending] == [(1, RECEIVED), (2, ENRICHED)]
+    assert pending[0][1].hash == 'abc'
+    journal.close()
+
+
+def test_gives_up_after_max_attempts(tmp_path):
+    path = tmp_path / "journal.db"
+    journal = KillJournal(path, max_attempts=2)
+    journal.record(*kill(1))
+    journal.close()
+
+    # 每次重启都恢复但没有完成 (如处理时进程崩溃)
+    for _ in range(2):
+        journal = KillJournal(path, max_attempts=2)
+        assert [k.killmail_id for k, _, _ in journal.pending()] == [1]
+        journal.close()
+
+    journal = KillJournal(path, max_attempts=2)
+    assert journal.pending() == []
+    assert journal.state(1) == FAILED
+    journal.close()
@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+from scheduler import RequestScheduler, RequestShed, PRIORITY_KILLMAIL, PRIORITY_NAMES, PRIORITY_IMAGES, PRIORITY_PORTRAITS
+
+ESI_URL = "https://esi.evetech.net/latest/killmails/1/abc/"
+IMAGE_URL = "https://images.evetech.net/types/587/icon?size=64"
+
+
+def budget(remain, reset=60):
+    return {'X-ESI-Error-Limit-Remain': str(remain), 'X-ESI-Error-Limit-Reset': str(reset)}
+
+
+def admitted(scheduler, url, priority):
+    try:
+        asyncio.run(scheduler.acquire(url, priority))
+        return True
+    except RequestShed:
+        return False
+
+
+def test_low_budget_sheds_images_and_portraits():
+    scheduler = RequestScheduler(error_budget_low=40, error_budget_critical=10)
+    scheduler.record_response(ESI_URL, 200, budget(30))
+    assert not admitted(scheduler, ESI_URL, PRIORITY_IMAGES)
+    assert not admitted(scheduler, ESI_URL, PRIORITY_PORTRAITS)
+    assert admitted(scheduler, ESI_URL, PRIORITY_NAMES)
+    assert admitted(scheduler, ESI_URL, PRIORITY_KILLMAIL)
+    assert scheduler.stats()['shed']['images'] == 1
+
+
+def test_critical_budget_sheds_everything_but_killmails():
+    scheduler = RequestScheduler(error_budget_low=40, error_budget_critical=10)
+    scheduler.record_response(ESI_URL, 200, budget(5))
+    assert not admitted(scheduler, ESI_URL, PRIORITY_NAMES)
+    with pytest.raises(RequestShed):
+        asyncio.run(scheduler.acquire(ESI_URL, PRIORITY_IMAGES))
+
+
+def test_budget_is_tracked_per_host():
+    scheduler = RequestScheduler()
+    scheduler.record_response(ESI_URL, 200, budget(5))
+    assert admitted(scheduler, IMAGE_URL, PRIORITY_IMAGES)
+    assert scheduler.stats()['error_remain'] == {'esi.evetech.net': 5}
+
+
+def test_budget_no_longer_applies_after_reset():
+    scheduler = RequestScheduler()
+    scheduler.record_response(ESI_URL, 200, budget(5, reset=0))
+    assert admitted(scheduler, ESI_URL, PRIORITY_IMAGES)
+
+
+def test_error_limited_response_sheds_low_priority():
+    scheduler = RequestScheduler()
+    scheduler.record_response(ESI_URL, 420, {'Retry-After': '30'})
+    assert not admitted(scheduler, ESI_URL, PRIORITY_IMAGES)
@@ -0,0 +1,58 @@
+from datetime import datetime, timezone
+
+from models import Killmail, Zkb
+from stats import StatsEngine
+
+
+def kill(killmail_id, system_id, attackers, value):
+    killmail = Killmail.from_esi({
+        'killmail_id': killmail_id,
+        'killmail_time': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'solar_system_id': system_id,
+        'victim': {'character_id': 90000001, 'corporation_id': 98000001, 'ship_type_id': 587},
+        'attackers': attackers,
+    })
+    return killmail, Zkb.from_dict({'hash': 'abc', 'totalValue': value})
+
+
+KILLS = [
+    kill(1, 30000142, [{'character_id': 91000001, 'alliance_id': 99000001, 'ship_type_id': 24690, 'final_blow': True},
+                       {'character_id': 91000002, 'alliance_id': 99000001, 'ship_type_id': 24690}], 1e9),
+    kill(2, 30000142, [{'character_id': 91000002, 'alliance_id': 99000002, 'ship_type_id': 17740, 'final_blow': True}], 5e8),
+    kill(3, 30002187, [{'character_id': 91000001, 'alliance_id': 99000001, 'ship_type_id': 24690, 'final_blow': True}], 2e8),
+]
+
+
+def recorded(stats_dir):
+    engine = StatsEngine(stats_dir, region_of=lambda system_id: 10000002)
+    for killmail, zkb in KILLS:
+        engine.record(killmail, zkb)
+    return engine
+
+
+def test_flush_and_load_round_trip(tmp_path):
+    engine = recorded(tmp_path)
+    engine.flush()
+
+    loaded = StatsEngine(tmp_path)
+    assert loaded.totals(1) == engine.totals(1) == (3, 1.7e9)
+    for dimension in ('killer_alliance', 'killer_ship', 'final_blow', 'system', 'ship_lost'):
+        assert loaded.top(dimension, 'kills', 1) == engine.top(dimension, 'kills', 1)
+        assert loaded.top(dimension, 'isk', 1) == engine.top(dimension, 'isk', 1)
+    assert loaded.top('killer_alliance', 'kills', 1)[0] == (99000001, 2)
+    assert loaded.top('killer_character', 'kills', 1, region_id=10000002)[0] == (91000001, 2)
+    assert loaded.estimate('system', 30000142, 'isk', 1) >= 1.5e9
+
+
+def test_snapshot_keeps_later_records(tmp_path):
+    engine = recorded(tmp_path)
+    snapshots = engine.snapshot()
+    assert len(snapshots) == 1
+    assert engine.snapshot() == []
+
+    # 快照之后、写入完成之前的新击杀不能丢失
+    killmail, zkb = kill(4, 30000142, [{'character_id': 91000003}], 1e8)
+    engine.record(killmail, zkb)
+    engine.write(snapshots)
+    engine.flush()
+    assert StatsEngine(tmp_path).totals(1) == (4, 1.8e9)
@@ -0,0 +1,169 @@
+from collections import OrderedDict
+
+from PIL import Image, ImageDraw, ImageFont
+
+
+def real_font(font):
+    """include.LazyFont -> 已加载的 FreeTypeFont"""
+    return font.load() if hasattr(font, "load") else font
+
+
+def font_key(font):
+    return (getattr(font, "path", None) or id(font), getattr(font, "size", 0))
+
+
+class BoundedCache(OrderedDict):
+    """最多保留 maxsize 项的字典，超出时淘汰最久未使用的"""
+
+    def __init__(self, maxsize):
+        super().__init__()
+        self.maxsize = maxsize
+
+    def get(self, key, default=None):
+        if key not in self:
+            return default
+        self.move_to_end(key)
+        return self[key]
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        if len(self) > self.maxsize:
+            self.popitem(last=False)
+
+
+class TextCache:
+    """
+    文字位图缓存: 同一字体/字号/字符串只光栅化一次，绘制时按颜色把缓存的灰度位图贴到画布上。
+    位图与颜色无关，所以缓存键不含颜色，同一舰船名用不同颜色绘制时共用一份。
+    总像素数超过 max_bytes 时淘汰最久未使用的位图；宽度、切分和字形覆盖结果各自最多保留 max_entries 项。
+    主字体缺少的字符 (如 OPPOSans 中的生僻字) 按 fallback_paths 依次换用后备字体，基线对齐。
+    """
+
+    def __init__(self, fallback_paths=(), max_bytes=16 * 1024 * 1024, max_entries=65536):
+        self.fallback_paths = list(fallback_paths)
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._masks = OrderedDict()   # (字体, 字符串) -> (灰度位图, dx, dy)
+        self._lengths = BoundedCache(max_entries)   # (字体, 字符串) -> 宽度
+        self._runs = BoundedCache(max_entries)      # (字体, 字符串) -> [(字体, 片段), ...]
+        self._fonts = {}              # (路径, 字号) -> 后备字体
+        self._notdef = {}             # 字体 -> 缺字时显示的方框位图
+        self._coverage = BoundedCache(max_entries)  # (字体, 字符) -> 是否有该字形
+
+    def draw(self, image):
+        """返回带缓存的 ImageDraw，用法与 ImageDraw.Draw(image) 相同"""
+        return CachedDraw(image, self)
+
+    # ---------- 字体回退 ----------
+
+    def _fallback(self, path, size):
+        key = (path, size)
+        font = self._fonts.get(key)
+        if font is None:
+            font = self._fonts[key] = ImageFont.truetype(path, size)
+        return font
+
+    def covers(self, font, char):
+        """字体是否包含该字符: 渲染结果与缺字方框相同时视为缺字"""
+        if char.isspace():
+            return True
+        key = (font_key(font), char)
+        covered = self._coverage.get(key)
+        if covered is None:
+            font = real_font(font)
+            notdef = self._notdef.get(font_key(font))
+            if notdef is None:
+                mask = font.getmask("\U0010FFFF")
+                notdef = self._notdef[font_key(font)] = (mask.size, bytes(mask))
+            mask = font.getmask(char)
+            covered = self._coverage[key] = (mask.size, bytes(mask)) != notdef
+        return covered
+
+    def runs(self, font, text):
+        """按字符是否被主字体覆盖切分为 [(字体, 片段), ...]"""
+        key = (font_key(font), text)
+        runs = self._runs.get(key)
+        if runs is not None:
+            return runs
+        runs = []
+        primary_path = getattr(font, "path", None)
+        fallbacks = [path for path in self.fallback_paths if path != primary_path]
+        for char in text:
+            use = font
+            if fallbacks and not self.covers(font, char):
+                for path in fallbacks:
+                    candidate = self._fallback(path, font.size)
+                    if self.covers(candidate, char):
+                        use = candidate
+                        break
+            if runs and runs[-1][0] is use:
+                runs[-1][1].append(char)
+            else:
+                runs.append((use, [char]))
+        runs = self._runs[key] = [(f, "".join(chars)) for f, chars in runs]
+        return runs
+
+    # ---------- 位图与宽度 ----------
+
+    def length(self, font, text):
+        key = (font_key(font), text)
+        length = self._lengths.get(key)
+        if length is None:
+            length = self._lengths[key] = sum(real_font(f).getlength(run) for f, run in self.runs(font, text))
+        return length
+
+    def mask(self, font, text):
+        """单一字体片段的位图，(dx, dy) 为位图左上角相对基线起点的偏移"""
+        key = (font_key(font), text)
+        entry = self._masks.get(key)
+        if entry is not None:
+            self._masks.move_to_end(key)
+            self.hits += 1
+            return entry
+        self.misses += 1
+        font = real_font(font)
+        left, top, right, bottom = font.getbbox(text, anchor="ls")
+        mask = Image.new("L", (max(1, right - left), max(1, bottom - top)), 0)
+        ImageDraw.Draw(mask).text((-left, -top), text, font=font, fill=255, anchor="ls")
+        entry = (mask, left, top)
+        self._masks[key] = entry
+        self.bytes += mask.size[0] * mask.size[1]
+        while self.bytes > self.max_bytes and len(self._masks) > 1:
+            _, (old, _, _) = self._masks.popitem(last=False)
+            self.bytes -= old.size[0] * old.size[1]
+        return entry
+
+    def paste(self, image, xy, text, font, fill):
+        """在 xy (与 ImageDraw.text 默认锚点相同，即主字体的上沿) 绘制文字"""
+        x, y = xy
+        baseline = y + real_font(font).getmetrics()[0]
+        for run_font, run in self.runs(font, text):
+            if not run.isspace():
+                mask, dx, dy = self.mask(run_font, run)
+                image.paste(fill, (int(round(x + dx)), int(round(baseline + dy))), mask)
+            x += self.length(run_font, run)
+
+
+class CachedDraw:
+    """ImageDraw 的包装: text/textlength 走缓存，其余方法 (rectangle、ellipse 等) 原样转发"""
+
+    def __init__(self, image, cache):
+        self._image = image
+        self._draw = ImageDraw.Draw(image)
+        self._cache = cache
+
+    def text(self, xy, text, fill=None, font=None, **kwargs):
+        text = str(text)
+        if font is None or kwargs or "\n" in text or not text:
+            return self._draw.text(xy, text, fill=fill, font=font, **kwargs)
+        self._cache.paste(self._image, xy, text, font, fill if fill is not None else "white")
+
+    def textlength(self, text, font=None, **kwargs):
+        if font is None or kwargs:
+            return self._draw.textlength(text, font=font, **kwargs)
+        return self._cache.length(font, str(text))
+
+    def __getattr__(self, name):
+        return getattr(self._draw, name)
@@ -0,0 +1,102 @@
+import math
+import sqlite3
+import logging
+
+logger = logging.getLogger("eve_monitor")
+
+LIGHT_YEAR = 9460000000000000  # 米
+
+
+class SystemLookupError(LookupError):
+    """星系名称找不到或对应多个星系"""
+
+
+class SolarSystem:
+    """zh_name 目前与英文名相同 (没有中文名数据)，保留给显示 "中文名(英文名)" 的调用方"""
+    __slots__ = ('system_id', 'name', 'zh_name', 'region_id', 'constellation_id', 'x', 'y', 'z', 'security')
+
+    def __init__(self, system_id, name, zh_name, region_id, constellation_id, x, y, z, security):
+        self.system_id = system_id
+        self.name = name
+        self.zh_name = zh_name
+        self.region_id = region_id
+        self.constellation_id = constellation_id
+        self.x = x
+        self.y = y
+        self.z = z
+        self.security = security
+
+    def distance_ly(self, other):
+        return math.sqrt((self.x - other.x) ** 2 + (self.y - other.y) ** 2 + (self.z - other.z) ** 2) / LIGHT_YEAR
+
+
+class SystemIndex:
+    """
+    常驻内存的星系索引: 一次读入 mapSolarSystems.db，之后按名称/ID查找不再打开数据库。
+    名称只做完整匹配 (不区分大小写)，不猜测前缀，避免把 "Ladi" 当成其他星系算路线。
+    """
+
+    def __init__(self, db_path="mapSolarSystems.db"):
+        self.db_path = db_path
+        self.systems = {}
+        self._by_name = {}  # 小写英文名 -> [星系, ...]
+        self._loaded = False
+
+    def load(self):
+        if self._loaded:
+            return self
+        connection = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+        try:
+            rows = connection.execute('''
+            SELECT solarSystemID, solarSystemName, regionID, constellationID, x, y, z, security
+            FROM mapSolarSystems ORDER BY solarSystemID
+            ''').fetchall()
+        finally:
+            connection.close()
+
+        for system_id, name, region_id, constellation_id, x, y, z, security in rows:
+            system = SolarSystem(system_id, name, name, region_id, constellation_id, x, y, z, security)
+            self.systems[system_id] = system
+            self._by_name.setdefault(name.lower(), []).append(system)
+        self._loaded = True
+        logger.info(f"星系索引已加载: {len(self.systems)}个星系")
+        return self
+
+    def get(self, system_id):
+        self.load()
+        return self.systems.get(int(system_id))
+
+    def resolve(self, name):
+        """按英文名 (完整匹配，不区分大小写) 或星系ID查找，找不到或不唯一时抛出 SystemLookupError"""
+        self.load()
+        name = str(name).strip()
+        if name.isdigit() and int(name) in self.systems:
+            return self.systems[int(name)]
+        matches = self._by_name.get(name.lower()) if name else None
+        if not matches:
+            raise SystemLookupError(f"未找到星系: {name}")
+        if len(matches) > 1:
+            raise SystemLookupError(f"星系名称不唯一: {name} ({', '.join(str(s.system_id) for s in matches)})")
+        return matches[0]
+
+    def lookup(self, name):
+        """同 resolve()，找不到或不唯一时返回 None"""
+        try:
+            return self.resolve(name)
+        except SystemLookupError:
+            return None
+
+    def __len__(self):
+        self.load()
+        return len(self.systems)
+
+
+_default_index = None
+
+
+def default_index():
+    """进程内共用的星系索引，首次查找时加载"""
+    global _default_index
+    if _default_index is None:
+        _default_index = SystemIndex()
+    return _default_index
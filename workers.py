@@ -0,0 +1,209 @@
+import time
+import queue
+import asyncio
+import logging
+import multiprocessing
+from abc import ABC, abstractmethod
+
+from journal import FAILED
+
+logger = logging.getLogger("eve_monitor")
+
+# 队列中的结束标记
+STOP = None
+
+
+def shard_of(killmail_id, shard_count):
+    """按击杀ID分片，同一击杀总是交给同一个工作进程"""
+    return killmail_id % shard_count
+
+
+class WorkQueue(ABC):
+    """
+    协调器与工作进程之间的任务队列接口，任务为 (killmail, zkb, 接收时间)。
+    put/get 均为协程，实现可以是进程内队列、本机IPC，或跨机器的消息队列。
+    """
+
+    @abstractmethod
+    async def put(self, job):
+        """放入任务，队列满时等待"""
+
+    @abstractmethod
+    async def get(self):
+        """取出下一个任务，队列关闭后返回 STOP"""
+
+    def qsize(self):
+        return 0
+
+    def close(self):
+        pass
+
+
+class LocalQueue(WorkQueue):
+    """进程内队列，协调器和工作者运行在同一个事件循环中 (单进程调试/测试用)"""
+
+    def __init__(self, maxsize=0):
+        self.queue = asyncio.Queue(maxsize)
+
+    async def put(self, job):
+        await self.queue.put(job)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def qsize(self):
+        return self.queue.qsize()
+
+    def close(self):
+        self.queue.put_nowait(STOP)
+
+
+class ProcessQueue(WorkQueue):
+    """基于 multiprocessing.Queue 的本机IPC队列，击杀模型通过 pickle 传递"""
+
+    def __init__(self, maxsize=0, context=None):
+        self.queue = (context or multiprocessing).Queue(maxsize)
+
+    async def put(self, job):
+        try:
+            self.queue.put_nowait(job)
+        except queue.Full:
+            # 工作进程积压时阻塞协调器，而不是无限堆积
+            await asyncio.to_thread(self.queue.put, job)
+
+    async def get(self):
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            return await asyncio.to_thread(self.queue.get)
+
+    def qsize(self):
+        try:
+            return self.queue.qsize()
+        except NotImplementedError:  # macOS 不支持
+            return 0
+
+    def close(self):
+        # 在事件循环中调用，不能阻塞；队列满时工作进程由 stop_worker_processes 超时后终止
+        try:
+            self.queue.put_nowait(STOP)
+        except queue.Full:
+            logger.warning("工作队列已满，无法发送结束标记，工作进程将在超时后被终止")
+
+
+def notify_observers(observers, killmail, zkb):
+    """依次调用击杀观察者，单个观察者出错不影响其他观察者和后续处理"""
+    for observer in observers:
+        try:
+            observer(killmail, zkb)
+        except Exception as e:
+            logger.error(f"处理击杀 {killmail.killmail_id} 的观察者出错: {e}")
+
+
+class Coordinator:
+    """
+    从接收端取出击杀，按击杀ID分发到各工作队列；协调器本身不做丰富和渲染。
+    observers 为分发前对每个击杀调用的 observer(killmail, zkb)，如统计。
+    complete 为协程 complete(killmail, zkb)，返回包含完整内容的击杀 (只有killID时从ESI获取)，
+    失败返回 None；最多 concurrency 个同时进行，观察者和工作进程都拿到完整击杀。
+    journal 为处理日志 (KillJournal)，已记录过的击杀不再分发。
+    """
+
+    def __init__(self, ingestor, queues, observers=(), journal=None, complete=None, concurrency=8):
+        self.ingestor = ingestor
+        self.queues = queues
+        self.observers = list(observers)
+        self.journal = journal
+        self.complete = complete
+        self.concurrency = concurrency
+        self.dispatched = [0] * len(queues)
+        self._slots = asyncio.Semaphore(concurrency)
+        self._tasks = set()
+
+    async def run(self):
+        while True:
+            killmail, zkb, received_at = await self.ingestor.get()
+            if self.journal is not None and not self.journal.record(killmail, zkb):
+                logger.info(f"击杀 {killmail.killmail_id} 已处理过，跳过")
+                continue
+            await self.submit(killmail, zkb, received_at)
+
+    async def submit(self, killmail, zkb, received_at=None):
+        """获取完整击杀后交给观察者和工作进程；新击杀和处理日志中未完成的击杀共用"""
+        if self.complete is None:
+            await self.deliver(killmail, zkb, received_at)
+            return
+        # 获取完整击杀可以并行，分发到工作队列的背压同样计入并发上限
+        await self._slots.acquire()
+        task = asyncio.create_task(self._complete_and_deliver(self._slots, killmail, zkb, received_at))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _complete_and_deliver(self, slots, killmail, zkb, received_at):
+        try:
+            full = await self.complete(killmail, zkb)
+            if full is None:
+                logger.error(f"无法获取击杀 {killmail.killmail_id} 的完整内容，跳过")
+                if self.journal is not None:
+                    self.journal.advance(killmail.killmail_id, FAILED)
+                return
+            await self.deliver(full, zkb, received_at)
+        except Exception as e:
+            logger.exception(f"分发击杀 {killmail.killmail_id} 时出错: {e}")
+        finally:
+            slots.release()
+
+    async def deliver(self, killmail, zkb, received_at=None):
+        notify_observers(self.observers, killmail, zkb)
+        await self.dispatch(killmail, zkb, received_at)
+
+    async def dispatch(self, killmail, zkb, received_at=None):
+        shard = shard_of(killmail.killmail_id, len(self.queues))
+        await self.queues[shard].put((killmail, zkb, received_at))
+        self.dispatched[shard] += 1
+        logger.info(f"击杀 {killmail.killmail_id} 分发到工作进程 {shard}，"
+                    f"接收积压: {self.ingestor.qsize()}, 工作积压: {self.queues[shard].qsize()}")
+
+    def close(self):
+        for task in self._tasks:
+            task.cancel()
+        for work_queue in self.queues:
+            work_queue.close()
+
+
+async def run_worker(work_queue, handle, name="worker"):
+    """工作循环：逐个处理队列中的击杀，单个击杀出错不影响后续击杀"""
+    logger.info(f"{name} 已启动")
+    while True:
+        job = await work_queue.get()
+        if job is STOP:
+            break
+        killmail, zkb, received_at = job
+        try:
+            await handle(killmail, zkb, received_at)
+        except Exception as e:
+            logger.exception(f"{name} 处理击杀 {killmail.killmail_id} 时出错: {e}")
+    logger.info(f"{name} 已退出")
+
+
+def start_worker_processes(target, count, maxsize=0):
+    """
+    启动 count 个工作进程，target(shard, shard_count, work_queue) 为进程入口。
+    使用 spawn 启动，工作进程不继承协调器的事件循环、会话和数据库连接。
+    """
+    context = multiprocessing.get_context("spawn")
+    queues = [ProcessQueue(maxsize, context) for _ in range(count)]
+    processes = []
+    for shard, work_queue in enumerate(queues):
+        process = context.Process(target=target, args=(shard, count, work_queue), name=f"worker-{shard}", daemon=True)
+        process.start()
+        processes.append(process)
+    return queues, processes
+
+
+def stop_worker_processes(processes, timeout=10):
+    deadline = time.monotonic() + timeout
+    for process in processes:
+        process.join(max(0, deadline - time.monotonic()))
+        if process.is_alive():
+            process.terminate()